@@ -0,0 +1,7 @@
+"""Allow `python -m fabulist`."""
+
+import sys
+
+from .cli import run
+
+sys.exit(run())
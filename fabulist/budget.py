@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+(c) 2017 Martin Wendt; see https://github.com/mar10/fabulist
+Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
+
+Limit the memory that is used by loaded word lists and lorem dialects.
+
+Word lists and dialects are loaded on first use and normally kept for the
+lifetime of the process. With a :class:`MemoryBudget`, the least recently used
+ones are unloaded when the total size exceeds the budget. They are loaded
+again on their next use, from a snapshot if a snapshot folder is configured
+(see :mod:`fabulist.snapshot`).
+
+Examples:
+    Keep about 50 MB of word lists and dialects in memory::
+
+        fab = Fabulist(memory_budget=50_000_000, snapshot_dir="/var/cache/fabulist")
+        ...
+        print(fab.budget.info())
+"""
+
+import logging
+import sys
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import NamedTuple, Union
+
+from .fabulist import OverlayWordList, _WordList
+from .lorem_ipsum import LoremDialect
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+TResource = Union[_WordList, LoremDialect]
+
+
+def get_deep_size(obj: TResource) -> int:
+    """Return the approximate memory size of a word list or dialect in bytes.
+
+    Containers, strings, and nested word lists are followed; other objects are
+    counted with their shallow size. Objects that are referenced repeatedly
+    (e.g. interned strings) are counted once.
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif isinstance(item, (_WordList, LoremDialect)):
+            stack.append(vars(item))
+    return size
+
+
+class BudgetInfo(NamedTuple):
+    """Statistics of a :class:`MemoryBudget`, see :meth:`MemoryBudget.info`."""
+
+    #: The budget in bytes
+    max_size: int
+    #: Approximate size of the loaded word lists and dialects in bytes
+    size: int
+    #: Number of loaded word lists and dialects
+    loaded: int
+    #: Number of unloaded word lists and dialects
+    evictions: int
+    #: Number of word lists and dialects that were loaded again after eviction
+    reloads: int
+
+
+class MemoryBudget:
+    """Unload least recently used word lists and dialects to stay within a budget.
+
+    :class:`~fabulist.fabulist.Fabulist` calls :meth:`touch` with the
+    resources that are used by each call. New resources are measured (see
+    :func:`get_deep_size`) when they are touched after loading, so the
+    budget may be exceeded by the resources of the current call.
+    Templates that are compiled and rendered by the caller (see
+    :meth:`Fabulist.compile`) do not touch their word lists.
+
+    Resources that cannot be loaded again are kept and do not count as
+    evictions, e.g. lists with supplemental or modified entries
+    (see :meth:`_WordList.unload`).
+
+    Args:
+        max_size (int): The budget in bytes.
+    Attributes:
+        max_size (int): The budget in bytes.
+        size (int): Approximate size of the loaded resources in bytes.
+        evictions (int): Number of unloaded resources.
+        reloads (int): Number of resources that were loaded again after they
+            were evicted.
+    """
+
+    def __init__(self, max_size: int):
+        if max_size <= 0:
+            raise ValueError(f"Invalid memory budget: {max_size}")
+        self.max_size: int = max_size
+        self.size: int = 0
+        self.evictions: int = 0
+        self.reloads: int = 0
+        # Loaded resources in LRU order: { resource: size }
+        self._loaded: OrderedDict[TResource, int] = OrderedDict()
+        # Resources that were touched, but not loaded yet
+        self._pending: set[TResource] = set()
+        # Resources that were unloaded by us
+        self._evicted: set[TResource] = set()
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.size:,}/{self.max_size:,} bytes, "
+            f"loaded={len(self._loaded)}, evictions={self.evictions})"
+        )
+
+    def info(self) -> BudgetInfo:
+        """Return current statistics."""
+        self._update()
+        return BudgetInfo(
+            self.max_size, self.size, len(self._loaded), self.evictions, self.reloads
+        )
+
+    def touch(self, resources: Iterable[TResource]) -> None:
+        """Mark word lists or dialects as used, and unload others if necessary.
+
+        Args:
+            resources (iterable): :class:`_WordList` or
+                :class:`~fabulist.lorem_ipsum.LoremDialect` instances.
+        """
+        loaded = self._loaded
+        used = []
+        for res in resources:
+            if isinstance(res, OverlayWordList):
+                res = res.base
+            used.append(res)
+            if res in loaded:
+                loaded.move_to_end(res)
+            else:
+                self._pending.add(res)
+        self._update()
+        if self.size > self.max_size:
+            self._evict(used)
+
+    def discard(self, res: TResource) -> None:
+        """Forget a word list or dialect that is no longer used, e.g. a list
+        that was replaced (see :meth:`Fabulist.replace_list`).
+
+        The resource is not unloaded, but no longer counts toward :attr:`size`
+        and is not referenced by the budget.
+        """
+        size = self._loaded.pop(res, None)
+        if size is not None:
+            self.size -= size
+        self._pending.discard(res)
+        self._evicted.discard(res)
+
+    def _update(self) -> None:
+        """Measure pending resources that were loaded in the meantime."""
+        for res in [res for res in self._pending if res.is_loaded()]:
+            self._pending.discard(res)
+            size = self._loaded[res] = get_deep_size(res)
+            self.size += size
+            if res in self._evicted:
+                self._evicted.discard(res)
+                self.reloads += 1
+        # Resources may also have been unloaded by somebody else
+        for res in [res for res in self._loaded if not res.is_loaded()]:
+            self.size -= self._loaded.pop(res)
+            self._pending.add(res)
+
+    def _evict(self, keep: Iterable[TResource]) -> None:
+        keep = set(keep)
+        for res in list(self._loaded):
+            if self.size <= self.max_size:
+                break
+            if res in keep:
+                continue
+            name = repr(res)
+            if not res.unload():
+                continue
+            size = self._loaded.pop(res)
+            self.size -= size
+            self.evictions += 1
+            self._evicted.add(res)
+            self._pending.add(res)
+            _logger.info(f"Unloaded {name} ({size:,} bytes), now {self}")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+(c) 2017 Martin Wendt; see https://github.com/mar10/fabulist
+Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
+
+Command line interface.
+
+Examples:
+    fabulist snapshot --folder ~/.cache/fabulist
+    fabulist store /var/cache/fabulist/words.store
+"""
+# ruff: noqa: T201 (`print` found)
+
+import argparse
+import logging
+import sys
+import time
+from typing import Optional
+
+from . import __version__, snapshot
+from .fabulist import Fabulist
+
+
+def _snapshot_command(args: argparse.Namespace) -> int:
+    snapshot_dir = snapshot.get_snapshot_dir(args.folder)
+    if not snapshot_dir:
+        print(
+            "Pass --folder or set the "
+            f"{snapshot.SNAPSHOT_DIR_ENV} environment variable.",
+            file=sys.stderr,
+        )
+        return 2
+    start = time.perf_counter()
+    # Loading writes missing or stale snapshots
+    fab = Fabulist(snapshot_dir=snapshot_dir)
+    fab.load()
+    for dialect in fab.lorem.dialect_map.values():
+        dialect.load()
+    print(
+        f"Snapshots in {snapshot_dir} are up-to-date "
+        f"({time.perf_counter() - start:.2f} sec)."
+    )
+    return 0
+
+
+def _store_command(args: argparse.Namespace) -> int:
+    from .store import build_store
+
+    start = time.perf_counter()
+    build_store(Fabulist(), args.output)
+    print(f"Wrote {args.output} ({time.perf_counter() - start:.2f} sec).")
+    return 0
+
+
+def run(argv: Optional[list[str]] = None) -> int:
+    """Parse command line arguments and run the command."""
+    parser = argparse.ArgumentParser(
+        prog="fabulist", description="Generate random strings that make sense."
+    )
+    parser.add_argument("--version", action="version", version=__version__)
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log snapshot activity"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sp = subparsers.add_parser(
+        "snapshot",
+        help="create or update binary snapshots of the word lists and lorem dialects",
+    )
+    sp.add_argument(
+        "--folder",
+        help=f"snapshot folder (default: ${snapshot.SNAPSHOT_DIR_ENV})",
+    )
+    sp.set_defaults(func=_snapshot_command)
+
+    sp = subparsers.add_parser(
+        "store",
+        help="write a memory-mapped store file that can be shared by processes",
+    )
+    sp.add_argument("output", help="path of the store file")
+    sp.set_defaults(func=_store_command)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(message)s",
+    )
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(run())
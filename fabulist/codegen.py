@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+(c) 2017 Martin Wendt; see https://github.com/mar10/fabulist
+Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
+
+Code-generation engine for compiled templates.
+
+Used by :class:`fabulist.fabulist.Fabulist` when created with `engine="codegen"`.
+"""
+
+import logging
+import random
+from typing import Callable, Optional
+
+from .fabulist import (
+    CompiledTemplate,
+    _ChoicePart,
+    _NumberPart,
+    _RefPart,
+    _WordList,
+    _WordPart,
+)
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+
+# ------------------------------------------------------------------------------
+# CodegenTemplate
+# ------------------------------------------------------------------------------
+class CodegenTemplate(CompiledTemplate):
+    """A compiled template that renders using a generated Python function.
+
+    The function holds word list pickers and formatters, `random` bindings,
+    and back-reference slots (entry ids) as local variables, so rendering does
+    not need to dispatch over the macro parts.
+    The function is re-generated when one of the bound word lists is modified
+    (see :attr:`fabulist.fabulist._WordList.generation`).
+
+    Args:
+        template (str): A string template with embedded macros.
+        list_map (dict): Maps word types to :class:`_WordList` instances.
+    Attributes:
+        template (str): The original template string.
+        source (str): Python source code of the generated function
+            (`None` until first rendered).
+    """
+
+    def __init__(
+        self,
+        template: str,
+        list_map: dict[str, _WordList],
+        *,
+        rule_map: Optional[dict] = None,
+    ):
+        super().__init__(template, list_map, rule_map=rule_map)
+        self.source: str = None
+        self._func: Callable[[Optional[dict]], str] = self._rebuild
+
+    def _rebuild(self, variables: Optional[dict] = None) -> str:
+        """Generate and compile the render function, then call it."""
+        self.source, namespace = self._generate()
+        code = compile(self.source, f"<fabulist {self.template!r}>", "exec")
+        exec(code, namespace)
+        self._func = namespace["render"]
+        return self._func(variables)
+
+    def _generate(self) -> tuple[str, dict]:
+        """Return Python source of the render function and its globals."""
+        namespace = {
+            "choice": random.choice,
+            "randrange": random.randrange,
+            "rebuild": self._rebuild,
+        }
+        body = []
+        # Map '@1' to the local variable that holds the referenced entry id
+        ref_locals: dict[str, str] = {}
+        # Map word lists to (local name, expected generation)
+        word_lists: dict[int, tuple[str, int]] = {}
+        # Parts that we cannot inline are rendered by the interpreter and may
+        # need a `ref_map`
+        known_types = (_WordPart, _RefPart, _NumberPart, _ChoicePart)
+        uses_ref_map = any(type(p) not in known_types for _, p in self._macros)
+        # Literal segments as source code, macro results as local variable names
+        results = [None if p is None else repr(p) for p in self._parts]
+
+        for i, (idx, part) in enumerate(self._macros):
+            res = f"w{i}"
+            results[idx] = res
+            if type(part) is _WordPart:
+                part.bind()
+                wl = part.word_list
+                if id(wl) not in word_lists:
+                    name = f"wl{len(word_lists)}"
+                    namespace[name] = wl
+                    word_lists[id(wl)] = (name, part.generation)
+                namespace[f"pick{i}"] = part.picker
+                namespace[f"fmt{i}"] = part.formatter
+                args = []
+                if part.initial_list:
+                    # `:initial=@NUM`: pass the referenced entry's first letter
+                    namespace[f"initial{i}"] = part.initial_list.get_initial
+                    ref = ref_locals[part.macro.initial]
+                    args.append(f"initial=initial{i}({ref})")
+                if part.rhyme_list:
+                    # `:rhyme=@NUM`: pass the referenced entry's ending
+                    namespace[f"rhyme{i}"] = part.rhyme_list.get_rhyme
+                    ref = ref_locals[part.macro.rhyme]
+                    args.append(f"rhyme=rhyme{i}({ref}, {part.rhyme_form!r})")
+                    if part.rhyme_list is wl:
+                        args.append(f"exclude={ref}")
+                body.append(f"e{i} = pick{i}({', '.join(args)})")
+                body.append(f"{res} = fmt{i}(e{i})")
+                if part.macro.var_name:
+                    ref_locals[part.macro.var_name] = f"e{i}"
+                    if uses_ref_map:
+                        body.append(f"ref_map[{part.macro.var_name!r}] = e{i}")
+            elif type(part) is _RefPart:
+                # Bound to the same word list as the referenced part, so the
+                # generation check above also covers this formatter
+                part.bind()
+                namespace[f"fmt{i}"] = part.formatter
+                body.append(f"{res} = fmt{i}({ref_locals[part.ref_name]})")
+            elif type(part) is _NumberPart:
+                zfill = f".zfill({part.width})" if part.width else ""
+                body.append(f"{res} = str(randrange({part.min}, {part.max})){zfill}")
+            elif type(part) is _ChoicePart:
+                namespace[f"choices{i}"] = part.choices
+                body.append(f"{res} = choice(choices{i})")
+            else:
+                # Fall back to the interpreted part
+                namespace[f"part{i}"] = part
+                body.append(f"{res} = part{i}.render(ref_map, variables)")
+
+        if uses_ref_map:
+            body.insert(0, "ref_map = {}")
+        if word_lists:
+            checks = " or ".join(
+                f"{name}.generation != {gen}" for name, gen in word_lists.values()
+            )
+            body.insert(0, f"if {checks}:\n        return rebuild(variables)")
+
+        items = ", ".join(results)
+        body.append(f'return "".join(({items},))' if items else 'return ""')
+        lines = ["def render(variables):"]
+        lines.extend(f"    {line}" for line in body)
+        source = "\n".join(lines) + "\n"
+        _logger.debug("Generated render function for %r:\n%s", self.template, source)
+        return source, namespace
+
+    def render(self, variables: Optional[dict] = None) -> str:
+        """Return a random variant of the template.
+
+        Args:
+            variables (dict, optional): Values for `$(var:NAME)` macros.
+        Raises:
+            ApplyTemplateError: if a word form is not available for the
+                randomly selected entry.
+            ValueError: if a `$(var:NAME)` macro is not found in `variables`.
+        """
+        return self._func(variables)
@@ -4,19 +4,33 @@
 Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
 """
 
+import bisect
+import functools
 import logging
+import math
 import os
 import random
 import re
-from collections import defaultdict
-from collections.abc import Iterator
-from typing import Optional, Union
+import sys
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from itertools import repeat
+from typing import NamedTuple, Optional, Union
 
+from . import snapshot
 from .lorem_ipsum import LoremGenerator
 
 # Find `$(TYPE)` or `$(TYPE:MODIFIERS)`
 rex_macro = re.compile(r"\$\(\s*(@?\w+)\s*(\:[^\)]*)?\s*\)")
 
+# Find `len<=6`, `len=3`, ... and `initial=b` or `initial=@1` modifiers
+rex_length = re.compile(r"len\s*(<=|>=|<|>|=)\s*(\d+)")
+rex_initial = re.compile(r"initial\s*=\s*([a-z]|@\d+)")
+rex_rhyme = re.compile(r"rhyme\s*=\s*([a-z]+|@\d+)")
+
+# The rhyming part of a word: last vowel group, consonants, and '-e' or '-es'
+rex_rhyme_ending = re.compile(r"[aeiouy]+[^aeiouy]*(?:es?)?$")
+
 #: The base logger (silent by default)
 _logger = logging.getLogger(__name__)
 _logger.addHandler(logging.NullHandler())
@@ -85,6 +99,265 @@ def get_default_word_form(word_form: str, lemma: str, entry: TWordListEntry) ->
     return word
 
 
+def get_article(word: str, entry: Optional[TWordListEntry] = None) -> str:
+    """Return the indefinite article ('a' or 'an') for a word.
+
+    Args:
+        word (str): The word that follows the article.
+        entry (dict, optional): Word's data as stored in `_WordList.data`.
+            If it has an 'an' value, this is used instead of the default rule
+            (e.g. 'an hour', 'a unicorn'). Only pass the entry if `word` is
+            its lemma, because the override does not apply to other forms.
+    Returns:
+        str: 'a' or 'an'
+    """
+    if entry and entry.get("an"):
+        return entry["an"]
+    if word and word[0].lower() in ("a", "e", "i", "o", "u"):
+        return "an"
+    return "a"
+
+
+def parse_number_modifiers(modifiers: Optional[str]) -> tuple[int, int, int]:
+    """Parse the modifiers of a `num` macro.
+
+    Args:
+        modifiers (str, optional): E.g. ":0,99,2" or "99". Default: "0,99,2".
+    Returns:
+        tuple(int, int, int): (min, max, width)
+    """
+    if modifiers is None:
+        modifiers = "0,99,2"
+    parts = modifiers.lstrip(":").split(":")
+    try:
+        assert len(parts) == 1
+        parts = parts[0]
+        parts = [int(p) for p in parts.split(",")]
+        if len(parts) == 1:
+            min, max, width = 0, parts[0], 0
+        elif len(parts) == 2:
+            min, max, width = parts[0], parts[1], 0
+        else:
+            min, max, width = parts
+        # print("parts", min, max, width)
+    except Exception as e:
+        raise ValueError(
+            f"`num` modifier must be formatted like '[min,]max[,width]': '{modifiers}'"
+        ) from e
+    return min, max, width
+
+
+def parse_choice_modifiers(modifiers: str) -> Sequence[str]:
+    """Parse the modifiers of a `pick` macro.
+
+    Args:
+        modifiers (str): E.g. ":foo,bar,baz" or "$%?!".
+    Returns:
+        list[str] | tuple[str]: The list of choices.
+    """
+    try:
+        modifiers = modifiers.lstrip(":")
+        # Split by ':' but not '\:'
+        modifier_list = re.split(r"(?<!\\):", modifiers)
+        modifier_list = [m.replace(r"\:", ":") for m in modifier_list]
+        assert len(modifier_list) == 1
+        choices = modifier_list[0]
+        # print("ch2", modifiers, modifier_list, choices)
+        # Split by ',' but not '\,'
+        choices: list[str] = re.split(r"(?<!\\),", choices)
+        if len(choices) == 1 and len(choices[0]) > 1:
+            # Only one string was passed: use single characters
+            choices = choices[0].replace(r"\,", ",")
+            choices = tuple(choices)
+        else:
+            choices = [p.strip().replace(r"\,", ",") for p in choices]
+    except Exception as e:
+        raise ValueError(
+            f"`pick` modifier must be formatted like 'value[,value]*': '{modifiers}'"
+        ) from e
+    return choices
+
+
+def get_entropy(counts: Iterable[int]) -> float:
+    """Return the Shannon entropy (in bits) of a distribution given by counts.
+
+    Args:
+        counts (iterable of int): Number of occurrences per distinct value.
+    Returns:
+        float: The entropy in bits, e.g. 1.0 for two equally likely values.
+    """
+    counts = list(counts)
+    total = sum(counts)
+    if not total:
+        return 0.0
+    return -sum(c / total * math.log2(c / total) for c in counts if c)
+
+
+def _harmonic(n: int) -> float:
+    """Return the n-th harmonic number (approximated for large n)."""
+    if n < 100:
+        return sum(1 / k for k in range(1, n + 1))
+    return math.log(n) + 0.5772156649 + 1 / (2 * n) - 1 / (12 * n * n)
+
+
+def make_bitset(ids: Iterable[int], size: int) -> int:
+    """Return an int with bit `i` set for every `i` in `ids` (all < `size`)."""
+    buf = bytearray(b"0") * size
+    for i in ids:
+        buf[size - 1 - i] = 49  # ord("1")
+    return int(buf, 2) if size else 0
+
+
+def iter_bitset(bits: int) -> Iterator[int]:
+    """Yield the positions of all set bits in ascending order."""
+    digits = bin(bits)[:1:-1]  # Reverse, so index == bit position
+    pos = digits.find("1")
+    while pos >= 0:
+        yield pos
+        pos = digits.find("1", pos + 1)
+
+
+def parse_fields(csv_format: Sequence[str], fields: Sequence[str]) -> TWordListEntry:
+    """Convert the fields of a word list file row to an entry dict.
+
+    Empty values are converted to `None` and '-' to `False` (i.e. 'not
+    available'). Tags are separated by '|'. Missing trailing fields are
+    considered empty.
+
+    Args:
+        csv_format (tuple): Column names, e.g. `("lemma", "plural", "tags")`.
+        fields (list[str]): Field values.
+    Returns:
+        dict: An entry dict with one key per column.
+    """
+    entry = dict.fromkeys(csv_format)
+    for name, value in zip(csv_format, fields):
+        value = value.strip()
+        if not value:
+            continue
+        elif name == "tags":
+            entry[name] = {tag.strip().lower() for tag in value.split("|")}
+        elif value == "-":
+            entry[name] = False
+        else:
+            entry[name] = value
+    return entry
+
+
+#: A tag query: OR-ed terms, each is a tuple of AND-ed (tag, negate) pairs
+TTagQuery = tuple[tuple[tuple[str, bool], ...], ...]
+
+
+def parse_tag_query(tag_list: str) -> TTagQuery:
+    """Parse the tag list of a `:#TAGLIST` macro modifier.
+
+    `|` separates alternatives, `&` combines tags that must all match, and
+    `!` excludes a tag. `&` binds stronger than `|`.
+
+    Args:
+        tag_list (str): E.g. "animal|plant", "animal&small", "!negative",
+            or "animal&!small|plant".
+    Returns:
+        tuple: A tuple of terms, each term a tuple of (tag, negate) pairs,
+        e.g. `((("animal", False), ("small", True)), (("plant", False),))`.
+    """
+    query = []
+    for term in tag_list.split("|"):
+        term_tags = []
+        for tag in term.split("&"):
+            tag = tag.strip()
+            negate = tag.startswith("!")
+            if negate:
+                tag = tag[1:].strip()
+            if not tag:
+                raise ValueError(f"Empty tag in {tag_list!r}.")
+            if any(tag == t for t, _ in term_tags):
+                raise ValueError(f"Duplicate tag '{tag}'.")
+            term_tags.append((tag, negate))
+        term_tags = tuple(term_tags)
+        if term_tags in query:
+            raise ValueError(f"Duplicate tag '{term.strip()}'.")
+        query.append(term_tags)
+    return tuple(query)
+
+
+def match_tag_query(query: TTagQuery, tags: Iterable[str]) -> bool:
+    """Return True if a set of tag names matches a tag query.
+
+    Args:
+        query (tuple): A tag query, see :func:`parse_tag_query`.
+        tags (set): Tag names of one entry.
+    """
+    return any(all((tag in tags) != negate for tag, negate in term) for term in query)
+
+
+#: Inclusive (min, max) word length, `max` is `None` if unbounded
+TLength = tuple[int, Optional[int]]
+
+
+def parse_length(op: str, num: int, length: Optional[TLength] = None) -> TLength:
+    """Parse a `:len<=NUM` macro modifier and combine it with a previous range.
+
+    Args:
+        op (str): One of '<', '<=', '=', '>=', '>'.
+        num (int): The number.
+        length (tuple, optional): A previous (min, max) range.
+    Returns:
+        tuple: The intersection, e.g. `(0, 6)` for `len<=6` or `(3, None)`
+        for `len>2`.
+    Raises:
+        ValueError: if the range is empty.
+    """
+    lo, hi = length or (0, None)
+    if op in ("<", "<="):
+        new_hi = num - 1 if op == "<" else num
+        hi = new_hi if hi is None else min(hi, new_hi)
+    if op in (">", ">="):
+        lo = max(lo, num + 1 if op == ">" else num)
+    if op == "=":
+        lo = max(lo, num)
+        hi = num if hi is None else min(hi, num)
+    if hi is not None and hi < lo:
+        raise ValueError(f"Empty word length range: `len{op}{num}`.")
+    return lo, hi
+
+
+def get_initial(word: str) -> str:
+    """Return the lowercase first letter of a word (as used by `:initial=X`)."""
+    return word[:1].lower()
+
+
+def get_rhyme(word: str) -> str:
+    """Return the lowercase ending that a rhyme must share (see `:rhyme=@NUM`).
+
+    This is a simple heuristic, based on spelling: the last vowel group with
+    the following consonants, e.g. 'at' for 'cat', 'able' for 'table', or
+    'ion' for 'station'.
+    """
+    word = word.lower()
+    match = rex_rhyme_ending.search(word)
+    return match.group() if match else word
+
+
+def match_constraints(
+    word: Union[str, bool, None],
+    length: Optional[TLength],
+    initial: Optional[str],
+    rhyme: Optional[str] = None,
+) -> bool:
+    """Return True if a word satisfies `:len...`, `:initial=X`, and `:rhyme=X`
+    modifiers."""
+    if not word:
+        return False
+    if length:
+        lo, hi = length
+        if len(word) < lo or (hi is not None and len(word) > hi):
+            return False
+    if rhyme and not word.lower().endswith(rhyme):
+        return False
+    return not initial or get_initial(word) == initial
+
+
 class ApplyTemplateError(RuntimeError):
     """Raised when a template could not be resolved."""
 
@@ -95,6 +368,8 @@ class ApplyTemplateError(RuntimeError):
 class Macro:
     """Parses and represents a macro with type, modifiers, tags, and references.
 
+    Instances are immutable, so they can be cached and shared across threads.
+
     Note:
         Internal use only.
     Args:
@@ -104,16 +379,33 @@ class Macro:
             e.g. `AdvList` for word_type `adj`.
     Examples:
         $(TYPE:MODS:#foo|bar:=NUM)
+        $(TYPE:MODS:#foo&!bar)
+        $(TYPE:len<=6:initial=@1)
+        $(TYPE:rhyme=@1)
     """
 
+    __slots__ = (
+        "word_type",
+        "word_form",
+        "modifiers",
+        "tags",
+        "tag_query",
+        "var_name",
+        "ref_lemma",
+        "is_caps",
+        "length",
+        "initial",
+        "rhyme",
+    )
+
     def __init__(self, word_type: str, modifiers: str, word_list: "_WordList"):
-        self.word_type = word_type.lower()  #: lowercase word type ('adv', 'adj', ...)
-        self.word_form = None
-        self.modifiers: set = set()
-        self.tags: set = set()
-        self.var_name = None
-        self.ref_lemma = None
-        self.is_caps = word_type[0].isupper()
+        word_form = None
+        extra_modifiers = set()
+        tag_query = ()
+        var_name = None
+        length = None
+        initial = None
+        rhyme = None
 
         has_tags = False
         if modifiers:
@@ -127,58 +419,180 @@ class Macro:
                             "Only one `:#TAGLIST` entry is allowed in macro modifiers."
                         )
                     has_tags = True
-                    for tag in m[1:].split("|"):
-                        tag = tag.strip()
-                        if tag in self.tags:
-                            raise ValueError(f"Duplicate tag '{tag}'.")
-                        self.tags.add(tag)
+                    tag_query = parse_tag_query(m[1:])
                 elif m.startswith("="):
                     # Variable assignment
-                    if self.var_name:
+                    if var_name:
                         raise ValueError(
                             "Only one `:=NUM` assignment entry is allowed in "
                             "macro modifiers."
                         )
-                    self.var_name = f"@{int(m[1:]):d}"
+                    var_name = f"@{int(m[1:]):d}"
+                elif m.startswith(("len", "initial=", "rhyme=")):
+                    # Constraints ('len<=6', 'initial=b', 'rhyme=@1', ...)
+                    if not word_list.csv_format:
+                        raise ValueError(
+                            f"Modifier '{m}' is not supported for '{word_type}'."
+                        )
+                    if match := rex_length.fullmatch(m):
+                        length = parse_length(match[1], int(match[2]), length)
+                    elif match := rex_initial.fullmatch(m):
+                        if initial:
+                            raise ValueError(
+                                "Only one `:initial=X` entry is allowed in "
+                                "macro modifiers."
+                            )
+                        initial = match[1]
+                    elif match := rex_rhyme.fullmatch(m):
+                        if rhyme:
+                            raise ValueError(
+                                "Only one `:rhyme=X` entry is allowed in "
+                                "macro modifiers."
+                            )
+                        rhyme = match[1]
+                    else:
+                        raise ValueError(f"Unsupported modifier: '{m}'")
                 elif m:
                     # Modifier
-                    if m in self.modifiers:
+                    if m in extra_modifiers:
                         raise ValueError(f"Duplicate modifier '{m}'.")
                     if m in word_list.form_modifiers:
                         # Word-form modifier ('plural', 'pp', 's', 'ing', ...)
-                        if self.word_form:
+                        if word_form:
                             raise ValueError(
                                 "Only one word-form modifier is allowed '{}'.".format(
                                     "', '".join(word_list.form_modifiers)
                                 )
                             )
-                        self.word_form = m
+                        word_form = m
                     elif m in word_list.extra_modifiers:
                         # Additional modifier ('an', 'mr', ...)
-                        self.modifiers.add(m)
+                        extra_modifiers.add(m)
                     else:
                         raise ValueError(f"Unsupported modifier: '{m}'")
                 else:
                     # empty modifier (`::`)
                     raise ValueError(f"Empty modifier: {modifiers!r}")
+
+        # Instances are immutable (and may be shared, see Fabulist.get_word()),
+        # so we bypass our own __setattr__
+        set_attr = object.__setattr__
+        #: lowercase word type ('adv', 'adj', ...)
+        set_attr(self, "word_type", word_type.lower())
+        set_attr(self, "word_form", word_form)
+        set_attr(self, "modifiers", frozenset(extra_modifiers))
+        #: All tag names that are used by the tag query
+        set_attr(self, "tags", frozenset(t for term in tag_query for t, _ in term))
+        set_attr(self, "tag_query", tag_query)
+        set_attr(self, "var_name", var_name)
+        set_attr(self, "ref_lemma", None)
+        set_attr(self, "is_caps", word_type[0].isupper())
+        #: (min, max) word length (see :func:`parse_length`) or `None`
+        set_attr(self, "length", length)
+        #: Lowercase first letter, a variable name ('@1'), or `None`
+        set_attr(self, "initial", initial)
+        #: Lowercase word ending, a variable name ('@1'), or `None`
+        set_attr(self, "rhyme", rhyme)
         return
 
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f"{self.__class__.__name__} instances are immutable.")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{self.__class__.__name__} instances are immutable.")
+
     def __repr__(self) -> str:
         res = [self.word_type]
         if self.word_form:
             res.append(self.word_form)
         if self.modifiers:
             res.extend(self.modifiers)
-        if self.tags:
-            res.append("#" + "|".join(self.tags))
+        if self.tag_query:
+            res.append(
+                "#"
+                + "|".join(
+                    "&".join(f"!{tag}" if negate else tag for tag, negate in term)
+                    for term in self.tag_query
+                )
+            )
+        if self.length:
+            lo, hi = self.length
+            if lo == hi:
+                res.append(f"len={lo}")
+            else:
+                if lo:
+                    res.append(f"len>={lo}")
+                if hi is not None:
+                    res.append(f"len<={hi}")
+        if self.initial:
+            res.append(f"initial={self.initial}")
+        if self.rhyme:
+            res.append(f"rhyme={self.rhyme}")
         if self.var_name:
             res.append(f"={self.var_name}")
         return "$({})".format(":".join(res))
 
+    @property
+    def static_initial(self) -> Optional[str]:
+        """The `:initial=X` letter, unless it refers to a variable."""
+        initial = self.initial
+        return None if not initial or initial.startswith("@") else initial
+
+    @property
+    def static_rhyme(self) -> Optional[str]:
+        """The `:rhyme=X` ending, unless it refers to a variable."""
+        rhyme = self.rhyme
+        return None if not rhyme or rhyme.startswith("@") else rhyme
+
 
 # ------------------------------------------------------------------------------
 # _WordList
 # ------------------------------------------------------------------------------
+class ImportResult(NamedTuple):
+    """Statistics of :meth:`_WordList.add_entries`.
+
+    Attributes:
+        added (int): Number of new entries.
+        updated (int): Number of existing entries that were replaced or merged.
+        duplicates (int): Number of entries that were skipped, because they
+            did not add any value or tag to an existing entry.
+        conflicts (int): Number of entries that differ from an existing entry
+            (see the `on_conflict` argument).
+        conflict_samples (tuple): Lemmas of the first conflicts (up to 100).
+    """
+
+    added: int = 0
+    updated: int = 0
+    duplicates: int = 0
+    conflicts: int = 0
+    conflict_samples: tuple = ()
+
+
+class _WordListData(Mapping):
+    """Read-only view of a word list's entries, see :attr:`_WordList.data`.
+
+    Entries are stored column-wise, so each lookup returns a new dict.
+    """
+
+    __slots__ = ("_word_list",)
+
+    def __init__(self, word_list: "_WordList"):
+        self._word_list = word_list
+
+    def __getitem__(self, lemma: str) -> TWordListEntry:
+        word_list = self._word_list
+        return word_list.get_entry(word_list.key_index[lemma])
+
+    def __contains__(self, lemma) -> bool:
+        return lemma in self._word_list.key_index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._word_list.key_index)
+
+    def __len__(self) -> int:
+        return len(self._word_list.key_index)
+
+
 class _WordList:
     """Common base class for all word lists.
 
@@ -190,9 +604,39 @@ class _WordList:
         path (str): Location of dictionary csv file.
     Attributes:
         path (str): Location of dictionary csv file.
-        data (dict): Maps word lemmas to dicts of word data (i.e. word-forms).
-        key_list (list): List of all known word lemmas.
-        tag_map (dict): Maps tag names to sets of word lemmas.
+        data (Mapping): Read-only view that maps word lemmas to dicts of word
+            data (i.e. word-forms). Use :meth:`add_entry` to modify entries.
+        columns (dict): Maps CSV column names (except 'tags') to lists of
+            values, indexed by entry id. Strings are interned.
+            Computable word forms that are not defined by the CSV file are
+            `None` until they are first accessed (see :meth:`get_column`).
+        key_list (list): List of all known word lemmas (the 'lemma' column).
+        tag_names (list): Tag names, indexed by tag id.
+        tag_map (dict): Maps tag names to sets of word lemmas (computed on
+            access).
+        tag_bits (dict): Maps tag names to bitsets (int) of entry ids.
+        form_map (dict): Maps word forms (e.g. 'plural') to lists of lemmas
+            that have this form.
+        key_index (dict): Maps word lemmas to their position in :attr:`key_list`
+            (the entry id).
+        form_bits (dict): Maps word forms to bitsets (int) of entry ids that
+            have this form.
+        form_tables (dict): Maps `(word_form, an, caps)` tuples to tuples of
+            ready-made strings, indexed by entry id (`None` if the form is not
+            available), e.g. `form_tables[("plural", True, True)][0]` may be
+            'An apple'. Tables are created on demand, see :meth:`get_form_table`.
+        generation (int): Incremented by :meth:`update_data`, so compiled
+            templates know when to re-bind their cached key lists.
+        filter_cache_hits (int): Number of tag filter results that were
+            served from the cache (see :meth:`_filter_key_list`).
+        filter_cache_misses (int): Number of tag filter results that had to
+            be computed.
+        snapshot_dir (str): If set, :meth:`load` uses binary snapshots in this
+            folder (see :mod:`fabulist.snapshot`). Default: `None`.
+        sources (dict): Maps names of supplemental lists to the lemmas they
+            added (see :meth:`load_additional`).
+        source_paths (dict): Maps names of supplemental lists to their file
+            paths.
     """
 
     word_type: str = None
@@ -212,28 +656,123 @@ class _WordList:
     all_modifiers: frozenset = None
     """frozenset: Set of all supported modifiers (word-form and additional).
     Set by derived classes."""
+    optional_columns: frozenset = frozenset(("an",))
+    """frozenset: Trailing CSV columns that may be omitted in the text file
+    (e.g. 'an', which overrides the default article for the entry)."""
+    _state_attrs: tuple = (
+        "columns",
+        "key_index",
+        "tag_names",
+        "_tag_ids",
+        "_entry_tags",
+        "tag_bits",
+        "form_map",
+        "form_bits",
+        "file_comments",
+    )
+    """tuple: Attributes that are stored in snapshots."""
 
     def __init__(self, path: str):
         self.path: str = path
-        self.data: dict[str, TWordListEntry] = {}
-        self.key_list = []
-        # { tagname: set(lemma_1, lemma_2, ...) }
-        self.tag_map: dict[str, set] = defaultdict(set)
+        self.data: Mapping[str, TWordListEntry] = _WordListData(self)
+        # { column_name: [value_0, value_1, ...] }
+        self.columns: dict[str, list] = {
+            name: [] for name in self.csv_format or ("lemma",) if name != "tags"
+        }
+        self.key_list: list[str] = self.columns["lemma"]
+        # [tagname_0, tagname_1, ...] and { tagname: tag_id }
+        self.tag_names: list[str] = []
+        self._tag_ids: dict[str, int] = {}
+        # Tag ids per entry, e.g. [(0, 3), (), ...], using shared tuples
+        self._entry_tags: list[tuple[int, ...]] = []
+        self._tag_sets: dict[tuple[int, ...], tuple[int, ...]] = {}
+        # { tagname: bitset of entry ids }
+        self.tag_bits: dict[str, int] = {}
+        # { word_form: [lemma_1, lemma_2, ...] }
+        self.form_map: dict[str, list[str]] = {}
+        # { word_form: bitset of entry ids }
+        self.form_bits: dict[str, int] = {}
+        # { lemma: entry_id }
+        self.key_index: dict[str, int] = {}
+        # { (word_form, an, caps): (word_0, word_1, ...) }
+        self.form_tables: dict[tuple[str, bool, bool], tuple] = {}
+        # { ("len" | "initial", word_form): { length | letter: bitset of entry ids } }
+        # { ("rhyme", word_form): ([reversed_word, ...], [entry_id, ...]) }
+        self._constraint_index: dict[tuple[str, str], Union[dict, tuple]] = {}
+        # { (tag_query, frozenset(word_forms), ...): [entry_id_1, entry_id_2, ...] }
+        # (and frozensets of ids that `rhyme` results are checked against)
+        self._filter_cache: dict[tuple, Union[list[int], frozenset]] = {}
+        self.filter_cache_hits: int = 0
+        self.filter_cache_misses: int = 0
         # Used to restore comments in save_as():
         self.file_comments: list[str] = []
+        self.generation: int = 0
+        self.snapshot_dir: Optional[str] = None
+        # { source_name: [lemma_1, lemma_2, ...] }
+        self.sources: dict[str, list[str]] = {}
+        # { source_name: path }
+        self.source_paths: dict[str, str] = {}
+        # `generation` after the initial load (see unload())
+        self._load_generation: Optional[int] = None
 
     def __repr__(self) -> str:
         s = "{}(len={}, tags:{})".format(
-            self.__class__.__name__, len(self.key_list), ", ".join(self.tag_map.keys())
+            self.__class__.__name__, len(self.key_list), ", ".join(self.tag_names)
         )
         return s
 
-    def _process_entry(self, lemma: str, entry: TWordListEntry) -> None:
-        """Expand empty values ("") if they are computable."""
-        for modifier in self.computable_modifiers:
-            # e.g. "super", "plural", ...
-            if entry.get(modifier) is None:
-                entry[modifier] = get_default_word_form(modifier, lemma, entry)
+    @property
+    def tag_map(self) -> dict[str, set]:
+        """Maps tag names to sets of word lemmas."""
+        tag_map = defaultdict(set)
+        tag_names = self.tag_names
+        for lemma, tag_ids in zip(self.key_list, self._entry_tags):
+            for tag_id in tag_ids:
+                tag_map[tag_names[tag_id]].add(lemma)
+        return tag_map
+
+    def has_tag(self, tag: str) -> bool:
+        """Return True if at least one entry has this tag."""
+        return tag in self.tag_bits
+
+    def _new_empty(self) -> "_WordList":
+        """Return a new, empty word list of the same type."""
+        return self.__class__(None)
+
+    def _resolve_word_form(self, entry_id: int, word_form: str) -> Union[str, bool]:
+        """Return a word form of an entry, computing a default on first access.
+
+        Computable word forms (e.g. 'plural') that are empty in the CSV file are
+        not computed by :meth:`load`, but here. The result is stored in
+        :attr:`columns`.
+        """
+        column = self.columns[word_form]
+        value = column[entry_id]
+        if value is None and word_form in self.computable_modifiers:
+            entry = {name: col[entry_id] for name, col in self.columns.items()}
+            value = get_default_word_form(word_form, entry["lemma"], entry)
+            if type(value) is str:
+                value = sys.intern(value)
+            column[entry_id] = value
+        return value
+
+    def get_column(self, name: str) -> list:
+        """Return all values of a column, indexed by entry id.
+
+        Missing computable word forms are computed for all entries.
+
+        Args:
+            name (str): CSV column name, e.g. 'lemma' or 'plural'.
+        Returns:
+            list: The column (do not modify).
+        """
+        column = self.columns[name]
+        if name in self.computable_modifiers and None in column:
+            resolve = self._resolve_word_form
+            for entry_id, value in enumerate(column):
+                if value is None:
+                    resolve(entry_id, name)
+        return column
 
     def _un_process_entry(self, lemma: str, entry: TWordListEntry) -> None:
         """Squash values to `None` if they are re-computable."""
@@ -244,72 +783,423 @@ class _WordList:
             ):
                 entry[modifier] = None
 
-    def _iter_file(self, path: str) -> Iterator[TWordListEntry]:
-        """Parse a text file and yield entry-dicts."""
+    def _iter_file(
+        self, path: str, *, supplemental: bool = False
+    ) -> Iterator[TWordListEntry]:
+        """Parse a text file and yield entry-dicts.
+
+        Supplemental lists (see :meth:`load_additional`) may omit all columns
+        except the lemma, and their comments are not kept.
+        """
         csv_format = self.csv_format
+        n_required = len(csv_format)
+        while n_required and csv_format[n_required - 1] in self.optional_columns:
+            n_required -= 1
+        if supplemental:
+            n_required = 1
 
         for line in open(path):
             line = line.strip()
             if not line:
                 continue
             elif line.startswith("#"):
-                self.file_comments.append(line)
+                if not supplemental:
+                    self.file_comments.append(line)
                 continue
 
-            entry = {}
             fields = line.split(",")
-            assert len(fields) == len(csv_format), f"token count mismatch in {line}"
-            for idx, name in enumerate(csv_format):
-                value = fields[idx].strip()
-                if name == "tags":
-                    # Convert tags-string into a set
-                    if value:
-                        tag_set = entry[name] = set()
-                        for tag in value.split("|"):
-                            tag = tag.strip().lower()
-                            tag_set.add(tag)
-                    else:
-                        entry[name] = None
-                else:
-                    if value == "-":
-                        entry[name] = False
-                    elif value == "":
-                        entry[name] = None
-                    else:
-                        entry[name] = value
-            yield entry
+            assert n_required <= len(fields) <= len(csv_format), (
+                f"token count mismatch in {line}"
+            )
+            yield parse_fields(csv_format, fields)
         return
 
-    def _filter_key_list(self, tags: set) -> list[str]:
-        """Return key_list filtered by tags (if any)."""
-        if not tags:
-            return self.key_list
-        matching = set()
-        for tag in tags:
-            if tag in self.tag_map:
-                matching.update(self.tag_map[tag])
-            else:
-                raise ValueError(
-                    f"{self.__class__.__name__} has no entries for tag '{tag}' "
-                    f"(expected {self.tag_map.keys()})"
-                )
-        return list(matching)
+    def _get_constraint_index(self, kind: str, word_form: str) -> dict:
+        """Return a dict that maps word lengths or initials to bitsets of entry ids.
 
-    def get_random_entry(self, macro: Macro) -> TWordListEntry:
+        Indexes are computed on first use and kept until the next
+        :meth:`update_data` call.
+
+        Args:
+            kind (str): 'len' or 'initial'.
+            word_form (str): E.g. 'lemma' or 'plural'.
+        """
+        key = (kind, word_form)
+        index = self._constraint_index.get(key)
+        if index is None:
+            get_key = len if kind == "len" else get_initial
+            id_lists = defaultdict(list)
+            for idx, word in enumerate(self.get_column(word_form)):
+                if word:
+                    id_lists[get_key(word)].append(idx)
+            size = len(self.key_list)
+            index = self._constraint_index[key] = {
+                value: make_bitset(ids, size) for value, ids in id_lists.items()
+            }
+        return index
+
+    def _get_rhyme_ids(self, word_form: str, ending: str) -> list[int]:
+        """Return ids of entries where a word form ends with `ending`.
+
+        Words are looked up with `bisect` in a sorted list of reversed
+        (lowercase) words, which is created on first use and kept until the
+        next :meth:`update_data` call. Ids are returned in ascending order.
+
+        Args:
+            word_form (str): E.g. 'lemma' or 'plural'.
+            ending (str): Lowercase word ending (see :func:`get_rhyme`).
+        """
+        key = ("rhyme", word_form)
+        index = self._constraint_index.get(key)
+        if index is None:
+            pairs = sorted(
+                (word.lower()[::-1], idx)
+                for idx, word in enumerate(self.get_column(word_form))
+                if word
+            )
+            index = self._constraint_index[key] = (
+                [rev for rev, _ in pairs],
+                [idx for _, idx in pairs],
+            )
+        reversed_words, ids = index
+        prefix = ending[::-1]
+        lo = bisect.bisect_left(reversed_words, prefix)
+        hi = bisect.bisect_left(reversed_words, prefix + "\uffff", lo)
+        return sorted(ids[lo:hi])
+
+    def _filter_ids(
+        self,
+        tags: Union[TTagQuery, set],
+        word_forms: Iterable[str] = (),
+        *,
+        word_form: str = "lemma",
+        length: Optional[TLength] = None,
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+    ) -> Sequence[int]:
+        """Return ids of entries that match the tags and have the word forms.
+
+        The query is evaluated with bitwise operations on :attr:`tag_bits` and
+        :attr:`form_bits`, and the length and initial indexes (see
+        :meth:`_get_constraint_index`). Entries with a `rhyme` ending are
+        looked up with :meth:`_get_rhyme_ids` and checked against the ids of
+        the other filters, so this does not depend on the list size. Results are
+        cached until the next :meth:`add_entry` or :meth:`update_data` call,
+        so callers must not modify the returned list. Ids are returned in
+        ascending order.
+
+        Args:
+            tags (tuple | set): A tag query (see :func:`parse_tag_query`), or a
+                set of tag names of which at least one must match.
+            word_forms (iterable of str, optional): Word forms that must be
+                available.
+            word_form (str, optional): The word form that `length`, `initial`,
+                and `rhyme` apply to. Default: 'lemma'.
+            length (tuple, optional): (min, max) word length, see
+                :func:`parse_length`.
+            initial (str, optional): Lowercase first letter.
+            rhyme (str, optional): Lowercase word ending.
+        """
+        if isinstance(tags, (set, frozenset)):
+            tags = tuple(((tag, False),) for tag in sorted(tags))
+        word_forms = frozenset(f for f in word_forms if f in self.form_bits)
+        if not (length or initial or rhyme):
+            word_form = None
+        if not tags and not word_forms and not word_form:
+            return range(len(self.key_list))
+
+        cache_key = (tags, word_forms, word_form, length, initial, rhyme)
+        ids = self._filter_cache.get(cache_key)
+        if ids is not None:
+            self.filter_cache_hits += 1
+            return ids
+        self.filter_cache_misses += 1
+
+        if rhyme:
+            # `rhyme=@NUM` queries a new ending on almost every render, so we
+            # only test the few entries with this ending against the (cached)
+            # ids of the other filters
+            ids = self._get_rhyme_ids(word_form, rhyme)
+            if tags or word_forms or length or initial:
+                set_key = (tags, word_forms, word_form, length, initial, None, set)
+                allowed = self._filter_cache.get(set_key)
+                if allowed is None:
+                    allowed = self._filter_cache[set_key] = frozenset(
+                        self._filter_ids(
+                            tags,
+                            word_forms,
+                            word_form=word_form,
+                            length=length,
+                            initial=initial,
+                        )
+                    )
+                ids = [idx for idx in ids if idx in allowed]
+            self._filter_cache[cache_key] = ids
+            return ids
+
+        all_bits = (1 << len(self.key_list)) - 1
+        if tags:
+            bits = 0
+            for term in tags:
+                term_bits = all_bits
+                for tag, negate in term:
+                    tag_bits = self.tag_bits.get(tag)
+                    if tag_bits is None:
+                        raise ValueError(
+                            f"{self.__class__.__name__} has no entries for tag "
+                            f"'{tag}' (expected {self.tag_bits.keys()})"
+                        )
+                    term_bits &= ~tag_bits if negate else tag_bits
+                bits |= term_bits
+        else:
+            bits = all_bits
+        for form in word_forms:
+            bits &= self.form_bits[form]
+        if length:
+            lo, hi = length
+            length_bits = 0
+            for n, n_bits in self._get_constraint_index("len", word_form).items():
+                if lo <= n and (hi is None or n <= hi):
+                    length_bits |= n_bits
+            bits &= length_bits
+        if initial:
+            bits &= self._get_constraint_index("initial", word_form).get(initial, 0)
+
+        ids = list(iter_bitset(bits))
+        self._filter_cache[cache_key] = ids
+        return ids
+
+    def _filter_key_list(
+        self, tags: Union[TTagQuery, set], word_forms: Iterable[str] = ()
+    ) -> list[str]:
+        """Return key_list filtered by tags and available word forms (if any).
+
+        See :meth:`_filter_ids`. Lemmas are returned in :attr:`key_list` order.
+        """
+        key_list = self.key_list
+        ids = self._filter_ids(tags, word_forms)
+        if type(ids) is range:
+            return key_list
+        return [key_list[i] for i in ids]
+
+    def _get_candidates(
+        self,
+        macro: Macro,
+        extra_forms: Iterable[str] = (),
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+    ) -> Sequence[int]:
+        """Return ids of entries that match the macro's tags, required forms,
+        and constraints.
+
+        Args:
+            initial (str, optional): Overrides the macro's `:initial=X` letter
+                (used to resolve `:initial=@1`).
+            rhyme (str, optional): Overrides the macro's `:rhyme=X` ending
+                (used to resolve `:rhyme=@1`).
+        Raises:
+            ApplyTemplateError: if no entry matches.
+        """
+        word_forms = set(extra_forms)
+        if macro.word_form:
+            word_forms.add(macro.word_form)
+        initial = initial or macro.static_initial
+        rhyme = rhyme or macro.static_rhyme
+        ids = self._filter_ids(
+            macro.tag_query,
+            word_forms,
+            word_form=macro.word_form or "lemma",
+            length=macro.length,
+            initial=initial,
+            rhyme=rhyme,
+        )
+        if not ids:
+            raise ApplyTemplateError(
+                f"{self.__class__.__name__} has no entries that match {macro} "
+                f"(with forms {word_forms}, initial {initial!r}, rhyme {rhyme!r})"
+            )
+        return ids
+
+    def get_random_entry(
+        self,
+        macro: Macro,
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+    ) -> TWordListEntry:
         """Return a random entry dict, according to modifiers.
 
+        Only entries that provide the requested word form are considered.
+
         Args:
             macro (:class:`Macro`): A parsed template macro.
+            initial (str, optional): The first letter of the word, if the
+                macro has an `:initial=@NUM` modifier.
+            rhyme (str, optional): The word ending, if the macro has a
+                `:rhyme=@NUM` modifier.
         Returns:
             dict: A random entry from :attr:`key_list`.
+        Raises:
+            ApplyTemplateError: if no entry matches the macro.
         """
         if macro.word_type != "name":
             assert macro.word_type == self.word_type
         if not self.data:
             self.load()
-        key_list = self._filter_key_list(macro.tags)
-        key = random.choice(key_list)
-        entry = self.data[key]
+        ids = self._get_candidates(macro, initial=initial, rhyme=rhyme)
+        entry = self.get_entry(random.choice(ids))
+        return entry
+
+    def get_initial(self, entry_id: int) -> str:
+        """Return the lowercase first letter of an entry's lemma."""
+        return get_initial(self.key_list[entry_id])
+
+    def get_rhyme(self, entry_id: int, word_form: str = "lemma") -> str:
+        """Return the rhyming ending of an entry's word form (see :func:`get_rhyme`)."""
+        if word_form == "lemma":
+            return get_rhyme(self.key_list[entry_id])
+        return get_rhyme(self.get_entry(entry_id)[word_form])
+
+    def get_ref_picker(
+        self, macro: Macro, extra_forms: Iterable[str] = ()
+    ) -> Callable[..., int]:
+        """Return a function that returns random entry ids for a macro with
+        `:initial=@NUM` or `:rhyme=@NUM` modifiers.
+
+        The letter and ending are only known when rendering, so the candidates
+        are looked up (and cached) per letter and ending on demand (see
+        :meth:`_filter_ids`). Picks do not require a retry loop.
+
+        Returns:
+            callable: A function that accepts `initial`, `rhyme`, and `exclude`
+            (an entry id that should not be returned, e.g. the word we rhyme
+            with) and returns an entry id. It raises
+            :class:`ApplyTemplateError` if no entry matches.
+        """
+        if not self.data:
+            self.load()
+        candidates = {}
+        choice = random.choice
+
+        def _pick(
+            initial: Optional[str] = None,
+            rhyme: Optional[str] = None,
+            exclude: Optional[int] = None,
+        ) -> int:
+            key = (initial, rhyme)
+            ids = candidates.get(key)
+            if ids is None:
+                ids = candidates[key] = self._get_candidates(
+                    macro, extra_forms, initial, rhyme
+                )
+            entry_id = choice(ids)
+            if entry_id == exclude:
+                if len(ids) == 1:
+                    raise ApplyTemplateError(
+                        f"{self.__class__.__name__} has no other entries that "
+                        f"match {macro} (initial {initial!r}, rhyme {rhyme!r})"
+                    )
+                while entry_id == exclude:
+                    entry_id = choice(ids)
+            return entry_id
+
+        return _pick
+
+    def get_picker(
+        self, macro: Macro, extra_forms: Iterable[str] = ()
+    ) -> Callable[[], int]:
+        """Return a function that returns random entry ids, according to modifiers.
+
+        In contrast to :meth:`get_random_entry`, the tag filter is only evaluated
+        once. The picker becomes stale when :attr:`generation` changes.
+        Use :meth:`get_formatter` to convert the ids to strings and
+        :meth:`get_entry` to look up the entry dict.
+
+        Args:
+            macro (:class:`Macro`): A parsed template macro.
+            extra_forms (iterable of str, optional): Additional word forms
+                that the entries must provide, e.g. because they are requested
+                by back-references.
+        Returns:
+            callable: A function without arguments that returns an entry id.
+        Raises:
+            ApplyTemplateError: if no entry matches the macro.
+        """
+        if not self.data:
+            self.load()
+        ids = self._get_candidates(macro, extra_forms)
+        return functools.partial(random.choice, ids)
+
+    def get_formatter(self, macro: Macro) -> Callable[[int], str]:
+        """Return a function that converts entry ids to words, according to modifiers.
+
+        The words are looked up from a pre-computed table (see
+        :meth:`get_form_table`), so the result already has the article and
+        capitalization applied.
+        The formatter becomes stale when :attr:`generation` changes.
+
+        Args:
+            macro (:class:`Macro`): A parsed template macro.
+        Returns:
+            callable: A function that accepts an entry id (as returned by a
+            picker, see :meth:`get_picker`) and returns a string.
+        """
+        if not self.data:
+            self.load()
+        table = self.get_form_table(
+            macro.word_form or "lemma", "an" in macro.modifiers, macro.is_caps
+        )
+        return table.__getitem__
+
+    def get_form_table(
+        self, word_form: str, an: bool = False, caps: bool = False
+    ) -> tuple[Optional[str], ...]:
+        """Return a word form variant for all entries, indexed by entry id.
+
+        Tables are computed on first use and kept in :attr:`form_tables` until
+        the next :meth:`update_data` call.
+
+        Args:
+            word_form (str): E.g. 'lemma' or 'plural'.
+            an (bool): Prepend 'a' or 'an'.
+            caps (bool): Capitalize the first letter.
+        Returns:
+            tuple: One string per entry (`None` if the form is not available).
+        """
+        key = (word_form, an, caps)
+        table = self.form_tables.get(key)
+        if table is None:
+            table = self.form_tables[key] = self._make_form_table(key)
+        return table
+
+    def _make_form_table(
+        self, key: tuple[str, bool, bool], start: int = 0
+    ) -> tuple[Optional[str], ...]:
+        """Compute a form table (see :meth:`get_form_table`) for entry ids >= start."""
+        word_form, an, caps = key
+        words = self.get_column(word_form)[start:]
+        if an:
+            assert "an" in self.extra_modifiers, self
+            # The 'an' column overrides the article of the lemma only
+            an_column = self.columns.get("an") if word_form == "lemma" else None
+            articles = an_column[start:] if an_column else repeat(None)
+            words = [
+                word and f"{article or get_article(word)} {word}"
+                for word, article in zip(words, articles)
+            ]
+        if caps:
+            words = [word and word.capitalize() for word in words]
+        return tuple(word or None for word in words)
+
+    def get_entry(self, entry_id: int) -> TWordListEntry:
+        """Return a new entry dict for an entry id (see :meth:`get_picker`)."""
+        entry = {name: column[entry_id] for name, column in self.columns.items()}
+        for word_form in self.computable_modifiers:
+            if entry[word_form] is None:
+                entry[word_form] = self._resolve_word_form(entry_id, word_form)
+        if "tags" in self.csv_format:
+            tag_ids = self._entry_tags[entry_id]
+            tag_names = self.tag_names
+            entry["tags"] = {tag_names[t] for t in tag_ids} if tag_ids else None
         return entry
 
     def apply_macro(self, macro: Macro, entry: TWordListEntry) -> str:
@@ -328,53 +1218,345 @@ class _WordList:
         modifiers = macro.modifiers
 
         word = entry[word_form]
-        if word is False:
-            # For example trying to apply the `:plural` modifier on an uncountable noun
+        if not word:
+            # For example trying to apply the `:plural` modifier on an uncountable
+            # noun (False), or an `:antonym` that is not defined (None)
             raise ApplyTemplateError(f"Could not apply {macro} on entry {entry}")
 
         if "an" in modifiers:
-            if word[0].lower() in ("a", "e", "i", "o"):
-                word = "an " + word
-            else:
-                word = "a " + word
+            word = (
+                f"{get_article(word, entry if word_form == 'lemma' else None)} {word}"
+            )
         return word
 
+    def analyze_macro(
+        self,
+        macro: Macro,
+        ref_macros: Sequence[Macro] = (),
+        *,
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+        exclude: Optional[int] = None,
+    ) -> tuple[int, float]:
+        """Return the number of distinct results and their entropy for a macro.
+
+        Entries where the requested word form is not available are skipped,
+        because they would be re-rendered by :meth:`Fabulist.generate_quotes`.
+
+        Args:
+            macro (:class:`Macro`): A parsed template macro.
+            ref_macros (list[:class:`Macro`], optional): Back-references to the
+                entry that is selected by `macro`.
+            initial (str, optional): Overrides the macro's `:initial=X` letter
+                (used to resolve `:initial=@1`).
+            rhyme (str, optional): Overrides the macro's `:rhyme=X` ending
+                (used to resolve `:rhyme=@1`).
+            exclude (int, optional): An entry id that is never picked (e.g.
+                the word we rhyme with).
+        Returns:
+            tuple(int, float): Number of distinct results and entropy in bits.
+        """
+        results = self._get_macro_results(
+            macro, ref_macros, initial=initial, rhyme=rhyme, exclude=exclude
+        )
+        counts = Counter(results.values())
+        return len(counts), get_entropy(counts.values())
+
+    def _get_macro_results(
+        self,
+        macro: Macro,
+        ref_macros: Sequence[Macro] = (),
+        *,
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+        exclude: Optional[int] = None,
+    ) -> dict[int, tuple[str, ...]]:
+        """Return the words of a macro and its back-references per entry id.
+
+        See :meth:`analyze_macro`.
+        """
+        if not self.data:
+            self.load()
+        results = {}
+        entry_ids = self._filter_ids(
+            macro.tag_query,
+            word_form=macro.word_form or "lemma",
+            length=macro.length,
+            initial=initial or macro.static_initial,
+            rhyme=rhyme or macro.static_rhyme,
+        )
+        for entry_id in entry_ids:
+            if entry_id == exclude:
+                continue
+            entry = self.get_entry(entry_id)
+            try:
+                word = self.apply_macro(macro, entry)
+                if macro.is_caps:
+                    word = word.capitalize()
+                result = (word, *(self.apply_macro(m, entry) for m in ref_macros))
+            except ApplyTemplateError:
+                continue
+            results[entry_id] = result
+        return results
+
     def update_data(self) -> None:
         """Update internal structures after entries have been added or modified."""
-        self.key_list = list(self.data.keys())
+        self._filter_cache.clear()
+        key_list = self.key_list
+        size = len(key_list)
+        # Index entries per word form, so we can avoid ApplyTemplateError
+        self.form_map = {}
+        self.form_bits = {}
+        for word_form in self.form_modifiers or ():
+            if word_form == "lemma":
+                continue
+            ids = self._get_form_ids(word_form)
+            self.form_map[word_form] = [key_list[idx] for idx in ids]
+            self.form_bits[word_form] = make_bitset(ids, size)
+        tag_id_lists = [[] for _ in self.tag_names]
+        for idx, tag_ids in enumerate(self._entry_tags):
+            for tag_id in tag_ids:
+                tag_id_lists[tag_id].append(idx)
+        self.tag_bits = {
+            tag: make_bitset(ids, size)
+            for tag, ids in zip(self.tag_names, tag_id_lists)
+            if ids
+        }
+        self.form_tables = {}
+        self._constraint_index = {}
+        self.generation += 1
+
+    def _get_form_ids(self, word_form: str, start: int = 0) -> list[int]:
+        """Return ids (>= start) of entries that have a word form."""
+        # Computable forms that are not yet resolved (None) are available
+        computable = word_form in self.computable_modifiers
+        column = self.columns[word_form]
+        return [
+            idx
+            for idx in range(start, len(column))
+            if column[idx] or (computable and column[idx] is None)
+        ]
+
+    def _truncate(self, size: int) -> None:
+        """Remove entries with ids >= size and update internal structures.
+
+        The caller must remove the lemmas from :attr:`key_index`.
+        """
+        for column in self.columns.values():
+            del column[size:]
+        del self._entry_tags[size:]
+        self._filter_cache.clear()
+        mask = (1 << size) - 1
+        for word_form, bits in self.form_bits.items():
+            # form_map lists are in id order, so drop the removed tail
+            n_removed = bin(bits >> size).count("1")
+            del self.form_map[word_form][len(self.form_map[word_form]) - n_removed :]
+            self.form_bits[word_form] = bits & mask
+        self.tag_bits = {
+            tag: bits & mask for tag, bits in self.tag_bits.items() if bits & mask
+        }
+        self.form_tables = {
+            key: table[:size] for key, table in self.form_tables.items()
+        }
+        self._constraint_index = {}
+        self.generation += 1
+
+    def _merge_data(self, start: int) -> None:
+        """Update internal structures after entries have been appended.
+
+        In contrast to :meth:`update_data`, only the new entries (with ids >=
+        `start`) are indexed. Existing entries must not have been modified.
+        """
+        self._filter_cache.clear()
+        key_list = self.key_list
+        size = len(key_list)
+        for word_form, bits in self.form_bits.items():
+            ids = self._get_form_ids(word_form, start)
+            self.form_map[word_form].extend(key_list[idx] for idx in ids)
+            self.form_bits[word_form] = bits | make_bitset(ids, size)
+        tag_id_lists = defaultdict(list)
+        for idx in range(start, size):
+            for tag_id in self._entry_tags[idx]:
+                tag_id_lists[tag_id].append(idx)
+        for tag_id, ids in tag_id_lists.items():
+            tag = self.tag_names[tag_id]
+            self.tag_bits[tag] = self.tag_bits.get(tag, 0) | make_bitset(ids, size)
+        self.form_tables = {
+            key: table + self._make_form_table(key, start)
+            for key, table in self.form_tables.items()
+        }
+        self._constraint_index = {}
+        self.generation += 1
 
     def add_entry(self, entry: TWordListEntry) -> None:
         """Add a single entry to the word list.
 
         The `entry` argument should have the same keys as the current CSV file format
         (see :attr:`csv_format`).
-        If `entry` values are omitted or `None`, they are passed to
-        :meth:`_process_entry` in order to compute a default.
+        If `entry` values are omitted or `None`, computable word forms get a
+        default value on first access (see :meth:`get_column`).
         If `entry` values are set to `False`, they are considered 'not available'.
         For example There is no `plural` form of 'information'.
 
+        An existing entry with the same lemma is replaced.
+
         Callers should also call :meth:`update_data` later, to make sure that
-        :attr:`key_list` is up-to-date.
+        the tag and word form indexes are up-to-date.
 
         Args:
             entry (dict): Word data.
         """
-        lemma = entry["lemma"]
-        self.data[lemma] = entry
-        self._process_entry(lemma, entry)
+        lemma = sys.intern(entry["lemma"])
+        self._filter_cache.clear()
+        idx = self.key_index.get(lemma)
+        if idx is None:
+            idx = self.key_index[lemma] = len(self.key_list)
+            for column in self.columns.values():
+                column.append(None)
+            self._entry_tags.append(())
+        for name, column in self.columns.items():
+            value = entry.get(name)
+            column[idx] = sys.intern(value) if type(value) is str else value
+
+        self._entry_tags[idx] = self._get_tag_set(entry.get("tags"))
+
+    def _get_tag_set(self, tags: Optional[Iterable[str]]) -> tuple[int, ...]:
+        """Return a shared, sorted tuple of tag ids for tag names."""
+        if not tags:
+            return ()
+        tag_ids = []
+        for tag in tags:
+            tag_id = self._tag_ids.get(tag)
+            if tag_id is None:
+                tag_id = self._tag_ids[tag] = len(self.tag_names)
+                self.tag_names.append(sys.intern(tag))
+            tag_ids.append(tag_id)
+        tag_ids = tuple(sorted(tag_ids))
+        return self._tag_sets.setdefault(tag_ids, tag_ids)
+
+    def add_entries(
+        self, entries: Iterable[TWordListEntry], *, on_conflict: str = "replace"
+    ) -> ImportResult:
+        """Add many entries and update the indexes once at the end.
+
+        `entries` is consumed lazily, so it may be a generator that reads a
+        large file (see :func:`fabulist.importer.import_file`).
+
+        If a lemma is already known (or occurs repeatedly), the entry is
+        skipped as *duplicate* if it does not add any value or tag.
+        Otherwise it is a *conflict*, which is resolved according to
+        `on_conflict`:
+
+        - 'replace': replace the existing entry (like :meth:`add_entry`).
+        - 'keep': keep the existing entry.
+        - 'merge': add the tags and the values that are not `None`.
+        - 'error': raise `ValueError` (entries that were added before are
+          kept and indexed).
+
+        Args:
+            entries (iterable of dict): Word data, see :meth:`add_entry`.
+            on_conflict (str, optional): Default: 'replace'.
+        Returns:
+            :class:`ImportResult`: Counts of added, updated, duplicate, and
+            conflicting entries.
+        """
+        if on_conflict not in ("replace", "keep", "merge", "error"):
+            raise ValueError(f"Invalid on_conflict: {on_conflict!r}")
+        start = len(self.key_list)
+        incremental = bool(start and self.generation)
+        key_index = self.key_index
+        add_entry = self.add_entry
+        intern = sys.intern
+        appenders = [(name, column.append) for name, column in self.columns.items()]
+        entry_tags = self._entry_tags
+        get_tag_set = self._get_tag_set
+        # Imported entries often share the same (immutable) tags instance
+        last_tags = last_tag_set = ()
+        self._filter_cache.clear()
+        added = updated = duplicates = conflicts = 0
+        samples = []
+        try:
+            for entry in entries:
+                lemma = entry["lemma"]
+                idx = key_index.get(lemma)
+                if idx is None:
+                    # Inlined add_entry() for new entries
+                    key_index[intern(lemma)] = len(entry_tags)
+                    for name, append in appenders:
+                        value = entry.get(name)
+                        append(intern(value) if type(value) is str else value)
+                    tags = entry.get("tags")
+                    if tags is not last_tags:
+                        tag_set = get_tag_set(tags)
+                        if type(tags) is frozenset:
+                            last_tags, last_tag_set = tags, tag_set
+                    else:
+                        tag_set = last_tag_set
+                    entry_tags.append(tag_set)
+                    added += 1
+                    continue
+                merged = self._merge_entry(idx, entry)
+                if merged is None:
+                    duplicates += 1
+                    continue
+                conflicts += 1
+                if len(samples) < 100:
+                    samples.append(entry["lemma"])
+                if on_conflict == "keep":
+                    continue
+                elif on_conflict == "error":
+                    raise ValueError(
+                        f"Entry {entry} conflicts with {self.get_entry(idx)}"
+                    )
+                add_entry(merged if on_conflict == "merge" else entry)
+                updated += 1
+                incremental = False
+        finally:
+            if incremental:
+                self._merge_data(start)
+            else:
+                self.update_data()
+        return ImportResult(added, updated, duplicates, conflicts, tuple(samples))
+
+    def _merge_entry(
+        self, entry_id: int, entry: TWordListEntry
+    ) -> Optional[TWordListEntry]:
+        """Return an existing entry, updated with new values and tags.
+
+        Returns `None` if `entry` does not add a value (that is not `None`) or
+        a tag.
+        """
+        current = self.get_entry(entry_id)
+        merged = current.copy()
+        for name in current:
+            if name == "tags":
+                continue
+            value = entry.get(name)
+            if value is not None and value != current[name]:
+                merged[name] = value
         tags = entry.get("tags")
-        if tags:
-            for tag in tags:
-                self.tag_map[tag].add(lemma)
+        current_tags = current.get("tags") or set()
+        if tags and not current_tags.issuperset(tags):
+            merged["tags"] = current_tags.union(tags)
+        if merged == current:
+            return None
+        return merged
 
     def load(self, path: Optional[str] = None) -> None:
         """Load and add list of entries from text file.
 
         Normally, we don't have to call this method explicitly, because entries
         are loaded lazily on demand.
-        It may be useful however to add supplemental word  lists however.
+        It may be useful however to add supplemental word  lists however
+        (see also :meth:`load_additional`).
 
-        This method also calls :meth:`update_data`.
+        This method also updates the indexes. If entries are only appended to
+        a loaded list, only the new entries are indexed (see
+        :meth:`_merge_data`), otherwise :meth:`update_data` is called.
+
+        If :attr:`snapshot_dir` is set and the list is empty, the processed
+        data is restored from a snapshot of the CSV file. Missing or stale
+        snapshots are (re-)written after parsing.
 
         Args:
             path (str, optional): path to CSV file. Defaults to :attr:`path`.
@@ -382,33 +1564,202 @@ class _WordList:
         if path is None:
             path = self.path
 
-        for entry in self._iter_file(path):
-            self.add_entry(entry)
-        self.update_data()
+        is_initial = not self.key_list and path == self.path
+        use_snapshot = bool(self.snapshot_dir) and not self.key_list
+        kind = self.__class__.__name__
+        if use_snapshot:
+            state = snapshot.read_snapshot(self.snapshot_dir, path, kind)
+            if state is not None:
+                self._set_state(state)
+                if is_initial:
+                    self._load_generation = self.generation
+                return
+
+        self.add_entries(self._iter_file(path))
         # print("Loaded {}".format(self))
+        if use_snapshot:
+            snapshot.write_snapshot(self.snapshot_dir, path, kind, self._get_state())
+        if is_initial:
+            self._load_generation = self.generation
 
-    def save_as(self, path: str) -> None:
-        """Write current data to a text file.
+    def load_additional(self, path: str, source: Optional[str] = None) -> int:
+        """Merge a supplemental word list into this list.
 
-        The resulting CSV file has the format as defined in :attr:`csv_format`.
-        For better compression, word forms that are computable are stored as empty
-        strings ('').
-        Comments from the original file are retained at the top.
+        Supplemental list files have the same format as the main list, but
+        may omit all columns except the lemma.
+        Entries are appended and indexed incrementally. They are tagged with
+        the source name, so they can be selected (e.g. `$(noun:#computer)`)
+        and removed again with :meth:`unload_additional`. Lemmas that are
+        already known are skipped.
 
         Args:
-            path (str): path to CSV file.
+            path (str): Path to the CSV file.
+            source (str, optional): Name of the supplemental list. Defaults to
+                the file name without extension.
+        Returns:
+            int: The number of added entries.
+        Raises:
+            ValueError: if a list with this source name is already loaded.
         """
-        self.update_data()
-        with open(path, "w") as fs:
-            for line in self.file_comments:
-                fs.write(line + "\n")
-            for lemma in sorted(self.key_list, key=str.lower):
-                entry = self.data[lemma]
-                # Squash values to "" if they are reproducible
-                self._un_process_entry(lemma, entry)
-                line = []
-                for attr in self.csv_format:
-                    value = entry.get(attr)
+        if source is None:
+            source = os.path.splitext(os.path.basename(path))[0]
+        source = source.lower()
+        if source in self.sources:
+            raise ValueError(f"{self} already contains '{source}'.")
+        if not self.data:
+            self.load()
+        start = len(self.key_list)
+        key_index = self.key_index
+        lemmas = []
+        for entry in self._iter_file(path, supplemental=True):
+            lemma = entry["lemma"]
+            if lemma in key_index:
+                continue
+            entry["tags"] = (entry.get("tags") or set()) | {source}
+            self.add_entry(entry)
+            lemmas.append(self.key_list[-1])
+        self.sources[source] = lemmas
+        self.source_paths[source] = path
+        self._merge_data(start)
+        _logger.info(f"Added {len(lemmas)} entries from {path} to {self}")
+        return len(lemmas)
+
+    def unload_additional(self, source: str) -> int:
+        """Remove the entries that were added by :meth:`load_additional`.
+
+        If the list was the last one that was loaded, the entries are simply
+        truncated. Otherwise the remaining entries get new ids and all indexes
+        are rebuilt.
+
+        Args:
+            source (str): Name of the supplemental list.
+        Returns:
+            int: The number of removed entries.
+        Raises:
+            ValueError: if no list with this source name is loaded.
+        """
+        lemmas = self.sources.pop(source.lower(), None)
+        if lemmas is None:
+            raise ValueError(f"{self} does not contain '{source}'.")
+        self.source_paths.pop(source.lower(), None)
+        key_index = self.key_index
+        for lemma in lemmas:
+            del key_index[lemma]
+        start = len(self.key_list) - len(lemmas)
+        if self.key_list[start:] == lemmas:
+            # The supplemental entries are the last ones
+            self._truncate(start)
+        else:
+            removed = set(lemmas)
+            keep = [
+                idx for idx, lemma in enumerate(self.key_list) if lemma not in removed
+            ]
+            for column in self.columns.values():
+                column[:] = [column[idx] for idx in keep]
+            self._entry_tags[:] = [self._entry_tags[idx] for idx in keep]
+            key_index.clear()
+            key_index.update((lemma, idx) for idx, lemma in enumerate(self.key_list))
+            self.update_data()
+        return len(lemmas)
+
+    def get_source_files(self) -> list[str]:
+        """Return the text files that this list is loaded from.
+
+        This includes supplemental lists (see :meth:`load_additional`).
+        Lists that cannot be re-created by :meth:`reloaded` return an empty
+        list.
+        """
+        files = [self.path] if self.path else []
+        files.extend(self.source_paths.values())
+        return files
+
+    def reloaded(self) -> "_WordList":
+        """Return a new, loaded list that reads the current source files.
+
+        Supplemental lists are loaded again, but entries that were added by
+        :meth:`add_entry` are not copied. This list is not modified, so it can
+        be used while the new list is built (see
+        :class:`fabulist.watcher.WordListWatcher`).
+        """
+        word_list = self._new_empty()
+        word_list.path = self.path
+        word_list.snapshot_dir = self.snapshot_dir
+        word_list.load()
+        for source, path in self.source_paths.items():
+            word_list.load_additional(path, source)
+        return word_list
+
+    def is_loaded(self) -> bool:
+        """Return True if the list contains entries."""
+        return bool(self.key_list)
+
+    def unload(self) -> bool:
+        """Remove all entries from memory.
+
+        The list is loaded again on next use (from a snapshot, if
+        :attr:`snapshot_dir` is set). Compiled templates re-bind, because
+        :attr:`generation` changes.
+        Lists that cannot be re-created from their files are kept, i.e. lists
+        with supplemental lists or entries that were added or modified after
+        loading (see :class:`fabulist.budget.MemoryBudget`).
+
+        Returns:
+            bool: True if the entries were removed.
+        """
+        if not self._can_unload():
+            return False
+        empty = self._new_empty()
+        empty.update_data()
+        self._set_state(empty._get_state())
+        self._load_generation = None
+        return True
+
+    def _can_unload(self) -> bool:
+        return bool(
+            self.get_source_files()
+            and not self.sources
+            and self.generation == self._load_generation
+        )
+
+    def _get_state(self) -> dict:
+        """Return the processed data, so it can be stored in a snapshot."""
+        return {name: getattr(self, name) for name in self._state_attrs}
+
+    def _set_state(self, state: dict) -> None:
+        """Restore the processed data from :meth:`_get_state`."""
+        for name in self._state_attrs:
+            setattr(self, name, state[name])
+        self.key_list = self.columns["lemma"]
+        self._tag_sets = {tag_ids: tag_ids for tag_ids in self._entry_tags}
+        self._filter_cache.clear()
+        self.form_tables = {}
+        self._constraint_index = {}
+        self.generation += 1
+
+    def save_as(self, path: str) -> None:
+        """Write current data to a text file.
+
+        The resulting CSV file has the format as defined in :attr:`csv_format`.
+        For better compression, word forms that are computable are stored as empty
+        strings ('').
+        Comments from the original file are retained at the top.
+
+        Args:
+            path (str): path to CSV file.
+        """
+        self.update_data()
+        csv_format = self.csv_format
+        optional = self.optional_columns
+        with open(path, "w") as fs:
+            for line in self.file_comments:
+                fs.write(line + "\n")
+            for lemma in sorted(self.data, key=str.lower):
+                entry = self.data[lemma]
+                # Squash values to "" if they are reproducible
+                self._un_process_entry(lemma, entry)
+                line = []
+                for attr in csv_format:
+                    value = entry.get(attr)
                     if attr == "tags":
                         if value:
                             value = "|".join(sorted(list(value)))
@@ -421,6 +1772,9 @@ class _WordList:
                             value = "-"
 
                     line.append(value)
+                # Omit trailing empty optional columns
+                while line[-1] == "" and csv_format[len(line) - 1] in optional:
+                    line.pop()
                 fs.write(",".join(line) + "\n")
         return
 
@@ -438,9 +1792,9 @@ class AdjList(_WordList):
     """
 
     word_type = "adj"
-    csv_format = ("lemma", "comp", "super", "antonym", "tags")
+    csv_format = ("lemma", "comp", "super", "antonym", "tags", "an")
     computable_modifiers = frozenset(("comp", "super"))
-    form_modifiers = frozenset(csv_format).difference(("tags",))
+    form_modifiers = frozenset(csv_format).difference(("tags", "an"))
     extra_modifiers = frozenset(("an",))
     all_modifiers = form_modifiers.union(extra_modifiers)
 
@@ -461,9 +1815,9 @@ class AdvList(_WordList):
     """
 
     word_type = "adv"
-    csv_format = ("lemma", "comp", "super", "antonym", "tags")
+    csv_format = ("lemma", "comp", "super", "antonym", "tags", "an")
     computable_modifiers = frozenset(("comp", "super"))
-    form_modifiers = frozenset(csv_format).difference(("tags",))
+    form_modifiers = frozenset(csv_format).difference(("tags", "an"))
     extra_modifiers = frozenset(("an",))
     all_modifiers = form_modifiers.union(extra_modifiers)
 
@@ -481,6 +1835,7 @@ class FirstnameList(_WordList):
     """
 
     csv_format = ("lemma", "tags")
+    _state_attrs = _WordList._state_attrs + ("key_list_male", "key_list_female")
 
     def __init__(self, path: str):
         super().__init__(path)
@@ -488,9 +1843,25 @@ class FirstnameList(_WordList):
     def update_data(self) -> None:
         """Update internal structures after entries have been added or modified."""
         super().update_data()
+        self._update_gender_lists()
+
+    def _merge_data(self, start: int) -> None:
+        super()._merge_data(start)
+        self._update_gender_lists()
+
+    def _truncate(self, size: int) -> None:
+        super()._truncate(size)
+        self._update_gender_lists()
+
+    def _update_gender_lists(self) -> None:
         # Convert to lists for efficient access
-        self.key_list_male = list(self.tag_map["m"])
-        self.key_list_female = list(self.tag_map["f"])
+        key_list = self.key_list
+        self.key_list_male = [
+            key_list[idx] for idx in iter_bitset(self.tag_bits.get("m", 0))
+        ]
+        self.key_list_female = [
+            key_list[idx] for idx in iter_bitset(self.tag_bits.get("f", 0))
+        ]
 
 
 # ------------------------------------------------------------------------------
@@ -550,23 +1921,38 @@ class NameList(_WordList):
     def load(self, path: Optional[str] = None) -> None:
         """Load and add list of entries from text file."""
         assert path is None
-        self.firstname_list.load()
-        self.lastname_list.load()
+        for word_list in (self.firstname_list, self.lastname_list):
+            word_list.snapshot_dir = self.snapshot_dir
+            word_list.load()
+
+    @staticmethod
+    def _get_genders(macro: Macro) -> tuple[str, ...]:
+        """Return the genders ('m', 'f') that match the tag query of a macro.
+
+        A generated name has exactly one gender tag, so e.g. `#!f` selects
+        male names and `#m&f` does not match any name.
+
+        Raises:
+            ValueError: if no gender matches.
+        """
+        if not macro.tag_query:
+            return ("m", "f")
+        genders = tuple(g for g in ("m", "f") if match_tag_query(macro.tag_query, (g,)))
+        if not genders:
+            raise ValueError(f"Tag query does not match any name: {macro}")
+        return genders
 
     def get_random_entry(self, macro: Macro) -> TWordListEntry:
         if not self.firstname_list.data:
             self.load()
 
-        tags = macro.tags
-
-        # If neither m nor f are given, assume both
-        if bool("m" in tags) == bool("f" in tags):
+        genders = self._get_genders(macro)
+        if len(genders) > 1:
             # If both genders are allowed, we have to randomize here, because
             # the resulting firstname may be ambigous
             is_male = bool(random.getrandbits(1))
         else:
-            # The modifier contains either 'm' or 'f' (not both)
-            is_male = "m" in tags
+            is_male = genders[0] == "m"
 
         if is_male:
             first_name_list = self.firstname_list.key_list_male
@@ -587,6 +1973,118 @@ class NameList(_WordList):
 
         return entry
 
+    def get_picker(
+        self, macro: Macro, extra_forms: Iterable[str] = ()
+    ) -> Callable[[], TWordListEntry]:
+        # Names are assembled from two lists, so we cannot pre-filter a key list.
+        # The generated entry dicts are used as entry ids.
+        self._get_genders(macro)  # Validate the tag query
+        return functools.partial(self.get_random_entry, macro)
+
+    def get_formatter(self, macro: Macro) -> Callable[[TWordListEntry], str]:
+        apply = functools.partial(self.apply_macro, macro)
+        if macro.is_caps:
+            return lambda entry: apply(entry).capitalize()
+        return apply
+
+    def get_entry(self, entry_id: TWordListEntry) -> TWordListEntry:
+        return entry_id
+
+    def get_initial(self, entry_id: TWordListEntry) -> str:
+        return get_initial(entry_id["first"])
+
+    def get_rhyme(self, entry_id: TWordListEntry, word_form: str = "lemma") -> str:
+        return get_rhyme(entry_id["last"])
+
+    def get_source_files(self) -> list[str]:
+        return [
+            path
+            for word_list in (self.firstname_list, self.lastname_list)
+            for path in word_list.get_source_files()
+        ]
+
+    def reloaded(self) -> "NameList":
+        """Return a new, loaded list that reads the current source files.
+
+        Both sub-lists are reloaded from their own paths (including
+        supplemental lists), so custom first and last name files are kept.
+        Sub-lists that cannot be re-created from files are shared.
+        """
+        name_list = self._new_empty()
+        name_list.snapshot_dir = self.snapshot_dir
+        for attr in ("middle_initials", "middle_name_probability"):
+            if attr in vars(self):
+                setattr(name_list, attr, getattr(self, attr))
+        for attr in ("firstname_list", "lastname_list"):
+            word_list = getattr(self, attr)
+            if word_list.get_source_files():
+                word_list = word_list.reloaded()
+            setattr(name_list, attr, word_list)
+        return name_list
+
+    def is_loaded(self) -> bool:
+        return self.firstname_list.is_loaded() or self.lastname_list.is_loaded()
+
+    def unload(self) -> bool:
+        # Both lists must be unloaded, because `load()` loads both
+        word_lists = (self.firstname_list, self.lastname_list)
+        if not all(word_list._can_unload() for word_list in word_lists):
+            return False
+        for word_list in word_lists:
+            word_list.unload()
+        return True
+
+    def analyze_macro(
+        self, macro: Macro, ref_macros: Sequence[Macro] = ()
+    ) -> tuple[int, float]:
+        if not self.firstname_list.data:
+            self.load()
+        genders = self._get_genders(macro)
+
+        # Collect the name parts that are rendered by the macro or its references
+        used = set()
+        for m in (macro, *ref_macros):
+            modifiers = m.modifiers
+            if bool("first" in modifiers) == bool("last" in modifiers):
+                used.update(("first", "last"))
+            used.update(modifiers.intersection(("first", "last", "middle", "mr")))
+
+        first_name_lists = {
+            "m": self.firstname_list.key_list_male,
+            "f": self.firstname_list.key_list_female,
+        }
+        n_last = len(self.lastname_list.key_list) if "last" in used else 1
+        if "middle" in used:
+            n_middle = 1 + len(self.middle_initials)
+            p = self.middle_name_probability
+            bits_middle = get_entropy(
+                [1 - p] + [p / len(self.middle_initials)] * len(self.middle_initials)
+            )
+        else:
+            n_middle, bits_middle = 1, 0.0
+
+        if "mr" in used:
+            # The title distinguishes genders
+            n_first = sum(
+                len(first_name_lists[g]) if "first" in used else 1 for g in genders
+            )
+        elif "first" in used:
+            n_first = len(set().union(*(first_name_lists[g] for g in genders)))
+        else:
+            n_first = 1
+
+        bits_gender = math.log2(len(genders))
+        if "first" in used:
+            bits_first = sum(
+                math.log2(len(first_name_lists[g])) for g in genders
+            ) / len(genders)
+        else:
+            bits_first = 0.0
+        bits = bits_first + math.log2(n_last) + bits_middle
+        if "mr" in used or "first" in used:
+            bits += bits_gender
+        return n_first * n_last * n_middle, bits
+
     def apply_macro(self, macro: Macro, entry: TWordListEntry) -> str:
         # Build a name from the requested modifiers
         modifiers = macro.modifiers
@@ -619,9 +2117,9 @@ class NounList(_WordList):
     """
 
     word_type = "noun"
-    csv_format = ("lemma", "plural", "tags")
+    csv_format = ("lemma", "plural", "tags", "an")
     computable_modifiers = frozenset(("plural",))
-    form_modifiers = frozenset(csv_format).difference(("tags",))
+    form_modifiers = frozenset(csv_format).difference(("tags", "an"))
     extra_modifiers = frozenset(("an",))
     all_modifiers = form_modifiers.union(extra_modifiers)
 
@@ -642,9 +2140,9 @@ class VerbList(_WordList):
     """
 
     word_type = "verb"
-    csv_format = ("lemma", "past", "pp", "s", "ing", "tags")
+    csv_format = ("lemma", "past", "pp", "s", "ing", "tags", "an")
     computable_modifiers = frozenset(("pp", "s", "ing"))
-    form_modifiers = frozenset(csv_format).difference(("tags",))
+    form_modifiers = frozenset(csv_format).difference(("tags", "an"))
     extra_modifiers = frozenset(("an",))
     all_modifiers = form_modifiers.union(extra_modifiers)
 
@@ -652,21 +2150,1399 @@ class VerbList(_WordList):
         super().__init__(path)
 
 
+# ------------------------------------------------------------------------------
+# Custom word types
+# ------------------------------------------------------------------------------
+#: Word forms that can be computed by :func:`get_default_word_form`
+DEFAULT_WORD_FORMS = frozenset(("comp", "super", "plural", "pp", "s", "ing"))
+
+#: Word types that are used by other macros, e.g. `$(num:0,99)`
+RESERVED_WORD_TYPES = frozenset(("num", "pick", "rule", "var"))
+
+
+def make_word_list_class(
+    word_type: str,
+    csv_format: Sequence[str] = ("lemma", "tags"),
+    *,
+    computable_modifiers: Iterable[str] = (),
+    extra_modifiers: Iterable[str] = (),
+) -> type:
+    """Return a new :class:`_WordList` subclass for a custom word type.
+
+    Instances behave like the built-in lists (e.g. :class:`NounList`): they
+    are loaded on demand and support tag filters, word-form modifiers,
+    constraints like `:len<=5`, snapshots, and overlays.
+    See :meth:`Fabulist.register_word_type`.
+
+    Args:
+        word_type (str): Lowercase name, e.g. 'city'.
+        csv_format (tuple[str]): Column names of the text file. The first
+            column must be 'lemma'. Other columns (except 'tags' and 'an')
+            are available as word-form modifiers, e.g. `$(city:country)`.
+            Default: ('lemma', 'tags').
+        computable_modifiers (iterable of str, optional): Columns that get a
+            default value if they are empty, e.g. 'plural' (see
+            :data:`DEFAULT_WORD_FORMS`).
+        extra_modifiers (iterable of str, optional): 'an' to support the
+            `:an` modifier.
+    Raises:
+        ValueError: if the name or a column is invalid.
+    """
+    if not re.fullmatch(r"[a-z][a-z0-9_]*", word_type or ""):
+        raise ValueError(f"Invalid word type name: {word_type!r}")
+    csv_format = tuple(csv_format)
+    if not csv_format or csv_format[0] != "lemma":
+        raise ValueError(f"The first column must be 'lemma': {csv_format}")
+    if len(set(csv_format)) != len(csv_format) or not all(
+        re.fullmatch(r"[a-z][a-z0-9_]*", name) for name in csv_format
+    ):
+        raise ValueError(f"Invalid column names: {csv_format}")
+    computable_modifiers = frozenset(computable_modifiers)
+    extra_modifiers = frozenset(extra_modifiers)
+    form_modifiers = frozenset(csv_format).difference(("tags", "an"))
+    if not computable_modifiers.issubset(form_modifiers & DEFAULT_WORD_FORMS):
+        raise ValueError(
+            f"Computable modifiers must be columns and one of {set(DEFAULT_WORD_FORMS)}"
+        )
+    if "pp" in computable_modifiers and "past" not in csv_format:
+        raise ValueError("Computing 'pp' requires a 'past' column.")
+    if not extra_modifiers.issubset(("an",)):
+        raise ValueError(f"Unsupported extra modifiers: {set(extra_modifiers)}")
+    attrs = {
+        "__doc__": f"Implement a collection of '{word_type}' words.",
+        "word_type": word_type,
+        "csv_format": csv_format,
+        "computable_modifiers": computable_modifiers,
+        "form_modifiers": form_modifiers,
+        "extra_modifiers": extra_modifiers,
+        "all_modifiers": form_modifiers.union(extra_modifiers),
+        # Files may omit all columns except the lemma
+        "optional_columns": frozenset(csv_format[1:]),
+        # Used to re-create the class from a store file
+        "_spec": {
+            "word_type": word_type,
+            "csv_format": list(csv_format),
+            "computable_modifiers": sorted(computable_modifiers),
+            "extra_modifiers": sorted(extra_modifiers),
+        },
+    }
+    name = "{}List".format("".join(part.title() for part in word_type.split("_")))
+    return type(name, (_WordList,), attrs)
+
+
+#: Entry point group of packages that provide word types, see
+#: :meth:`Fabulist.register_word_type`
+WORD_TYPE_ENTRY_POINT_GROUP = "fabulist.word_types"
+
+
+@functools.cache
+def get_word_type_plugins() -> tuple[Callable, ...]:
+    """Return the registration functions of installed word type packages.
+
+    Packages declare them in the `fabulist.word_types` entry point group, e.g.
+    in `pyproject.toml`::
+
+        [project.entry-points."fabulist.word_types"]
+        city = "fabulist_cities:register"
+
+    where `register(fab)` calls :meth:`Fabulist.register_word_type`.
+    Entry points are discovered and imported once per process. Plugins that
+    cannot be imported are logged and skipped.
+    """
+    from importlib.metadata import entry_points
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=WORD_TYPE_ENTRY_POINT_GROUP)
+    else:
+        # Python 3.9
+        eps = eps.get(WORD_TYPE_ENTRY_POINT_GROUP, ())
+    plugins = []
+    for ep in sorted(eps, key=lambda ep: ep.name):
+        try:
+            plugins.append(ep.load())
+        except Exception:
+            _logger.exception(f"Could not load word type plugin {ep.name!r}")
+    return tuple(plugins)
+
+
+# ------------------------------------------------------------------------------
+# OverlayWordList
+# ------------------------------------------------------------------------------
+class _OverlayKeyList(Sequence):
+    """Lemmas of an :class:`OverlayWordList`, indexed by entry id.
+
+    Entry ids of the base list are kept, and added entries follow. Removed
+    entries are still contained (see :attr:`OverlayWordList.key_index`).
+    """
+
+    __slots__ = ("_overlay",)
+
+    def __init__(self, overlay: "OverlayWordList"):
+        self._overlay = overlay
+
+    def __len__(self) -> int:
+        overlay = self._overlay
+        return len(overlay.base.key_list) + len(overlay.delta.key_list)
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[str, list[str]]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        base_list = self._overlay.base.key_list
+        if idx < len(base_list):
+            return base_list[idx]
+        return self._overlay.delta.key_list[idx - len(base_list)]
+
+
+class _OverlayKeyIndex(Mapping):
+    """Maps lemmas of an :class:`OverlayWordList` to entry ids."""
+
+    __slots__ = ("_overlay",)
+
+    def __init__(self, overlay: "OverlayWordList"):
+        self._overlay = overlay
+
+    def __getitem__(self, lemma: str) -> int:
+        overlay = self._overlay
+        base_list = overlay.base.key_list
+        idx = overlay.delta.key_index.get(lemma)
+        if idx is not None:
+            return len(base_list) + idx
+        idx = overlay.base.key_index[lemma]
+        if idx in overlay.removed:
+            raise KeyError(lemma)
+        return idx
+
+    def __iter__(self) -> Iterator[str]:
+        overlay = self._overlay
+        removed = overlay.removed
+        for idx, lemma in enumerate(overlay.base.key_list):
+            if idx not in removed:
+                yield lemma
+        yield from overlay.delta.key_list
+
+    def __len__(self) -> int:
+        overlay = self._overlay
+        return (
+            len(overlay.base.key_list)
+            - len(overlay.removed)
+            + len(overlay.delta.key_list)
+        )
+
+
+class OverlayWordList(_WordList):
+    """A copy-on-write view of a shared word list.
+
+    Entries can be added, replaced, re-tagged, and removed, but the base list
+    is never modified. Changes are kept in a small :attr:`delta` list and a
+    set of :attr:`removed` entry ids, so creating an overlay is cheap and
+    does not copy the base data.
+    Random picks sample the (cached) candidates of the base list and skip
+    removed entries, so they stay O(1) on average.
+
+    Note:
+        Entries that are appended to the base list (e.g. by
+        :meth:`_WordList.load_additional`) become visible in the overlay.
+        Removing entries from the base list invalidates the overlay.
+
+    Args:
+        base (:class:`_WordList`): The shared word list.
+    Attributes:
+        base (:class:`_WordList`): The shared word list.
+        delta (:class:`_WordList`): Added and replaced entries. Their entry
+            ids start at `len(base.key_list)`.
+        removed (set): Ids of removed (or replaced) entries of the base list.
+    """
+
+    def __init__(self, base: _WordList):
+        if isinstance(base, OverlayWordList):
+            raise ValueError(f"Cannot create an overlay of an overlay: {base}")
+        for name in (
+            "word_type",
+            "csv_format",
+            "computable_modifiers",
+            "form_modifiers",
+            "extra_modifiers",
+            "all_modifiers",
+            "optional_columns",
+        ):
+            setattr(self, name, getattr(base, name))
+        self.path: Optional[str] = base.path
+        self.base: _WordList = base
+        self.delta: _WordList = base._new_empty()
+        self.removed: set[int] = set()
+        self.data: Mapping[str, TWordListEntry] = _WordListData(self)
+        self.key_list: Sequence[str] = _OverlayKeyList(self)
+        self.key_index: Mapping[str, int] = _OverlayKeyIndex(self)
+        self._filter_cache: dict[tuple[TTagQuery, frozenset], list[int]] = {}
+        self._cache_generation: int = -1
+        self.filter_cache_hits: int = 0
+        self.filter_cache_misses: int = 0
+        self.sources: dict[str, list[str]] = {}
+        self.source_paths: dict[str, str] = {}
+        self.snapshot_dir: Optional[str] = None
+        self._generation: int = 0
+
+    def __repr__(self) -> str:
+        n_added = len(self.delta.key_list)
+        return (
+            f"{self.__class__.__name__}({self.base}, +{n_added}, -{len(self.removed)})"
+        )
+
+    @property
+    def generation(self) -> int:
+        """Changes when the base list or the overlay is updated."""
+        return self.base.generation + self._generation
+
+    @property
+    def file_comments(self) -> list[str]:
+        return self.base.file_comments
+
+    @property
+    def tag_map(self) -> dict[str, set]:
+        base_list = self.base.key_list
+        removed_lemmas = {base_list[idx] for idx in self.removed}
+        tag_map = defaultdict(set)
+        for tag, lemmas in self.base.tag_map.items():
+            tag_map[tag] = lemmas - removed_lemmas
+        for tag, lemmas in self.delta.tag_map.items():
+            tag_map[tag] |= lemmas
+        return {tag: lemmas for tag, lemmas in tag_map.items() if lemmas}
+
+    def has_tag(self, tag: str) -> bool:
+        return self.base.has_tag(tag) or tag in self.delta.tag_bits
+
+    def _new_empty(self) -> _WordList:
+        return self.base._new_empty()
+
+    def load(self, path: Optional[str] = None) -> None:
+        """Load the base list (if necessary), or add entries from a text file.
+
+        Entries from `path` are added to the overlay. The file may omit all
+        columns except the lemma.
+        """
+        if path is None:
+            if not self.base.data:
+                self.base.load()
+            return
+        for entry in self._iter_file(path, supplemental=True):
+            self.add_entry(entry)
+        self.update_data()
+
+    def add_entry(self, entry: TWordListEntry) -> None:
+        """Add or replace an entry (the base list is not modified).
+
+        Callers should also call :meth:`update_data` later.
+        See :meth:`_WordList.add_entry`.
+        """
+        idx = self.base.key_index.get(entry["lemma"])
+        if idx is not None:
+            self.removed.add(idx)
+        self.delta.add_entry(entry)
+        self._filter_cache.clear()
+
+    def add_entries(
+        self, entries: Iterable[TWordListEntry], *, on_conflict: str = "replace"
+    ) -> ImportResult:
+        """Add many entries to the overlay (the base list is not modified).
+
+        Entries are added with :meth:`add_entry`, existing lemmas are handled
+        as described in :meth:`_WordList.add_entries`.
+        """
+        if on_conflict not in ("replace", "keep", "merge", "error"):
+            raise ValueError(f"Invalid on_conflict: {on_conflict!r}")
+        if not self.base.data:
+            self.base.load()
+        key_index = self.key_index
+        added = updated = duplicates = conflicts = 0
+        samples = []
+        try:
+            for entry in entries:
+                idx = key_index.get(entry["lemma"])
+                if idx is None:
+                    self.add_entry(entry)
+                    added += 1
+                    continue
+                merged = self._merge_entry(idx, entry)
+                if merged is None:
+                    duplicates += 1
+                    continue
+                conflicts += 1
+                if len(samples) < 100:
+                    samples.append(entry["lemma"])
+                if on_conflict == "keep":
+                    continue
+                elif on_conflict == "error":
+                    raise ValueError(
+                        f"Entry {entry} conflicts with {self.get_entry(idx)}"
+                    )
+                self.add_entry(merged if on_conflict == "merge" else entry)
+                updated += 1
+        finally:
+            self.update_data()
+        return ImportResult(added, updated, duplicates, conflicts, tuple(samples))
+
+    def remove_entry(self, lemma: str) -> None:
+        """Remove an entry (the base list is not modified).
+
+        Raises:
+            KeyError: if the lemma is unknown.
+        """
+        if lemma not in self.key_index:
+            raise KeyError(lemma)
+        self._remove_lemmas({lemma})
+
+    def set_tags(self, lemma: str, tags: Optional[Iterable[str]]) -> None:
+        """Replace the tags of an entry (the base list is not modified).
+
+        Raises:
+            KeyError: if the lemma is unknown.
+        """
+        entry = self.data[lemma]
+        entry["tags"] = set(tags) if tags else None
+        self.add_entry(entry)
+        self.update_data()
+
+    def unload_additional(self, source: str) -> int:
+        lemmas = self.sources.pop(source.lower(), None)
+        if lemmas is None:
+            raise ValueError(f"{self} does not contain '{source}'.")
+        self.source_paths.pop(source.lower(), None)
+        self._remove_lemmas(set(lemmas))
+        return len(lemmas)
+
+    def get_source_files(self) -> list[str]:
+        # Overlays are derived at runtime, not loaded from files
+        return []
+
+    def _remove_lemmas(self, lemmas: set[str]) -> None:
+        base_index = self.base.key_index
+        for lemma in lemmas:
+            idx = base_index.get(lemma)
+            if idx is not None:
+                self.removed.add(idx)
+        delta = self.delta
+        if any(lemma in delta.key_index for lemma in lemmas):
+            # The delta is small, so we simply rebuild it
+            self.delta = self._new_empty()
+            for lemma in delta.key_list:
+                if lemma not in lemmas:
+                    self.delta.add_entry(delta.data[lemma])
+        self.update_data()
+
+    def update_data(self) -> None:
+        """Update internal structures after entries have been added or modified."""
+        self.delta.update_data()
+        self._filter_cache.clear()
+        self._generation += 1
+
+    def _merge_data(self, start: int) -> None:
+        self.update_data()
+
+    def _check_tags(self, tags: TTagQuery) -> None:
+        for term in tags:
+            for tag, _negate in term:
+                if not self.has_tag(tag):
+                    raise ValueError(
+                        f"{self.base.__class__.__name__} has no entries for tag '{tag}'"
+                    )
+
+    def _get_base_ids(
+        self, tags: TTagQuery, word_forms: frozenset, **constraints
+    ) -> Sequence[int]:
+        """Return ids of base entries that match (including removed entries)."""
+        base = self.base
+        if not base.data:
+            base.load()
+        # Tags that are only used by the overlay match no base entry
+        base_query = []
+        for term in tags:
+            if all(negate or base.has_tag(tag) for tag, negate in term):
+                base_query.append(
+                    tuple((tag, negate) for tag, negate in term if base.has_tag(tag))
+                )
+        if tags and not base_query:
+            return ()
+        return base._filter_ids(tuple(base_query), word_forms, **constraints)
+
+    def _get_delta_ids(
+        self,
+        tags: TTagQuery,
+        word_forms: frozenset,
+        *,
+        word_form: str = "lemma",
+        length: Optional[TLength] = None,
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+    ) -> list[int]:
+        """Return ids of added entries that match."""
+        delta = self.delta
+        size = len(self.base.key_list)
+        tag_names = delta.tag_names
+        constrained = length or initial or rhyme
+        res = []
+        for idx, tag_ids in enumerate(delta._entry_tags):
+            if tags and not match_tag_query(tags, {tag_names[t] for t in tag_ids}):
+                continue
+            if not all(delta._resolve_word_form(idx, f) for f in word_forms):
+                continue
+            if constrained and not match_constraints(
+                delta._resolve_word_form(idx, word_form), length, initial, rhyme
+            ):
+                continue
+            res.append(size + idx)
+        return res
+
+    def _get_query(
+        self, tags: Union[TTagQuery, set], word_forms: Iterable[str]
+    ) -> tuple[TTagQuery, frozenset]:
+        if isinstance(tags, (set, frozenset)):
+            tags = tuple(((tag, False),) for tag in sorted(tags))
+        self._check_tags(tags)
+        word_forms = frozenset(
+            f for f in word_forms if f in self.form_modifiers and f != "lemma"
+        )
+        return tags, word_forms
+
+    def _filter_ids(
+        self, tags: Union[TTagQuery, set], word_forms: Iterable[str] = (), **constraints
+    ) -> Sequence[int]:
+        """Return ids of entries that match the tags and have the word forms.
+
+        See :meth:`_WordList._filter_ids`. The result is a new (cached) list,
+        so prefer :meth:`get_picker` for random picks.
+        """
+        tags, word_forms = self._get_query(tags, word_forms)
+        if self._cache_generation != self.generation:
+            self._filter_cache.clear()
+            self._cache_generation = self.generation
+        cache_key = (tags, word_forms, tuple(sorted(constraints.items())))
+        ids = self._filter_cache.get(cache_key)
+        if ids is not None:
+            self.filter_cache_hits += 1
+            return ids
+        self.filter_cache_misses += 1
+
+        removed = self.removed
+        ids = [
+            idx
+            for idx in self._get_base_ids(tags, word_forms, **constraints)
+            if idx not in removed
+        ]
+        ids.extend(self._get_delta_ids(tags, word_forms, **constraints))
+        self._filter_cache[cache_key] = ids
+        return ids
+
+    def get_picker(
+        self, macro: Macro, extra_forms: Iterable[str] = ()
+    ) -> Callable[[], int]:
+        """Return a function that returns random entry ids, according to modifiers.
+
+        See :meth:`_WordList.get_picker`. Candidates of the base list are
+        shared; removed entries are rejected and re-drawn.
+        """
+        word_forms = set(extra_forms)
+        if macro.word_form:
+            word_forms.add(macro.word_form)
+        tags, word_forms = self._get_query(macro.tag_query, word_forms)
+        constraints = {}
+        if macro.length or macro.static_initial or macro.static_rhyme:
+            constraints = {
+                "word_form": macro.word_form or "lemma",
+                "length": macro.length,
+                "initial": macro.static_initial,
+                "rhyme": macro.static_rhyme,
+            }
+        base_ids = self._get_base_ids(tags, word_forms, **constraints)
+        delta_ids = self._get_delta_ids(tags, word_forms, **constraints)
+        removed = self.removed
+        n_base = len(base_ids)
+        n_removed = 0
+        for idx in removed:
+            pos = bisect.bisect_left(base_ids, idx)
+            if pos < n_base and base_ids[pos] == idx:
+                n_removed += 1
+        if n_base - n_removed + len(delta_ids) == 0:
+            raise ApplyTemplateError(
+                f"{self.__class__.__name__} has no entries that match {macro} "
+                f"(with forms {set(word_forms)})"
+            )
+        if not n_removed and not delta_ids:
+            return functools.partial(random.choice, base_ids)
+        if n_removed * 2 > n_base:
+            # Rejection sampling would be slow, so use a private list
+            return functools.partial(
+                random.choice, self._filter_ids(tags, word_forms, **constraints)
+            )
+
+        total = n_base + len(delta_ids)
+        randrange = random.randrange
+
+        def _pick() -> int:
+            while True:
+                pos = randrange(total)
+                if pos >= n_base:
+                    return delta_ids[pos - n_base]
+                idx = base_ids[pos]
+                if idx not in removed:
+                    return idx
+
+        return _pick
+
+    def get_random_entry(
+        self,
+        macro: Macro,
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+    ) -> TWordListEntry:
+        if initial or rhyme:
+            return super().get_random_entry(macro, initial, rhyme)
+        return self.get_entry(self.get_picker(macro)())
+
+    def get_formatter(self, macro: Macro) -> Callable[[int], str]:
+        base_format = self.base.get_formatter(macro)
+        if not self.delta.key_list:
+            return base_format
+        size = len(self.base.key_list)
+        delta_table = self.delta.get_form_table(
+            macro.word_form or "lemma", "an" in macro.modifiers, macro.is_caps
+        )
+
+        def _format(entry_id: int) -> Optional[str]:
+            if entry_id < size:
+                return base_format(entry_id)
+            return delta_table[entry_id - size]
+
+        return _format
+
+    def get_form_table(
+        self, word_form: str, an: bool = False, caps: bool = False
+    ) -> tuple[Optional[str], ...]:
+        # Note: this copies the base table, get_formatter() does not
+        base_table = self.base.get_form_table(word_form, an, caps)
+        return base_table + self.delta.get_form_table(word_form, an, caps)
+
+    def get_entry(self, entry_id: int) -> TWordListEntry:
+        size = len(self.base.key_list)
+        if entry_id < size:
+            return self.base.get_entry(entry_id)
+        return self.delta.get_entry(entry_id - size)
+
+
+# ------------------------------------------------------------------------------
+# CompiledTemplate
+# ------------------------------------------------------------------------------
+class Span(NamedTuple):
+    """Location and origin of one macro result in an annotated quote.
+
+    See the `annotate` argument of :meth:`Fabulist.generate_quotes`.
+
+    Attributes:
+        start (int): Offset of the first character.
+        end (int): Offset after the last character.
+        word_type (str): E.g. "noun", "name", "num", "pick", "rule", "var".
+        lemma (str, optional): Base form of the word (or the rule or variable
+            name).
+        word_form (str, optional): E.g. "plural" (`None` for the base form).
+        tags (frozenset): Tags of the word list entry.
+    """
+
+    start: int
+    end: int
+    word_type: str
+    lemma: Optional[str] = None
+    word_form: Optional[str] = None
+    tags: frozenset = frozenset()
+
+
+def _make_word_span(start: int, word: str, macro: Macro, entry: TWordListEntry) -> Span:
+    return Span(
+        start,
+        start + len(word),
+        macro.word_type,
+        entry.get("lemma"),
+        macro.word_form,
+        frozenset(entry.get("tags") or ()),
+    )
+
+
+class _WordPart:
+    """A `$(TYPE:MODIFIERS)` macro, bound to its word list."""
+
+    __slots__ = (
+        "macro",
+        "word_list",
+        "ref_forms",
+        "picker",
+        "formatter",
+        "generation",
+        "initial_list",
+        "rhyme_list",
+        "rhyme_form",
+    )
+
+    def __init__(self, macro: Macro, word_list: _WordList):
+        self.macro = macro
+        self.word_list = word_list
+        #: Word forms requested by back-references to this macro
+        self.ref_forms: set[str] = set()
+        #: Returns random entry ids (see :meth:`_WordList.get_ref_picker` for
+        #: macros with `:initial=@NUM` or `:rhyme=@NUM` modifiers)
+        self.picker: Optional[Callable[..., int]] = None
+        #: Converts entry ids to words
+        self.formatter: Optional[Callable[[int], str]] = None
+        self.generation: Optional[int] = None
+        #: Word list of the entry that is referenced by `:initial=@NUM`
+        self.initial_list: Optional[_WordList] = None
+        #: Word list of the entry that is referenced by `:rhyme=@NUM`
+        self.rhyme_list: Optional[_WordList] = None
+        #: Word form that is rendered for the entry referenced by `:rhyme=@NUM`
+        self.rhyme_form: str = "lemma"
+
+    def bind(self) -> None:
+        """Evaluate the tag filter against the current word list data."""
+        # Note: get_picker() may load the list, so read `generation` afterwards
+        if self.initial_list or self.rhyme_list:
+            self.picker = self.word_list.get_ref_picker(self.macro, self.ref_forms)
+        else:
+            self.picker = self.word_list.get_picker(self.macro, self.ref_forms)
+        self.formatter = self.word_list.get_formatter(self.macro)
+        self.generation = self.word_list.generation
+
+    def _pick(self, ref_map: dict) -> int:
+        if self.generation != self.word_list.generation:
+            self.bind()
+        if not (self.initial_list or self.rhyme_list):
+            return self.picker()
+        initial = rhyme = exclude = None
+        if self.initial_list:
+            initial = self.initial_list.get_initial(ref_map[self.macro.initial])
+        if self.rhyme_list:
+            ref_id = ref_map[self.macro.rhyme]
+            rhyme = self.rhyme_list.get_rhyme(ref_id, self.rhyme_form)
+            if self.rhyme_list is self.word_list:
+                # A word does not rhyme with itself
+                exclude = ref_id
+        return self.picker(initial, rhyme, exclude)
+
+    def render(self, ref_map: dict, variables: Optional[dict]) -> str:
+        entry_id = self._pick(ref_map)
+        if self.macro.var_name:
+            ref_map[self.macro.var_name] = entry_id
+        return self.formatter(entry_id)
+
+    def annotate(
+        self, ref_map: dict, variables: Optional[dict], start: int
+    ) -> tuple[str, list[Span]]:
+        # Same as render(), but we need the entry
+        entry_id = self._pick(ref_map)
+        if self.macro.var_name:
+            ref_map[self.macro.var_name] = entry_id
+        word = self.formatter(entry_id)
+        entry = self.word_list.get_entry(entry_id)
+        return word, [_make_word_span(start, word, self.macro, entry)]
+
+    def get_ref_source(self) -> Optional[str]:
+        """Return the variable name that `:initial=@NUM` and `:rhyme=@NUM`
+        refer to, or `None` if there is none (or two different ones)."""
+        sources = set()
+        if self.initial_list:
+            sources.add(self.macro.initial)
+        if self.rhyme_list:
+            sources.add(self.macro.rhyme)
+        return sources.pop() if len(sources) == 1 else None
+
+    def get_ref_constraints(self, entry_id: int) -> dict:
+        """Return the `initial` letter, `rhyme` ending, and excluded entry
+        for an entry id of the referenced macro."""
+        constraints = {}
+        if self.initial_list:
+            constraints["initial"] = self.initial_list.get_initial(entry_id)
+        if self.rhyme_list:
+            constraints["rhyme"] = self.rhyme_list.get_rhyme(entry_id, self.rhyme_form)
+            if self.rhyme_list is self.word_list:
+                # A word does not rhyme with itself
+                constraints["exclude"] = entry_id
+        return constraints
+
+    def analyze(
+        self,
+        ref_macros: Optional[dict[str, list[Macro]]] = None,
+        dependents: Optional[dict[str, list["_WordPart"]]] = None,
+        memo: Optional[dict] = None,
+        **constraints,
+    ) -> tuple[int, float]:
+        """Return the number of distinct results and their entropy.
+
+        Macros that depend on the entry of this macro (e.g. by `:initial=@1`
+        or `:rhyme=@1`) are analyzed per distinct result of this macro.
+
+        Args:
+            ref_macros (dict, optional): Maps variable names to the macros of
+                back-references.
+            dependents (dict, optional): Maps variable names to the parts that
+                depend on them (see :meth:`get_ref_source`).
+            memo (dict, optional): Cache for the results of dependent parts.
+            constraints: Resolved `initial`, `rhyme`, and `exclude` values,
+                see :meth:`get_ref_constraints`.
+        """
+        macro = self.macro
+        refs = ref_macros.get(macro.var_name, ()) if ref_macros else ()
+        children = dependents.get(macro.var_name, ()) if dependents else ()
+        if not children:
+            return self.word_list.analyze_macro(macro, refs, **constraints)
+
+        # Group the entries by result, each group is a separate branch
+        groups: dict[tuple, list[int]] = {}
+        results = self.word_list._get_macro_results(macro, refs, **constraints)
+        for entry_id, result in results.items():
+            group = groups.get(result)
+            if group:
+                group[0] += 1
+            else:
+                groups[result] = [1, entry_id]
+
+        if memo is None:
+            memo = {}
+        weights = []
+        cardinality = 0
+        weighted_bits = 0.0
+        for count, entry_id in groups.values():
+            n, bits = 1, 0.0
+            for child in children:
+                child_constraints = child.get_ref_constraints(entry_id)
+                key = (child, tuple(sorted(child_constraints.items())))
+                if key not in memo:
+                    memo[key] = child.analyze(
+                        ref_macros, dependents, memo, **child_constraints
+                    )
+                child_n, child_bits = memo[key]
+                n *= child_n
+                bits += child_bits
+            if n:
+                # Otherwise rendering fails for this entry and is retried
+                weights.append(count)
+                cardinality += n
+                weighted_bits += count * bits
+        total = sum(weights)
+        entropy = get_entropy(weights) + (weighted_bits / total if total else 0.0)
+        return cardinality, entropy
+
+
+class _RefPart:
+    """A `$(@NUM:MODIFIERS)` back-reference to a previous `:=NUM` macro."""
+
+    __slots__ = ("macro", "word_list", "ref_name", "formatter", "generation")
+
+    def __init__(self, macro: Macro, word_list: _WordList, ref_name: str):
+        self.macro = macro
+        self.word_list = word_list
+        self.ref_name = ref_name
+        self.formatter: Optional[Callable[[int], str]] = None
+        self.generation: Optional[int] = None
+
+    def bind(self) -> None:
+        """Look up the form table in the current word list data."""
+        self.formatter = self.word_list.get_formatter(self.macro)
+        self.generation = self.word_list.generation
+
+    def render(self, ref_map: dict, variables: Optional[dict]) -> str:
+        if self.generation != self.word_list.generation:
+            self.bind()
+        # The referenced macro only picks entries that provide our word form
+        return self.formatter(ref_map[self.ref_name])
+
+    def annotate(
+        self, ref_map: dict, variables: Optional[dict], start: int
+    ) -> tuple[str, list[Span]]:
+        word = self.render(ref_map, variables)
+        entry = self.word_list.get_entry(ref_map[self.ref_name])
+        return word, [_make_word_span(start, word, self.macro, entry)]
+
+    def analyze(self) -> tuple[int, float]:
+        # Determined by the referenced macro, see `_WordPart.analyze()`
+        return 1, 0.0
+
+
+class _NumberPart:
+    """A `$(num:MIN,MAX,WIDTH)` macro."""
+
+    __slots__ = ("min", "max", "width")
+
+    def __init__(self, min: int, max: int, width: int):
+        self.min = min
+        self.max = max
+        self.width = width
+
+    def render(self, ref_map: dict, variables: Optional[dict]) -> str:
+        return f"{random.randrange(self.min, self.max)}".zfill(self.width)
+
+    def annotate(
+        self, ref_map: dict, variables: Optional[dict], start: int
+    ) -> tuple[str, list[Span]]:
+        res = self.render(ref_map, variables)
+        return res, [Span(start, start + len(res), "num")]
+
+    def analyze(self) -> tuple[int, float]:
+        n = max(0, self.max - self.min)
+        return n, math.log2(n) if n else 0.0
+
+
+class _ChoicePart:
+    """A `$(pick:CHOICES)` macro."""
+
+    __slots__ = ("choices",)
+
+    def __init__(self, choices: Sequence[str]):
+        self.choices = choices
+
+    def render(self, ref_map: dict, variables: Optional[dict]) -> str:
+        return random.choice(self.choices)
+
+    def annotate(
+        self, ref_map: dict, variables: Optional[dict], start: int
+    ) -> tuple[str, list[Span]]:
+        res = random.choice(self.choices)
+        return res, [Span(start, start + len(res), "pick")]
+
+    def analyze(self) -> tuple[int, float]:
+        counts = Counter(self.choices)
+        return len(counts), get_entropy(counts.values())
+
+
+class _RulePart:
+    """A `$(rule:NAME)` macro that expands a named rule (see
+    :meth:`Fabulist.add_rule`)."""
+
+    __slots__ = ("rule_map", "name", "is_caps")
+
+    def __init__(self, rule_map: dict, name: str, is_caps: bool):
+        self.rule_map = rule_map
+        self.name = name
+        self.is_caps = is_caps
+
+    def _get_rule(self) -> "CompiledTemplateSet":
+        try:
+            return self.rule_map[self.name]
+        except KeyError:
+            raise ValueError(f"Undefined rule: '{self.name}'") from None
+
+    def render(self, ref_map: dict, variables: Optional[dict]) -> str:
+        # Rule expansions have their own scope for back-references
+        res = self._get_rule().render(variables)
+        if self.is_caps:
+            res = res[:1].upper() + res[1:]
+        return res
+
+    def annotate(
+        self, ref_map: dict, variables: Optional[dict], start: int
+    ) -> tuple[str, list[Span]]:
+        res, inner_spans = self._get_rule().render_annotated(variables)
+        if self.is_caps:
+            res = res[:1].upper() + res[1:]
+        spans = [Span(start, start + len(res), "rule", self.name)]
+        for span in inner_spans:
+            spans.append(span._replace(start=span.start + start, end=span.end + start))
+        return res, spans
+
+    def analyze(self) -> tuple[int, float]:
+        return tuple(self._get_rule().analyze())
+
+
+class _VarPart:
+    """A `$(var:NAME)` macro that is replaced by a caller-supplied value."""
+
+    __slots__ = ("name", "is_caps")
+
+    def __init__(self, name: str, is_caps: bool):
+        self.name = name
+        self.is_caps = is_caps
+
+    def render(self, ref_map: dict, variables: Optional[dict]) -> str:
+        try:
+            res = str(variables[self.name])
+        except (KeyError, TypeError):
+            raise ValueError(f"Undefined template variable: '{self.name}'") from None
+        if self.is_caps:
+            res = res[:1].upper() + res[1:]
+        return res
+
+    def annotate(
+        self, ref_map: dict, variables: Optional[dict], start: int
+    ) -> tuple[str, list[Span]]:
+        res = self.render(ref_map, variables)
+        return res, [Span(start, start + len(res), "var", self.name)]
+
+    def analyze(self) -> tuple[int, float]:
+        # Variables are fixed for one call
+        return 1, 0.0
+
+
+class CompiledTemplate:
+    """A template string, pre-parsed into literal segments and bound macros.
+
+    Instances are created by :meth:`Fabulist.compile` and can be rendered
+    repeatedly without parsing the template again.
+
+    Args:
+        template (str): A string template with embedded macros.
+        list_map (dict): Maps word types to :class:`_WordList` instances.
+        rule_map (dict, optional): Maps rule names to compiled rules, used to
+            resolve `$(rule:NAME)` macros on rendering.
+    Attributes:
+        template (str): The original template string.
+    """
+
+    def __init__(
+        self,
+        template: str,
+        list_map: dict[str, _WordList],
+        *,
+        rule_map: Optional[dict] = None,
+    ):
+        assert type(template) is str, template
+        self.template: str = template
+        #: Literal segments, with `None` placeholders for macro results
+        self._parts: list[Optional[str]] = []
+        #: List of (index into `_parts`, macro part) tuples
+        self._macros: list[tuple] = []
+        #: (state stamp, :class:`TemplateInfo`) of the last analysis
+        self._analysis: Optional[tuple] = None
+
+        var_parts: dict[str, _WordPart] = {}
+        pos = 0
+        for m in rex_macro.finditer(template):
+            if m.start() > pos:
+                self._parts.append(template[pos : m.start()])
+            part = self._compile_macro(
+                m.group(1), m.group(2), list_map, rule_map, var_parts
+            )
+            self._macros.append((len(self._parts), part))
+            self._parts.append(None)
+            pos = m.end()
+        if pos < len(template):
+            self._parts.append(template[pos:])
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.template!r})"
+
+    @staticmethod
+    def _compile_macro(
+        word_type: str,
+        modifiers: Optional[str],
+        list_map: dict[str, _WordList],
+        rule_map: Optional[dict],
+        var_parts: dict[str, _WordPart],
+    ):
+        if word_type.startswith("@"):
+            var_part = var_parts.get(word_type)
+            if not var_part:
+                raise ValueError(f"Reference to undefined variable: '{word_type}'")
+            word_list = var_part.word_list
+            macro = Macro(var_part.macro.word_type, modifiers, word_list)
+            if macro.length or macro.initial or macro.rhyme:
+                raise ValueError(
+                    "Back-references do not support `len`, `initial`, and "
+                    f"`rhyme`: {macro}"
+                )
+            if macro.word_form:
+                # Only pick entries that provide this form in the first place
+                var_part.ref_forms.add(macro.word_form)
+            return _RefPart(macro, word_list, word_type)
+
+        if word_type == "num":
+            return _NumberPart(*parse_number_modifiers(modifiers))
+        elif word_type == "pick":
+            return _ChoicePart(parse_choice_modifiers(modifiers))
+        elif word_type in ("rule", "Rule"):
+            name = (modifiers or "").lstrip(":").strip()
+            if not re.fullmatch(r"\w+", name):
+                raise ValueError(f"`rule` modifier must be a rule name: {modifiers!r}")
+            if rule_map is None:
+                raise ValueError("Rules are not available in this context.")
+            return _RulePart(rule_map, name, word_type == "Rule")
+        elif word_type in ("var", "Var"):
+            name = (modifiers or "").lstrip(":").strip()
+            if not re.fullmatch(r"\w+", name):
+                raise ValueError(
+                    f"`var` modifier must be a variable name: {modifiers!r}"
+                )
+            return _VarPart(name, word_type == "Var")
+
+        word_list = list_map.get(word_type.lower())
+        if not word_list:
+            raise ValueError(f"Invalid word type: '{word_type}'")
+        macro = Macro(word_type, modifiers, word_list)
+        part = _WordPart(macro, word_list)
+        if macro.initial and not macro.static_initial:
+            initial_part = var_parts.get(macro.initial)
+            if not initial_part:
+                raise ValueError(f"Reference to undefined variable: '{macro.initial}'")
+            part.initial_list = initial_part.word_list
+        if macro.rhyme and not macro.static_rhyme:
+            rhyme_part = var_parts.get(macro.rhyme)
+            if not rhyme_part:
+                raise ValueError(f"Reference to undefined variable: '{macro.rhyme}'")
+            part.rhyme_list = rhyme_part.word_list
+            # Rhyme with the word as it is rendered, e.g. with a plural
+            part.rhyme_form = rhyme_part.macro.word_form or "lemma"
+        if macro.var_name:
+            if macro.var_name in var_parts:
+                raise ValueError(f"Duplicate variable assignment: '{macro.var_name}'")
+            var_parts[macro.var_name] = part
+        return part
+
+    def get_word_lists(self) -> set[_WordList]:
+        """Return the word lists that are used by the template and its rules."""
+        word_lists = set()
+        for _idx, part in self._macros:
+            if type(part) is _RulePart:
+                rule = part.rule_map.get(part.name)
+                if rule:
+                    word_lists.update(rule.get_word_lists())
+            elif type(part) in (_WordPart, _RefPart):
+                word_lists.add(part.word_list)
+        return word_lists
+
+    def render(self, variables: Optional[dict] = None) -> str:
+        """Return a random variant of the template.
+
+        Args:
+            variables (dict, optional): Values for `$(var:NAME)` macros.
+        Raises:
+            ApplyTemplateError: if a word form is not available for the
+                randomly selected entry.
+            ValueError: if a `$(var:NAME)` macro is not found in `variables`.
+        """
+        ref_map = {}
+        res = self._parts.copy()
+        for idx, part in self._macros:
+            res[idx] = part.render(ref_map, variables)
+        return "".join(res)
+
+    def render_annotated(
+        self, variables: Optional[dict] = None
+    ) -> tuple[str, list[Span]]:
+        """Return a random variant of the template and the macro locations.
+
+        Args:
+            variables (dict, optional): Values for `$(var:NAME)` macros.
+        Returns:
+            tuple(str, list[:class:`Span`]): The result string and one span
+            per macro (followed by the nested spans for rules).
+        """
+        ref_map = {}
+        res = self._parts.copy()
+        spans = []
+        macros = iter(self._macros)
+        pos = 0
+        for idx, text in enumerate(self._parts):
+            if text is None:
+                _idx, part = next(macros)
+                text, part_spans = part.annotate(ref_map, variables, pos)
+                res[idx] = text
+                spans.extend(part_spans)
+            pos += len(text)
+        return "".join(res), spans
+
+    def _get_stamp(self) -> tuple:
+        """Return a value that changes when the analysis result may change,
+        i.e. when a used word list or rule is modified or replaced."""
+        stamp = []
+        for _idx, part in self._macros:
+            if type(part) is _RulePart:
+                rule = part.rule_map.get(part.name)
+                stamp.append((rule, rule._get_stamp() if rule else None))
+            elif type(part) in (_WordPart, _RefPart):
+                stamp.append((part.word_list, part.word_list.generation))
+        return tuple(stamp)
+
+    def analyze(self) -> "TemplateInfo":
+        """Compute the number of distinct results and their entropy.
+
+        The result is cached until a used word list or rule changes.
+        See :meth:`Fabulist.analyze`.
+        """
+        analysis = self._analysis
+        if analysis and analysis[0] == self._get_stamp():
+            return analysis[1]
+        # Back-references are analyzed together with the referenced macro
+        ref_macros = defaultdict(list)
+        var_parts = {}
+        for _idx, part in self._macros:
+            if type(part) is _RefPart:
+                ref_macros[part.ref_name].append(part.macro)
+            elif type(part) is _WordPart and part.macro.var_name:
+                var_parts[part.macro.var_name] = part
+        # Macros with `:initial=@NUM` or `:rhyme=@NUM` are analyzed per entry of
+        # the referenced macro. Names are not enumerated, so macros that refer
+        # to a name (or to two different macros) are analyzed as if they were
+        # independent (i.e. an upper bound).
+        dependents = defaultdict(list)
+        for _idx, part in self._macros:
+            if type(part) is _WordPart:
+                source = part.get_ref_source()
+                if source and not isinstance(var_parts[source].word_list, NameList):
+                    dependents[source].append(part)
+        dependent_parts = {part for parts in dependents.values() for part in parts}
+
+        cardinality = 1
+        entropy = 0.0
+        for _idx, part in self._macros:
+            if type(part) is _WordPart:
+                if part in dependent_parts:
+                    # Analyzed with the referenced macro
+                    continue
+                n, bits = part.analyze(ref_macros, dependents)
+            else:
+                n, bits = part.analyze()
+            cardinality *= n
+            entropy += bits
+        info = TemplateInfo(cardinality, entropy)
+        # Read the stamp afterwards, because the analysis may load word lists
+        self._analysis = (self._get_stamp(), info)
+        return info
+
+
+class TemplateInfo(NamedTuple):
+    """Cardinality and entropy of a template, as returned by
+    :meth:`Fabulist.analyze`.
+
+    Attributes:
+        cardinality (int): Number of distinct results.
+        entropy (float): Shannon entropy of the results in bits.
+    """
+
+    cardinality: int
+    entropy: float
+
+    def expected_attempts(self, count: int, seen: int = 0) -> float:
+        """Return the expected number of renderings for `count` distinct results.
+
+        This assumes that all results are equally likely, so it is a lower
+        bound for templates with skewed distributions.
+
+        Args:
+            count (int): Number of requested distinct results.
+            seen (int, optional): Number of results that were already
+                produced before and do not count as new results.
+        Returns:
+            float: Expected number of attempts (`math.inf` if `count` exceeds
+            the number of remaining results).
+        """
+        n = self.cardinality
+        remaining = n - seen
+        if count > remaining:
+            return math.inf
+        # Coupon collector's problem
+        return n * (_harmonic(remaining) - _harmonic(remaining - count))
+
+
+# ------------------------------------------------------------------------------
+# CompiledTemplateSet
+# ------------------------------------------------------------------------------
+class AliasTable:
+    """Sample indexes from a discrete distribution in O(1) (Walker's alias method).
+
+    Args:
+        weights (list[float]): Non-negative weights, at least one must be > 0.
+    """
+
+    __slots__ = ("_n", "_prob", "_alias")
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = sum(weights)
+        if not n or total <= 0 or min(weights) < 0:
+            raise ValueError(f"Invalid weights: {weights!r}")
+        # Vose's variant of the alias method
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = g
+            scaled[g] += scaled[s] - 1.0
+            if scaled[g] < 1.0:
+                small.append(g)
+            else:
+                large.append(g)
+        # Remaining entries (including rounding errors) keep prob = 1.0
+        self._n = n
+        self._prob = prob
+        self._alias = alias
+
+    def __len__(self) -> int:
+        return self._n
+
+    def pick(self) -> int:
+        """Return a random index, according to the weights."""
+        i = int(random.random() * self._n)
+        if random.random() < self._prob[i]:
+            return i
+        return self._alias[i]
+
+
+class CompiledTemplateSet:
+    """A weighted set of compiled templates.
+
+    Instances are created by :meth:`Fabulist.compile` and can be passed to
+    :meth:`Fabulist.generate_quotes` directly.
+
+    Args:
+        templates (list[:class:`CompiledTemplate`]): Compiled templates.
+        weights (list[float]): Relative probability per template.
+    """
+
+    def __init__(self, templates: Sequence[CompiledTemplate], weights: Sequence[float]):
+        if len(templates) != len(weights):
+            raise ValueError("Expected one weight per template.")
+        self.templates: tuple[CompiledTemplate, ...] = tuple(templates)
+        self.weights: tuple[float, ...] = tuple(weights)
+        self._alias_table = AliasTable(self.weights)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(len={len(self.templates)})"
+
+    def pick(self) -> CompiledTemplate:
+        """Return a random template, according to the weights."""
+        return self.templates[self._alias_table.pick()]
+
+    def get_word_lists(self) -> set[_WordList]:
+        """Return the word lists that are used by the templates and their rules."""
+        return set().union(*(template.get_word_lists() for template in self.templates))
+
+    def render(self, variables: Optional[dict] = None) -> str:
+        """Return a random variant of a randomly chosen template.
+
+        Args:
+            variables (dict, optional): Values for `$(var:NAME)` macros.
+        """
+        return self.templates[self._alias_table.pick()].render(variables)
+
+    def render_annotated(
+        self, variables: Optional[dict] = None
+    ) -> tuple[str, list[Span]]:
+        """Return a random variant of a randomly chosen template and the macro
+        locations (see :meth:`CompiledTemplate.render_annotated`)."""
+        return self.templates[self._alias_table.pick()].render_annotated(variables)
+
+    def _get_stamp(self) -> tuple:
+        return tuple(template._get_stamp() for template in self.templates)
+
+    def analyze(self) -> TemplateInfo:
+        """Compute the number of distinct results and their entropy.
+
+        This assumes that the templates produce disjoint results.
+        See :meth:`Fabulist.analyze`.
+        """
+        total = sum(self.weights)
+        cardinality = 0
+        entropy = get_entropy(self.weights)
+        for template, weight in zip(self.templates, self.weights):
+            if not weight:
+                # Never selected
+                continue
+            info = template.analyze()
+            cardinality += info.cardinality
+            entropy += weight / total * info.entropy
+        return TemplateInfo(cardinality, entropy)
+
+
+#: Template argument for :meth:`Fabulist.generate_quotes` and friends:
+#: A template string, a list of strings or (template, weight) tuples,
+#: a dict that maps template strings to weights, or a compiled template (set).
+TTemplate = Union[
+    str,
+    Sequence[Union[str, tuple[str, float]]],
+    dict[str, float],
+    CompiledTemplate,
+    CompiledTemplateSet,
+]
+
+
 # ------------------------------------------------------------------------------
 # Fabulist
 # ------------------------------------------------------------------------------
 class Fabulist:
     """Random string factory.
 
+    Args:
+        engine (str, optional):
+            How compiled templates are rendered.
+            "interpreted": iterate over the pre-parsed macros.
+            "codegen": generate and compile a specialized Python function per
+            template (see :class:`fabulist.codegen.CodegenTemplate`).
+            Default: "interpreted".
+        snapshot_dir (str, optional):
+            Folder for binary snapshots of the processed word lists and lorem
+            dialects (see :mod:`fabulist.snapshot`). Snapshots are created on
+            first load and re-created when the source files change.
+            Default: value of the `FABULIST_SNAPSHOT_DIR` environment variable
+            (snapshots are disabled if unset).
+        store_path (str, optional):
+            Read word lists and lorem dialects from a memory-mapped store file
+            that was created by :func:`fabulist.store.build_store` (e.g.
+            `fabulist store PATH`). The store is read-only and shared between
+            processes. Default: `None`.
+        memory_budget (int, optional):
+            Approximate max. size of loaded word lists and lorem dialects in
+            bytes. Least recently used ones are unloaded and loaded again on
+            next use (see :class:`fabulist.budget.MemoryBudget`).
+            Default: `None` (keep everything).
+        plugins (bool, optional):
+            Register the word types of installed packages (see
+            :func:`get_word_type_plugins`). Default: True.
     Attributes:
         list_map (list): Dictionary with one :class:`_WordList` entry per word-type.
         lorem (:class:`fabulist.lorem_ipsum.LoremGenerator`):
+        engine (str): The template engine name.
+        snapshot_dir (str): Snapshot folder or `None`.
+        store (:class:`fabulist.store.WordStore`): The opened store or `None`.
+        budget (:class:`fabulist.budget.MemoryBudget`): The memory budget or
+            `None`.
+        rule_map (dict): Maps rule names to :class:`CompiledTemplateSet`
+            instances (see :meth:`add_rule`).
     """
 
-    def __init__(self):
+    #: Max. number of compiled templates that are kept by :meth:`generate_quotes`
+    template_cache_size: int = 256
+    #: Max. number of parsed macros that are kept by :meth:`get_word`
+    macro_cache_size: int = 1024
+    #: Max. nesting level of rules (see :meth:`add_rule`)
+    max_rule_depth: int = 20
+
+    def __init__(
+        self,
+        *,
+        engine: str = "interpreted",
+        snapshot_dir: Optional[str] = None,
+        store_path: Optional[str] = None,
+        memory_budget: Optional[int] = None,
+        plugins: bool = True,
+    ):
+        if engine == "interpreted":
+            self._template_class = CompiledTemplate
+        elif engine == "codegen":
+            from .codegen import CodegenTemplate
+
+            self._template_class = CodegenTemplate
+        else:
+            raise ValueError(
+                f"Invalid engine: '{engine}' (expected 'interpreted' or 'codegen')"
+            )
+        self.engine: str = engine
+        self.snapshot_dir: Optional[str] = snapshot.get_snapshot_dir(snapshot_dir)
         root: str = os.path.dirname(__file__)
         data_folder: str = os.path.join(root, "data")
-        self.lorem: LoremGenerator = LoremGenerator(data_folder)
+        self.lorem: LoremGenerator = LoremGenerator(
+            data_folder, snapshot_dir=self.snapshot_dir
+        )
         self.list_map: dict[str, _WordList] = {
             "adj": AdjList(os.path.join(data_folder, "adj_list.txt")),
             "adv": AdvList(os.path.join(data_folder, "adv_list.txt")),
@@ -674,12 +3550,207 @@ class Fabulist:
             "verb": VerbList(os.path.join(data_folder, "verb_list.txt")),
             "name": NameList(None),
         }
+        for word_list in self.list_map.values():
+            word_list.snapshot_dir = self.snapshot_dir
+        self.store = None
+        if plugins:
+            # Plugins only register file paths, lists are loaded on first use
+            for register in get_word_type_plugins():
+                try:
+                    register(self)
+                except Exception:
+                    _logger.exception(f"Word type plugin {register} failed")
+        if store_path:
+            from .store import WordStore
+
+            self.store = WordStore(store_path)
+            self.store.attach(self)
+        self.budget = None
+        if memory_budget:
+            from .budget import MemoryBudget
+
+            self.budget = MemoryBudget(memory_budget)
+            self.lorem.budget = self.budget
+        self.rule_map: dict[str, CompiledTemplateSet] = {}
+        #: Maps rule names to the set of rule names they reference
+        self._rule_deps: dict[str, set[str]] = {}
+        #: LRU cache of :class:`CompiledTemplate` instances, keyed by template
+        #: (and :class:`CompiledTemplateSet` instances, keyed by a tuple of
+        #: (template, weight) pairs)
+        self._get_compiled = functools.lru_cache(maxsize=self.template_cache_size)(
+            self.compile
+        )
+        #: LRU cache of :class:`Macro` instances, keyed by (word_type, modifiers)
+        self._get_macro = functools.lru_cache(maxsize=self.macro_cache_size)(
+            self._parse_macro
+        )
 
     def load(self) -> None:
         """Load all word lists into memory (lazy loading otherwise)."""
         for word_list in self.list_map.values():
             word_list.load()
 
+    def derive(self) -> "Fabulist":
+        """Return a new instance that shares the word lists of this instance.
+
+        Word lists are wrapped in :class:`OverlayWordList` views, so entries
+        can be added, removed, or re-tagged per instance (e.g. per tenant)
+        without copying the shared data. Name lists and lorem dialects are
+        shared as they are.
+        Rules (see :meth:`add_rule`) and compiled templates are not copied.
+
+        Returns:
+            :class:`Fabulist`: The derived instance.
+        """
+        fab = object.__new__(self.__class__)
+        fab.__dict__.update(self.__dict__)
+        fab.list_map = {
+            word_type: word_list
+            if isinstance(word_list, NameList)
+            else OverlayWordList(word_list)
+            for word_type, word_list in self.list_map.items()
+        }
+        fab.rule_map = {}
+        fab._rule_deps = {}
+        fab._get_compiled = functools.lru_cache(maxsize=self.template_cache_size)(
+            fab.compile
+        )
+        # Parsed macros only depend on the word list types, so the macro cache
+        # (`_get_macro`) is shared
+        return fab
+
+    def _get_supplemental_list(self, word_type: str) -> _WordList:
+        word_list = self.list_map.get(word_type)
+        if word_list is None or isinstance(word_list, NameList):
+            raise ValueError(f"Cannot add supplemental lists to '{word_type}'.")
+        return word_list
+
+    def load_additional(self, word_type: str, name_or_path: str) -> int:
+        """Merge a supplemental word list into a word list.
+
+        The new entries are tagged with the list name, e.g. after
+        `fab.load_additional("noun", "computer")`, `$(noun:#computer)` only
+        returns nouns from that list.
+        See :meth:`_WordList.load_additional` for details.
+
+        Args:
+            word_type (str): For example 'noun'.
+            name_or_path (str): Name of a bundled list (e.g. 'animals' for
+                `data/noun_list_animals.txt`) or the path to a CSV file.
+        Returns:
+            int: The number of added entries.
+        Raises:
+            ValueError: if the word type or list is unknown, or the list is
+                already loaded.
+        """
+        word_list = self._get_supplemental_list(word_type)
+        if os.path.isfile(name_or_path):
+            return word_list.load_additional(name_or_path)
+        path = os.path.join(
+            os.path.dirname(__file__), "data", f"{word_type}_list_{name_or_path}.txt"
+        )
+        if not os.path.isfile(path):
+            raise ValueError(
+                f"No such file or bundled {word_type} list: {name_or_path}"
+            )
+        return word_list.load_additional(path, name_or_path)
+
+    def unload_additional(self, word_type: str, name: str) -> int:
+        """Remove a supplemental list that was added by :meth:`load_additional`.
+
+        Args:
+            word_type (str): For example 'noun'.
+            name (str): The source name, e.g. 'animals' or the file name
+                without extension.
+        Returns:
+            int: The number of removed entries.
+        """
+        return self._get_supplemental_list(word_type).unload_additional(name)
+
+    def replace_list(self, word_type: str, word_list: _WordList) -> None:
+        """Use another word list instance for a word type.
+
+        The list is swapped in with a single assignment, so other threads
+        that are rendering a template keep using the previous list until they
+        are done. Rules (see :meth:`add_rule`) are re-compiled and the
+        template cache is cleared.
+        Templates that were compiled by the caller (see :meth:`compile`)
+        still reference the previous list and must be compiled again.
+
+        Args:
+            word_type (str): For example 'noun'.
+            word_list (:class:`_WordList`): The new list, usually loaded
+                already (e.g. by :meth:`_WordList.reloaded`).
+        Raises:
+            ValueError: if the word type is unknown or the list type differs.
+        """
+        current = self.list_map.get(word_type)
+        if current is None:
+            raise ValueError(f"Invalid word type: '{word_type}'")
+        if word_list.word_type != current.word_type:
+            raise ValueError(f"Expected a '{word_type}' list: {word_list}")
+        self.list_map[word_type] = word_list
+        if self.budget and word_list is not current:
+            # Do not keep (or count) the previous list
+            self.budget.discard(current)
+        self._get_compiled.cache_clear()
+        for name, rule in list(self.rule_map.items()):
+            self.rule_map[name] = self.compile(
+                [(t.template, w) for t, w in zip(rule.templates, rule.weights)]
+            )
+
+    def register_word_type(
+        self,
+        name: str,
+        path: str,
+        csv_format: Sequence[str] = ("lemma", "tags"),
+        *,
+        computable_modifiers: Iterable[str] = (),
+        extra_modifiers: Iterable[str] = (),
+    ) -> _WordList:
+        """Add a word type that can be used in macros, e.g. `$(city:#europe)`.
+
+        The file is not read until the word type is first used. It has the
+        same format as the bundled lists (see :func:`make_word_list_class`),
+        but may omit all columns except the lemma.
+
+        Args:
+            name (str): Lowercase name, e.g. 'city'.
+            path (str): Location of the text file.
+            csv_format (tuple[str], optional): Column names, starting with
+                'lemma'. Default: ('lemma', 'tags').
+            computable_modifiers (iterable of str, optional): Columns that get
+                a default value if empty, e.g. 'plural'.
+            extra_modifiers (iterable of str, optional): 'an' to support the
+                `:an` modifier.
+        Returns:
+            :class:`_WordList`: The new (not yet loaded) word list.
+        Raises:
+            ValueError: if the name is already used or the format is invalid.
+        Examples:
+            fab.register_word_type("color", "colors.txt")
+            fab.register_word_type(
+                "product", "products.txt", ("lemma", "plural", "tags", "an"),
+                computable_modifiers={"plural"}, extra_modifiers={"an"},
+            )
+            fab.get_quote("$(Color:#warm) $(product:plural)")
+        """
+        if name in self.list_map or name in RESERVED_WORD_TYPES:
+            raise ValueError(f"Word type '{name}' is already defined.")
+        cls = make_word_list_class(
+            name,
+            csv_format,
+            computable_modifiers=computable_modifiers,
+            extra_modifiers=extra_modifiers,
+        )
+        if self.store and name in self.store.list_map:
+            word_list = self.store.list_map[name]
+        else:
+            word_list = cls(path)
+            word_list.snapshot_dir = self.snapshot_dir
+        self.list_map[name] = word_list
+        return word_list
+
     def get_number(
         self, modifiers: Optional[str] = None, *, context: Optional[dict] = None
     ) -> str:
@@ -699,25 +3770,7 @@ class Fabulist:
         Examples:
             fab.get_number("0,999,3")
         """
-        if modifiers is None:
-            modifiers = "0,99,2"
-        parts = modifiers.lstrip(":").split(":")
-        try:
-            assert len(parts) == 1
-            parts = parts[0]
-            parts = [int(p) for p in parts.split(",")]
-            if len(parts) == 1:
-                min, max, width = 0, parts[0], 0
-            elif len(parts) == 2:
-                min, max, width = parts[0], parts[1], 0
-            else:
-                min, max, width = parts
-            # print("parts", min, max, width)
-        except Exception as e:
-            raise ValueError(
-                "`num` modifier must be formatted like "
-                f"'[min,]max[,width]': '{modifiers}'"
-            ) from e
+        min, max, width = parse_number_modifiers(modifiers)
         num = random.randrange(min, max)
         return f"{num}".zfill(width)
 
@@ -741,27 +3794,7 @@ class Fabulist:
             fab.get_choice("$%?!")
             fab.get_choice("$%?!\\:\\,")
         """
-        try:
-            modifiers = modifiers.lstrip(":")
-            # Split by ':' but not '\:'
-            modifier_list = re.split(r"(?<!\\):", modifiers)
-            modifier_list = [m.replace(r"\:", ":") for m in modifier_list]
-            assert len(modifier_list) == 1
-            choices = modifier_list[0]
-            # print("ch2", modifiers, modifier_list, choices)
-            # Split by ',' but not '\,'
-            choices: list[str] = re.split(r"(?<!\\),", choices)
-            if len(choices) == 1 and len(choices[0]) > 1:
-                # Only one string was passed: use single characters
-                choices = choices[0].replace(r"\,", ",")
-                choices = tuple(choices)
-            else:
-                choices = [p.strip().replace(r"\,", ",") for p in choices]
-        except Exception as e:
-            raise ValueError(
-                "`pick` modifier must be formatted like "
-                f"'value[,value]*': '{modifiers}'"
-            ) from e
+        choices = parse_choice_modifiers(modifiers)
         return random.choice(choices)
 
     def get_word(
@@ -779,6 +3812,8 @@ class Fabulist:
                 Additional modifiers, separated by ':'. Default: "".
             context (dict, optional):
                 Used internally to cache template results for back-references.
+                May also contain a "variables" dict, used to resolve
+                `word_type="var"`.
         Returns:
             str: A random word of the requested type and form.
         """
@@ -794,72 +3829,316 @@ class Fabulist:
                 raise ValueError(f"Reference to undefined variable: '{word_type}'")
             word_type = ref_entry["word_type"]
             entry = ref_entry["entry"]
-            word_list = self.list_map.get(word_type.lower())
-            macro = Macro(word_type, modifiers, word_list)
-            word = word_list.apply_macro(macro, entry)
+            macro = self._get_macro(word_type, modifiers)
+            word = self.list_map[macro.word_type].apply_macro(macro, entry)
             return word
 
         if word_type == "num":
             return self.get_number(modifiers, context=context)
         elif word_type == "pick":
             return self.get_choice(modifiers, context=context)
-
-        word_list = self.list_map.get(word_type.lower())
-        if not word_list:
-            raise ValueError(f"Invalid word type: '{word_type}'")
-
-        macro = Macro(word_type, modifiers, word_list)
-        entry = word_list.get_random_entry(macro)
+        elif word_type in ("var", "Var"):
+            part = CompiledTemplate._compile_macro(
+                word_type, modifiers, self.list_map, None, {}
+            )
+            return part.render(ref_map, context.get("variables"))
+
+        macro = self._get_macro(word_type, modifiers)
+        word_list = self.list_map[macro.word_type]
+        if self.budget:
+            self.budget.touch((word_list,))
+        initial = rhyme = exclude = None
+        if macro.initial and not macro.static_initial:
+            # Name entries have no lemma
+            ref_entry = self._get_ref_entry(ref_map, macro.initial)
+            initial = get_initial(ref_entry.get("lemma") or ref_entry["first"])
+        if macro.rhyme and not macro.static_rhyme:
+            ref_entry = self._get_ref_entry(ref_map, macro.rhyme)
+            # Rhyme with the word form that was rendered, e.g. a plural
+            ref_form = ref_map[macro.rhyme].get("word_form") or "lemma"
+            rhyme = get_rhyme(ref_entry.get(ref_form) or ref_entry["last"])
+            ref_type = ref_map[macro.rhyme]["word_type"].lower()
+            if ref_type == macro.word_type and ref_entry.get("lemma"):
+                # A word does not rhyme with itself (see `_WordPart._pick()`)
+                exclude = word_list.key_index.get(ref_entry["lemma"])
+        if not (initial or rhyme):
+            entry = word_list.get_random_entry(macro)
+        else:
+            pick = word_list.get_ref_picker(macro)
+            entry = word_list.get_entry(pick(initial, rhyme, exclude))
         word = word_list.apply_macro(macro, entry)
         if macro.var_name:
             if macro.var_name in ref_map:
                 raise ValueError(f"Duplicate variable assignment: '{macro.var_name}'")
-            ref_map[macro.var_name] = {"entry": entry, "word_type": word_type}
+            ref_map[macro.var_name] = {
+                "entry": entry,
+                "word_type": word_type,
+                "word_form": macro.word_form,
+            }
         if macro.is_caps:
             word = word.capitalize()
         return word
 
+    @staticmethod
+    def _get_ref_entry(ref_map: dict, var_name: str) -> TWordListEntry:
+        ref_entry = ref_map.get(var_name)
+        if not ref_entry:
+            raise ValueError(f"Reference to undefined variable: '{var_name}'")
+        return ref_entry["entry"]
+
+    def _parse_macro(self, word_type: str, modifiers: Optional[str]) -> Macro:
+        """Return a new :class:`Macro` (use the cached `_get_macro()` instead)."""
+        word_list = self.list_map.get(word_type.lower())
+        if not word_list:
+            raise ValueError(f"Invalid word type: '{word_type}'")
+        return Macro(word_type, modifiers, word_list)
+
+    def macro_cache_info(self) -> "functools._CacheInfo":
+        """Return hit and miss statistics of the parsed-macro cache.
+
+        Macros that are passed to :meth:`get_word` and :meth:`get_name` are
+        parsed once per `(word_type, modifiers)` combination.
+
+        Returns:
+            namedtuple: `(hits, misses, maxsize, currsize)`, see
+            :func:`functools.lru_cache`.
+        """
+        return self._get_macro.cache_info()
+
+    def compile(
+        self, template: TTemplate
+    ) -> Union[CompiledTemplate, CompiledTemplateSet]:
+        """Parse a template (or a weighted set of templates) for repeated use.
+
+        :meth:`generate_quotes` and :meth:`get_quote` maintain an LRU cache of
+        compiled template strings, so this is mainly useful for template sets
+        or if the result should be rendered directly.
+
+        Args:
+            template (str | list | dict):
+                A string template with embedded macros, e.g. "Hello $(name:mr)!".
+                Pass a list of strings for a uniformly chosen template, or a list
+                of (template, weight) tuples or a dict {template: weight} for
+                weighted selection.
+        Returns:
+            :class:`CompiledTemplate` | :class:`CompiledTemplateSet`: Call its
+            `render()` method to produce random variants of `template`.
+        Raises:
+            ValueError: if the template contains invalid macros.
+        Examples:
+            templates = fab.compile({"$(noun)": 9, "$(adj) $(noun)": 1})
+            quotes = fab.generate_quotes(templates, count=100)
+        """
+        if isinstance(template, (CompiledTemplate, CompiledTemplateSet)):
+            return template
+        elif isinstance(template, str):
+            return self._template_class(template, self.list_map, rule_map=self.rule_map)
+        elif isinstance(template, dict):
+            items = list(template.items())
+        else:
+            items = [(t, 1) if isinstance(t, str) else t for t in template]
+        return CompiledTemplateSet(
+            [self._get_compiled(t) for t, _ in items], [w for _, w in items]
+        )
+
+    def add_rule(self, name: str, templates: Union[str, Sequence, dict]) -> None:
+        """Define a named rule that can be used as `$(rule:NAME)` macro.
+
+        A rule expands to one of its templates, which may in turn reference
+        other rules. Rules may be referenced before they are defined, but
+        recursive definitions are rejected, as well as nesting levels deeper
+        than :attr:`max_rule_depth`.
+        Use `$(Rule:NAME)` to capitalize the first character of the expansion.
+
+        Back-references (`:=NUM`, `@NUM`) are resolved within each expansion.
+
+        Args:
+            name (str): Rule name (letters, digits, and underscore).
+            templates (str | list | dict):
+                One template string, or a list or weighted set of templates
+                (see :meth:`compile`).
+        Raises:
+            ValueError: if the templates contain invalid macros, or the rule
+                would create a recursion or exceed the max. nesting depth.
+        Examples:
+            fab.add_rule("animal", ["$(noun:#animal)", "$(adj) $(noun:#animal)"])
+            fab.add_rule("greeting", {"Hello $(rule:animal)!": 3, "Hi!": 1})
+            fab.get_quote("$(Rule:greeting)")
+        """
+        if not re.fullmatch(r"\w+", name):
+            raise ValueError(f"Invalid rule name: {name!r}")
+        if isinstance(templates, str):
+            templates = [templates]
+        compiled = self.compile(templates)
+        deps = {
+            part.name
+            for template in compiled.templates
+            for _idx, part in template._macros
+            if type(part) is _RulePart
+        }
+        rule_deps = {**self._rule_deps, name: deps}
+        self._validate_rule_graph(rule_deps, self.max_rule_depth)
+        self._rule_deps = rule_deps
+        self.rule_map[name] = compiled
+
+    @staticmethod
+    def _validate_rule_graph(rule_deps: dict[str, set[str]], max_depth: int) -> None:
+        """Raise ValueError if rules are recursive or nested too deeply."""
+        depth_map: dict[str, int] = {}
+
+        def _visit(name: str, path: tuple[str, ...]) -> int:
+            if name in path:
+                raise ValueError(
+                    "Recursive rule definition: {}".format(" -> ".join((*path, name)))
+                )
+            if name not in depth_map:
+                path = (*path, name)
+                depth = 1 + max(
+                    (_visit(d, path) for d in rule_deps[name] if d in rule_deps),
+                    default=0,
+                )
+                if depth > max_depth:
+                    raise ValueError(
+                        "Rule nesting exceeds max. depth ({}): {}".format(
+                            max_depth, " -> ".join(path)
+                        )
+                    )
+                depth_map[name] = depth
+            return depth_map[name]
+
+        for name in rule_deps:
+            _visit(name, ())
+
+    def _get_renderer(
+        self, template: TTemplate
+    ) -> Union[CompiledTemplate, CompiledTemplateSet]:
+        """Return a (cached) compiled template or template set."""
+        if isinstance(template, str):
+            renderer = self._get_compiled(template)
+        elif isinstance(template, (CompiledTemplate, CompiledTemplateSet)):
+            renderer = template
+        else:
+            # Template sets are cached by their templates, or (template, weight)
+            # pairs. `compile()` accepts the same tuples.
+            if isinstance(template, dict):
+                key = tuple(template.items())
+            else:
+                key = tuple(template)
+            try:
+                renderer = self._get_compiled(key)
+            except TypeError:  # Unhashable items, e.g. [template, weight] lists
+                renderer = self.compile(template)
+        if self.budget:
+            self.budget.touch(renderer.get_word_lists())
+        return renderer
+
     def _format_quote(self, template: str) -> str:
-        assert type(template) is str, template
-        res = template
-        context = {}
-        # TODO: pre-compile & cache the template somehow:
-        for m in rex_macro.finditer(template):
-            term, word_type, modifiers = m.group(0), m.group(1), m.group(2)
-            word = self.get_word(
-                word_type=word_type, modifiers=modifiers, context=context
-            )
-            # Only replace one (this) match
-            # print(term, word, modifiers)
-            res = res.replace(term, word, 1)
+        return self._get_renderer(template).render()
 
-        return res
+    def analyze(self, template: TTemplate) -> TemplateInfo:
+        """Compute the number of distinct results and the entropy of a template.
+
+        The result is derived from the sizes of the tag-filtered word lists,
+        `num` ranges, and `pick` choices. Back-references are analyzed together
+        with the macro they refer to, and macros with `:initial=@NUM` or
+        `:rhyme=@NUM` per entry of the referenced macro. If the referenced
+        macro is a name (or a macro refers to two different macros), the
+        result is an upper bound.
+        Note that different macro results that happen to concatenate to the same
+        string are counted separately.
+
+        Args:
+            template (str | list | dict | :class:`CompiledTemplate`):
+                A string template with embedded macros, e.g. "Hello $(name:mr)!".
+                See :meth:`compile` for other accepted types.
+                Results of template sets are combined, assuming that the
+                templates produce disjoint results.
+        Returns:
+            :class:`TemplateInfo`: Cardinality and entropy (in bits).
+        Examples:
+            >>> fab.analyze("$(num:0,1000)-$(pick:ab)")
+            TemplateInfo(cardinality=2000, entropy=10.965784284662087)
+        """
+        return self._get_renderer(template).analyze()
+
+    def _check_cardinality(
+        self,
+        renderer: Union[CompiledTemplate, CompiledTemplateSet],
+        count: int,
+        seen: int = 0,
+    ) -> None:
+        """Raise ValueError if `renderer` cannot produce `count` distinct results.
+
+        `seen` existing results (e.g. of a shared dedupe set) may come from
+        other templates, so they only add to the expected number of attempts
+        that is logged as a warning.
+        """
+        template = getattr(renderer, "template", renderer)
+        info = renderer.analyze()
+        if count > info.cardinality:
+            raise ValueError(
+                f"Template can only produce {info.cardinality} distinct results, "
+                f"but count={count} was requested: {template!r}"
+            )
+        attempts = info.expected_attempts(count, seen)
+        if math.isinf(attempts):
+            _logger.warning(
+                f"Template can produce {info.cardinality} distinct results, so "
+                f"count={count} fails if the {seen} already used results are "
+                f"its results: {template!r}"
+            )
+        elif attempts > 2 * count:
+            _logger.warning(
+                f"Expecting ~{attempts:.0f} attempts for {count} distinct results "
+                f"(template can produce {info.cardinality}, {seen} already "
+                f"used): {template!r}"
+            )
 
     def generate_quotes(
         self,
-        template: Union[str, list[str]],
+        template: TTemplate,
         *,
         count: Optional[int] = None,
         dedupe: Optional[bool] = False,
-    ) -> Iterator[str]:
+        variables: Optional[dict] = None,
+        annotate: bool = False,
+    ) -> Iterator[Union[str, tuple[str, list[Span]]]]:
         """Return a generator for random strings.
 
         Args:
-            template (str | str[]):
+            template (str | list | dict | :class:`CompiledTemplate`):
                 A string template with embedded macros, e.g. "Hello $(name:mr)!".
                 If a list of strings are passed, a random template is chosen.
+                See :meth:`compile` for weighted template sets.
             count (int, optional):
                 Number of results to generate. Pass None for infinite.
                 Default: None.
             dedupe (bool | set, optional):
                 Pass `True` to prevent duplicate results. If a `set` instance is
-                passed, it will be used to add and check for generated entries.
+                passed, it will be used to add and check for generated entries,
+                so it can be shared by calls with different templates.
+                Default: False.
+            variables (dict, optional):
+                Values for `$(var:NAME)` macros, e.g. `{"NAME": "foo"}`.
+                Values may change between calls without recompiling the
+                template.
+            annotate (bool, optional):
+                Pass `True` to yield (str, list[:class:`Span`]) tuples, that
+                describe the location and origin of every macro result.
                 Default: False.
         Yields:
-            str: Random variants of `template`.
+            str: Random variants of `template` (or tuples, see `annotate`).
+        Raises:
+            ValueError: if `dedupe` is enabled and `template` cannot produce
+                `count` distinct results (see :meth:`analyze`), or if a
+                `$(var:NAME)` macro is not found in `variables`.
         """
+        renderer = self._get_renderer(template)
+        render = renderer.render_annotated if annotate else renderer.render
         if dedupe is True:
             dedupe = set()
+        if count and dedupe is not False:
+            self._check_cardinality(renderer, count, len(dedupe))
 
         i = 0
         fail = 0  # Prevent infinite loops
@@ -873,40 +4152,43 @@ class Fabulist:
                 )
                 raise RuntimeError(msg)
 
-            if isinstance(template, (list, tuple)):
-                t = random.choice(template)
-            else:
-                t = template
-
             try:
-                q = self._format_quote(t)
+                q = render(variables)
             except ApplyTemplateError as e:
                 _logger.error("%s", e)
                 continue
 
             if dedupe is not False:
-                if q in dedupe:
+                text = q[0] if annotate else q
+                if text in dedupe:
                     continue
-                dedupe.add(q)
+                dedupe.add(text)
             yield q
             i += 1
             fail = 0  # Reset skip counter
 
         return
 
-    def get_quote(self, template: Union[str, list[str]]) -> str:
+    def get_quote(
+        self, template: TTemplate, *, variables: Optional[dict] = None
+    ) -> str:
         """Return a single random string.
 
         This is a convenience variant of :meth:`generate_quotes`.
 
         Args:
-            template (str | str[]):
+            template (str | list | dict | :class:`CompiledTemplate`):
                 A string template with embedded macros, e.g. "Hello $(name:mr)!".
                 If a list of strings are passed, a random template is chosen.
+                See :meth:`compile` for weighted template sets.
+            variables (dict, optional):
+                Values for `$(var:NAME)` macros, e.g. `{"NAME": "foo"}`.
         Returns:
             str: A random variant of `template`.
         """
-        return next(self.generate_quotes(template, count=1, dedupe=False))
+        return next(
+            self.generate_quotes(template, count=1, dedupe=False, variables=variables)
+        )
 
     def get_name(
         self, modifiers: Optional[str] = None, *, context: Optional[dict] = None
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+(c) 2017 Martin Wendt; see https://github.com/mar10/fabulist
+Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
+
+Streaming import of large external word lists.
+
+Files are read row by row and passed to :meth:`_WordList.add_entries`, so
+memory usage does not depend on the file size (except for the imported
+entries themselves) and the indexes are only updated once.
+
+Supported formats:
+
+- 'csv' and 'tsv': One entry per row, with the columns of the word list's
+  `csv_format` (e.g. `lemma,plural,tags` for nouns). A header row (starting
+  with 'lemma') may define a different column order or a subset.
+  Empty values are computed if possible, '-' means 'not available', and tags
+  are separated by '|'.
+- 'words': One lemma per line.
+
+In all formats, empty lines and lines that start with '#' are skipped.
+
+Examples:
+    Add nouns from a TSV file and tag them::
+
+        from fabulist.importer import import_file
+
+        result = import_file(fab.list_map["noun"], "nouns.tsv", tags={"extra"})
+        print(result.added, result.conflicts)
+"""
+
+import csv
+import logging
+import os
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Optional
+
+from .fabulist import ImportResult, TWordListEntry, _WordList, parse_fields
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+#: Maps file extensions to formats (other files are considered 'words')
+FORMAT_BY_EXTENSION = {".csv": "csv", ".tsv": "tsv", ".tab": "tsv"}
+
+
+def get_file_format(path: str) -> str:
+    """Return 'csv', 'tsv', or 'words', depending on the file extension."""
+    ext = os.path.splitext(path)[1].lower()
+    return FORMAT_BY_EXTENSION.get(ext, "words")
+
+
+def iter_entries(
+    path: str,
+    csv_format: Sequence[str],
+    *,
+    file_format: Optional[str] = None,
+    tags: Optional[Iterable[str]] = None,
+    encoding: str = "utf-8",
+) -> Iterator[TWordListEntry]:
+    """Read a word file and yield entry dicts, one row at a time.
+
+    Args:
+        path (str): Location of the file.
+        csv_format (tuple): Column names of the target word list.
+        file_format (str, optional): 'csv', 'tsv', or 'words'. Default: guess
+            from the file extension (see :func:`get_file_format`).
+        tags (iterable of str, optional): Tags that are added to all entries.
+        encoding (str, optional): Default: 'utf-8'.
+    Raises:
+        ValueError: if the format or a column name is unknown.
+    """
+    if file_format is None:
+        file_format = get_file_format(path)
+    if file_format not in ("csv", "tsv", "words"):
+        raise ValueError(f"Invalid file format: {file_format!r}")
+    tags = frozenset(tag.strip().lower() for tag in tags) if tags else None
+    if tags and "tags" not in csv_format:
+        raise ValueError(f"Cannot add tags to word lists with format {csv_format}")
+
+    with open(path, encoding=encoding, newline="") as f:
+        if file_format == "words":
+            for line in f:
+                lemma = line.strip()
+                if lemma and not lemma.startswith("#"):
+                    yield {"lemma": lemma, "tags": tags}
+            return
+
+        rows = csv.reader(f, delimiter="\t" if file_format == "tsv" else ",")
+        columns = tuple(csv_format)
+        check_header = True
+        for row_num, row in enumerate(rows, 1):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            # The first row may be a header
+            is_header = check_header and row[0].strip() == "lemma"
+            check_header = False
+            if is_header:
+                columns = tuple(name.strip() for name in row)
+                unknown = set(columns).difference(csv_format)
+                if unknown:
+                    raise ValueError(f"Unknown columns in {path}: {unknown}")
+                continue
+            if len(row) > len(columns):
+                raise ValueError(f"Too many fields in {path}, line {row_num}: {row}")
+            entry = parse_fields(columns, row)
+            if tags:
+                entry_tags = entry.get("tags")
+                entry["tags"] = tags.union(entry_tags) if entry_tags else tags
+            yield entry
+
+
+def import_file(
+    word_list: _WordList,
+    path: str,
+    *,
+    file_format: Optional[str] = None,
+    tags: Optional[Iterable[str]] = None,
+    on_conflict: str = "replace",
+    encoding: str = "utf-8",
+) -> ImportResult:
+    """Add the entries of a CSV, TSV, or plain word file to a word list.
+
+    The file is streamed into :meth:`_WordList.add_entries`, so indexes are
+    only updated once.
+
+    Args:
+        word_list (:class:`_WordList`): The target list (loaded if empty).
+        path (str): Location of the file.
+        file_format (str, optional): 'csv', 'tsv', or 'words'. Default: guess
+            from the file extension.
+        tags (iterable of str, optional): Tags that are added to all entries.
+        on_conflict (str, optional): How to handle entries that differ from
+            existing ones: 'replace', 'keep', 'merge', or 'error'.
+            Default: 'replace'.
+        encoding (str, optional): Default: 'utf-8'.
+    Returns:
+        :class:`ImportResult`: Counts of added, updated, duplicate, and
+        conflicting entries.
+    """
+    if not word_list.data:
+        word_list.load()
+    entries = iter_entries(
+        path,
+        word_list.csv_format,
+        file_format=file_format,
+        tags=tags,
+        encoding=encoding,
+    )
+    result = word_list.add_entries(entries, on_conflict=on_conflict)
+    _logger.info(f"Imported {path} into {word_list}: {result}")
+    return result
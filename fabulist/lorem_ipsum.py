@@ -11,6 +11,8 @@ import random
 from collections.abc import Iterator
 from typing import Optional, Union
 
+from . import snapshot
+
 _logger = logging.getLogger(__name__)
 _logger.addHandler(logging.NullHandler())
 
@@ -31,19 +33,56 @@ class LoremDialect:
     Args:
         dialect (str): "lorem", "pulp", ...
         path (str):
+        snapshot_dir (str, optional): If set, :meth:`load` uses binary
+            snapshots in this folder (see :mod:`fabulist.snapshot`).
     Examples:
         $(TYPE:MODS:#foo|bar:=NUM)
     """
 
-    def __init__(self, dialect: str, path: str):
+    def __init__(self, dialect: str, path: str, *, snapshot_dir: Optional[str] = None):
         self.dialect: str = dialect
         self.path: str = path
+        self.snapshot_dir: Optional[str] = snapshot_dir
         self.paragraphs: Union[list, None] = None
         self.sentences: Union[list, None] = None
         self.words: Union[set, None] = None
         # self.load()
 
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.dialect!r})"
+
     def load(self) -> None:
+        if self.snapshot_dir:
+            state = snapshot.read_snapshot(self.snapshot_dir, self.path, "LoremDialect")
+            if state is not None:
+                self.paragraphs, self.sentences, self.words = state
+                return
+        self._parse()
+        if self.snapshot_dir:
+            snapshot.write_snapshot(
+                self.snapshot_dir,
+                self.path,
+                "LoremDialect",
+                (self.paragraphs, self.sentences, self.words),
+            )
+
+    def is_loaded(self) -> bool:
+        """Return True if the text is loaded."""
+        return self.paragraphs is not None
+
+    def unload(self) -> bool:
+        """Remove the text from memory (it is loaded again on next use).
+
+        Returns:
+            bool: True if the text was removed.
+        """
+        if not isinstance(self.paragraphs, list):
+            # Not loaded, or read from a memory-mapped store
+            return False
+        self.paragraphs = self.sentences = self.words = None
+        return True
+
+    def _parse(self) -> None:
         sentence_set = set()
         self.paragraphs = []
         self.sentences = []
@@ -99,16 +138,18 @@ class LoremDialect:
         """
         if self.paragraphs is None:
             self.load()
+        # Keep references, in case the dialect is unloaded while we iterate
+        paragraphs, sentences = self.paragraphs, self.sentences
 
         pool_idx = 0
         pool_remain = 0
-        sentence_pool = self.sentences
+        sentence_pool = sentences
 
         n_sentences = 0
         while count is None or n_sentences < count:
             if entropy == 1 and pool_remain == 0:
                 # Pick random paragraph, then use sentences in order
-                sentence_pool = random.choice(self.paragraphs)
+                sentence_pool = random.choice(paragraphs)
                 pool_remain = len(sentence_pool)
                 pool_idx = 0
 
@@ -121,9 +162,9 @@ class LoremDialect:
 
             if keep_first:
                 keep_first = False
-                if sentence != self.sentences[0]:
+                if sentence != sentences[0]:
                     # Start with first sentence
-                    yield self.sentences[0]
+                    yield sentences[0]
                     n_sentences += 1
 
             pool_idx += 1
@@ -140,20 +181,27 @@ class LoremDialect:
 class LoremGenerator:
     """Generate lorem ipsum text in a given dialect.
 
+    Args:
+        data_folder (str): Folder with `lorem_*.txt` files.
+        snapshot_dir (str, optional): Passed to :class:`LoremDialect`.
     Attributes:
         dialect_map (dict(dialect, LoremDialect)):
             Holds all available lorem-ipsum dialects
     """
 
-    def __init__(self, data_folder: str):
+    def __init__(self, data_folder: str, *, snapshot_dir: Optional[str] = None):
         self.dialect_map: dict[str, LoremDialect] = {}
         self.root_path: str = data_folder
+        #: Notified when a dialect is used (see :class:`fabulist.budget.MemoryBudget`)
+        self.budget = None
         # Find all available dialects and add to map(dialect => path)
         for name in os.listdir(self.root_path):
             if name.startswith("lorem_"):
                 dialect = os.path.splitext(name)[0][6:]
                 path = os.path.join(self.root_path, name)
-                self.dialect_map[dialect] = LoremDialect(dialect, path)
+                self.dialect_map[dialect] = LoremDialect(
+                    dialect, path, snapshot_dir=snapshot_dir
+                )
         return
 
     def _get_lorem(self, dialect: str) -> LoremDialect:
@@ -172,6 +220,8 @@ class LoremGenerator:
                         dialect, ", ".join(self.dialect_map.keys())
                     )
                 )
+        if self.budget:
+            self.budget.touch((lorem,))
         if lorem.paragraphs is None:
             lorem.load()
         return lorem
@@ -212,8 +262,9 @@ class LoremGenerator:
             # Pick random words
             if keep_first:
                 raise NotImplementedError
+            words = lorem.words
             while count is None or i < count:
-                yield random.choice(lorem.words)
+                yield random.choice(words)
                 i += 1
             return
 
@@ -277,9 +328,10 @@ class LoremGenerator:
                     "or a tuple(min, max)"
                 )
 
+            words = lorem.words
             while count is None or i < count:
                 n_words = _get_count(words_per_sentence)
-                sentence = random.sample(lorem.words, n_words)
+                sentence = random.sample(words, n_words)
                 sentence = " ".join(sentence).capitalize() + "."
                 yield sentence
                 i += 1
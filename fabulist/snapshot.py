@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+(c) 2017 Martin Wendt; see https://github.com/mar10/fabulist
+Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
+
+Binary snapshots of fully processed word lists and lorem dialects.
+
+A snapshot is a pickle file that is read in one go. It is keyed on the source
+path, its modification time and size, and the library version. Stale snapshots
+are ignored (and re-written by the caller).
+
+Note:
+    Snapshots are unpickled, so the snapshot folder must not be writable by
+    untrusted users.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from typing import Any, Optional
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+#: Incremented when the layout of the stored state changes
+SNAPSHOT_FORMAT = 1
+
+#: Environment variable that enables snapshots, if no folder is passed
+SNAPSHOT_DIR_ENV = "FABULIST_SNAPSHOT_DIR"
+
+
+def get_snapshot_dir(snapshot_dir: Optional[str] = None) -> Optional[str]:
+    """Return `snapshot_dir` or the value of `FABULIST_SNAPSHOT_DIR` (or `None`)."""
+    if snapshot_dir is None:
+        snapshot_dir = os.environ.get(SNAPSHOT_DIR_ENV) or None
+    return snapshot_dir
+
+
+def get_snapshot_path(snapshot_dir: str, source_path: str, kind: str) -> str:
+    """Return the snapshot file path for a source file.
+
+    Args:
+        snapshot_dir (str): Folder that holds the snapshot files.
+        source_path (str): Path of the CSV or text source file.
+        kind (str): Type of the stored state, e.g. 'NounList'.
+    """
+    source_path = os.path.abspath(source_path)
+    digest = hashlib.sha1(f"{kind}:{source_path}".encode()).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(snapshot_dir, f"{name}-{digest}.snapshot")
+
+
+def _get_header(source_path: str, kind: str) -> dict:
+    from fabulist import __version__
+
+    stat = os.stat(source_path)
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "version": __version__,
+        "kind": kind,
+        "source": os.path.abspath(source_path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+
+def read_snapshot(snapshot_dir: str, source_path: str, kind: str) -> Optional[Any]:
+    """Return the stored state for a source file, or `None` if missing or stale.
+
+    Args:
+        snapshot_dir (str): Folder that holds the snapshot files.
+        source_path (str): Path of the CSV or text source file.
+        kind (str): Type of the stored state, e.g. 'NounList'.
+    """
+    path = get_snapshot_path(snapshot_dir, source_path, kind)
+    try:
+        with open(path, "rb") as f:
+            header, state = pickle.loads(f.read())
+    except FileNotFoundError:
+        _logger.debug(f"No snapshot for {source_path}")
+        return None
+    except Exception as e:
+        _logger.warning(f"Ignoring invalid snapshot {path}: {e}")
+        return None
+    if header != _get_header(source_path, kind):
+        _logger.info(f"Ignoring stale snapshot {path}")
+        return None
+    _logger.debug(f"Loaded snapshot {path}")
+    return state
+
+
+def write_snapshot(
+    snapshot_dir: str, source_path: str, kind: str, state: Any
+) -> Optional[str]:
+    """Store the state for a source file.
+
+    The file is replaced atomically. Errors are logged, but not raised.
+
+    Args:
+        snapshot_dir (str): Folder that holds the snapshot files.
+        source_path (str): Path of the CSV or text source file.
+        kind (str): Type of the stored state, e.g. 'NounList'.
+        state: Picklable data.
+    Returns:
+        str: The snapshot file path (`None` if it could not be written).
+    """
+    path = get_snapshot_path(snapshot_dir, source_path, kind)
+    try:
+        data = pickle.dumps(
+            (_get_header(source_path, kind), state), protocol=pickle.HIGHEST_PROTOCOL
+        )
+        os.makedirs(snapshot_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=snapshot_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # mkstemp() creates private files, but snapshots may be shared
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    except Exception as e:
+        _logger.warning(f"Could not write snapshot {path}: {e}")
+        return None
+    _logger.info(f"Wrote snapshot {path}")
+    return path
@@ -0,0 +1,698 @@
+#!/usr/bin/env python
+"""
+(c) 2017 Martin Wendt; see https://github.com/mar10/fabulist
+Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
+
+Word lists that are stored in a SQLite database file.
+
+Use :class:`SqliteWordList` for vocabularies that do not fit into memory.
+Entries are read on demand (with an LRU cache of recently used rows), random
+picks select a random rowid, and tag and word-form filters are evaluated by
+SQLite. The list supports the same macros as the in-memory list of its word
+type, so templates do not change when a list is moved to disk.
+
+Examples:
+    Import a large TSV file once::
+
+        from fabulist.importer import import_file
+        from fabulist.sqlite_list import SqliteWordList
+
+        products = SqliteWordList("products.db", word_type="noun")
+        import_file(products, "products.tsv", tags={"product"})
+
+    then use it instead of the bundled nouns::
+
+        fab.list_map["noun"] = SqliteWordList("products.db")
+        fab.get_quote("Buy $(noun:an:#product)!")
+"""
+
+import functools
+import json
+import logging
+import sqlite3
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from typing import Callable, Optional, Union
+
+from .fabulist import (
+    AdjList,
+    AdvList,
+    ImportResult,
+    Macro,
+    NounList,
+    TLength,
+    TTagQuery,
+    TWordListEntry,
+    VerbList,
+    _WordList,
+    _WordListData,
+    get_article,
+    get_default_word_form,
+    get_initial,
+)
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+#: Stored instead of `False` (i.e. 'not available', e.g. no plural form)
+_FALSE_VALUE = "-"
+
+#: Word list classes that can be stored, by word type
+_WORD_LIST_CLASSES: dict[str, type] = {
+    cls.word_type: cls for cls in (AdjList, AdvList, NounList, VerbList)
+}
+
+
+def _make_word_row(entry_id: int, word: str) -> tuple:
+    """Return a row of a `words_<form>` table (see
+    :meth:`SqliteWordList.create_indexes`)."""
+    return (entry_id, len(word), get_initial(word), word.lower()[::-1])
+
+
+# ------------------------------------------------------------------------------
+# Views
+# ------------------------------------------------------------------------------
+class _SqliteColumn(Sequence):
+    """Read-only view of one column, indexed by entry id (see
+    :attr:`SqliteWordList.columns`)."""
+
+    __slots__ = ("_word_list", "_index")
+
+    def __init__(self, word_list: "SqliteWordList", index: int):
+        self._word_list = word_list
+        self._index = index
+
+    def __getitem__(self, entry_id: int) -> Union[str, bool]:
+        if entry_id < 0:
+            entry_id += self._word_list._size
+        return self._word_list._get_row(entry_id)[self._index]
+
+    def __len__(self) -> int:
+        return self._word_list._size
+
+
+class _SqliteKeyIndex(Mapping):
+    """Maps lemmas to entry ids (see :attr:`SqliteWordList.key_index`)."""
+
+    __slots__ = ("_word_list",)
+
+    def __init__(self, word_list: "SqliteWordList"):
+        self._word_list = word_list
+
+    def __getitem__(self, lemma: str) -> int:
+        row = self._word_list._conn.execute(
+            "SELECT id FROM entries WHERE lemma = ?", (lemma,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(lemma)
+        return row[0]
+
+    def __iter__(self) -> Iterator[str]:
+        cursor = self._word_list._conn.execute("SELECT lemma FROM entries ORDER BY id")
+        return (lemma for (lemma,) in cursor)
+
+    def __len__(self) -> int:
+        return self._word_list._size
+
+
+# ------------------------------------------------------------------------------
+# SqliteWordList
+# ------------------------------------------------------------------------------
+class SqliteWordList(_WordList):
+    """A word list that is stored in a SQLite database file.
+
+    Entry ids are the rowids of the `entries` table (0, 1, ...), so random
+    picks without filters are a single indexed lookup. Filtered picks
+    (tags, word forms, `len`, `initial`, `rhyme`) run one query per macro and
+    cache the matching ids as an array (4 bytes per match). Queries are driven
+    by indexes: tags by the primary key of `entry_tags`, word forms by partial
+    indexes of `entries`, and lengths, initials, and endings by
+    `words_<form>` tables (see :meth:`create_indexes`).
+
+    Entries can be added with :meth:`add_entry` and :meth:`add_entries` (or
+    :func:`fabulist.importer.import_file`). Call :meth:`update_data` to commit.
+
+    Args:
+        path (str): Location of the database file (created if it does not
+            exist).
+        word_type (str, optional): 'adj', 'adv', 'noun', or 'verb'. Required
+            to create a new database, optional (but checked) otherwise.
+        cache_size (int, optional): Max. number of rows that are kept in
+            memory. Default: 10000.
+    Attributes:
+        path (str): Location of the database file.
+    """
+
+    def __init__(
+        self, path: str, word_type: Optional[str] = None, *, cache_size: int = 10_000
+    ):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        meta = self._read_meta()
+        if meta:
+            if word_type and word_type != meta["word_type"]:
+                raise ValueError(
+                    f"{path} contains '{meta['word_type']}' entries, not '{word_type}'."
+                )
+            word_type = meta["word_type"]
+        elif word_type not in _WORD_LIST_CLASSES:
+            raise ValueError(
+                f"Invalid word type for a new database: {word_type!r} "
+                f"(expected {set(_WORD_LIST_CLASSES)})"
+            )
+        cls = _WORD_LIST_CLASSES[word_type]
+        # Use the modifiers of the original word list class
+        for name in (
+            "word_type",
+            "csv_format",
+            "computable_modifiers",
+            "form_modifiers",
+            "extra_modifiers",
+            "all_modifiers",
+            "optional_columns",
+        ):
+            setattr(self, name, getattr(cls, name))
+        self._column_names: tuple[str, ...] = tuple(
+            name for name in self.csv_format if name != "tags"
+        )
+        self._column_index: dict[str, int] = {
+            name: idx for idx, name in enumerate(self._column_names)
+        }
+        if not meta:
+            self._create_tables()
+            meta = self._read_meta()
+        #: Word forms that can be filtered by `len`, `initial`, and `rhyme`
+        self._word_forms: tuple[str, ...] = tuple(
+            name for name in self._column_names if name in self.form_modifiers
+        )
+        #: Word forms that have a `words_<form>` table (see :meth:`create_indexes`)
+        self._indexed_forms: list[str] = self._read_indexed_forms()
+
+        self.path: str = path
+        self.data: Mapping[str, TWordListEntry] = _WordListData(self)
+        self.columns: dict[str, _SqliteColumn] = {
+            name: _SqliteColumn(self, idx) for name, idx in self._column_index.items()
+        }
+        self.key_list: _SqliteColumn = self.columns["lemma"]
+        self.key_index: Mapping[str, int] = _SqliteKeyIndex(self)
+        self.tag_names: list[str] = []
+        self._tag_ids: dict[str, int] = {}
+        for tag_id, name in self._conn.execute("SELECT id, name FROM tags ORDER BY id"):
+            self.tag_names.append(name)
+            self._tag_ids[name] = tag_id
+        self.form_tables = {}
+        self._filter_cache = {}
+        self.filter_cache_hits = 0
+        self.filter_cache_misses = 0
+        self.file_comments: list[str] = meta["file_comments"]
+        self.generation: int = 1
+        self.snapshot_dir = None
+        self.sources = {}
+        self.source_paths = {}
+        (self._size,) = self._conn.execute("SELECT count(*) FROM entries").fetchone()
+        #: Returns a tuple of column values for an entry id (LRU cache)
+        self._get_row: Callable[[int], tuple] = functools.lru_cache(maxsize=cache_size)(
+            self._read_row
+        )
+
+    def __repr__(self) -> str:
+        return "{}({}, len={}, tags:{})".format(
+            self.__class__.__name__,
+            self.word_type,
+            self._size,
+            ", ".join(self.tag_names),
+        )
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            rows = self._conn.execute("SELECT key, value FROM meta").fetchall()
+        except sqlite3.OperationalError:
+            return None
+        return {key: json.loads(value) for key, value in rows}
+
+    def _create_tables(self) -> None:
+        columns = ", ".join(f'"{name}" TEXT' for name in self._column_names[1:])
+        with self._conn:
+            self._conn.executescript(
+                f"""
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE entries (
+                    id INTEGER PRIMARY KEY, lemma TEXT NOT NULL UNIQUE, {columns}
+                );
+                CREATE TABLE tags (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+                CREATE TABLE entry_tags (
+                    tag_id INTEGER, entry_id INTEGER, PRIMARY KEY (tag_id, entry_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX entry_tags_entry ON entry_tags (entry_id);
+                """
+            )
+            # Partial indexes of the entries that provide a word form
+            for name in self._column_names:
+                if name in self.form_modifiers and name != "lemma":
+                    self._conn.execute(
+                        f'CREATE INDEX entries_{name} ON entries (id) WHERE "{name}" '
+                        f"IS NOT NULL AND \"{name}\" != '{_FALSE_VALUE}'"
+                    )
+            self._conn.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [
+                    ("word_type", json.dumps(self.word_type)),
+                    ("file_comments", json.dumps([])),
+                ],
+            )
+
+    def _read_indexed_forms(self) -> list[str]:
+        """Return the word forms that have a `words_<form>` table."""
+        tables = {
+            name
+            for (name,) in self._conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+        return [name for name in self._word_forms if f"words_{name}" in tables]
+
+    def create_indexes(self) -> None:
+        """Create the missing `words_<form>` tables.
+
+        They store the length, initial, and reversed lowercase spelling of a
+        word form, indexed by each, so `len`, `initial`, and `rhyme` filters
+        are index lookups and range scans (see :meth:`_filter_ids`).
+        :meth:`update_data` calls this, and :meth:`add_entry` keeps the tables
+        up to date. Databases that were created by an older version are
+        filtered by scanning `entries` until this is called (reading never
+        changes the schema).
+        """
+        conn = self._conn
+        conn.commit()
+        # Lock the database, so other connections cannot create the same tables
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            indexed = self._read_indexed_forms()
+            for word_form in self._word_forms:
+                if word_form in indexed:
+                    continue
+                table = f"words_{word_form}"
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} (entry_id INTEGER PRIMARY "
+                    "KEY, length INTEGER, initial TEXT, reversed TEXT)"
+                )
+                conn.executemany(
+                    f"INSERT INTO {table} VALUES (?, ?, ?, ?)",
+                    [
+                        _make_word_row(entry_id, word)
+                        for entry_id, word in conn.execute(
+                            f'SELECT id, "{word_form}" FROM entries'
+                        )
+                        if word and word != _FALSE_VALUE
+                    ],
+                )
+                # Indexes are created faster after inserting the rows
+                for column in ("length", "initial", "reversed"):
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {table}_{column} "
+                        f"ON {table} ({column})"
+                    )
+                indexed.append(word_form)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        self._indexed_forms = indexed
+
+    def _read_row(self, entry_id: int) -> tuple:
+        """Return the column values of an entry (use the cached `_get_row()`)."""
+        row = self._conn.execute(
+            "SELECT {} FROM entries WHERE id = ?".format(
+                ", ".join(f'"{name}"' for name in self._column_names)
+            ),
+            (entry_id,),
+        ).fetchone()
+        if row is None:
+            raise IndexError(f"Invalid entry id: {entry_id}")
+        return tuple(False if value == _FALSE_VALUE else value for value in row)
+
+    def row_cache_info(self):
+        """Return statistics of the row cache (see :func:`functools.lru_cache`)."""
+        return self._get_row.cache_info()
+
+    @property
+    def tag_map(self) -> dict[str, set]:
+        tag_map = {}
+        for tag, lemma in self._conn.execute(
+            "SELECT t.name, e.lemma FROM entry_tags et "
+            "JOIN tags t ON t.id = et.tag_id JOIN entries e ON e.id = et.entry_id"
+        ):
+            tag_map.setdefault(tag, set()).add(lemma)
+        return tag_map
+
+    def has_tag(self, tag: str) -> bool:
+        return tag in self._tag_ids
+
+    def get_source_files(self) -> list[str]:
+        # The database is the source, it cannot be re-created from text files
+        return []
+
+    def _new_empty(self) -> _WordList:
+        return _WORD_LIST_CLASSES[self.word_type](None)
+
+    def get_column(self, name: str) -> list:
+        """Return all values of a column, indexed by entry id.
+
+        Note that this reads the whole column into memory.
+        """
+        if name not in self._column_index:
+            raise KeyError(name)
+        cursor = self._conn.execute(f'SELECT "{name}" FROM entries ORDER BY id')
+        return [False if value == _FALSE_VALUE else value for (value,) in cursor]
+
+    def _resolve_word_form(self, entry_id: int, word_form: str) -> Union[str, bool]:
+        # Computable word forms are stored when entries are added
+        return self._get_row(entry_id)[self._column_index[word_form]]
+
+    def load(self, path: Optional[str] = None) -> None:
+        """Entries are read on demand, so this only imports a text file (if
+        `path` is passed)."""
+        if path is not None:
+            self.add_entries(self._iter_file(path))
+
+    def add_entry(self, entry: TWordListEntry) -> None:
+        """Add or replace a single entry.
+
+        Missing computable word forms are computed and stored.
+        Call :meth:`update_data` to commit the changes.
+        """
+        lemma = entry["lemma"]
+        values = {name: entry.get(name) for name in self._column_names}
+        for name in self.computable_modifiers:
+            if values[name] is None:
+                values[name] = get_default_word_form(name, lemma, values)
+        encoded = [
+            _FALSE_VALUE if value is False else value for value in values.values()
+        ]
+        conn = self._conn
+        cursor = conn.execute(
+            "INSERT INTO entries VALUES ({}) ON CONFLICT (lemma) DO NOTHING".format(
+                ", ".join("?" * (len(encoded) + 1))
+            ),
+            (self._size, *encoded),
+        )
+        if cursor.rowcount:
+            entry_id = self._size
+            self._size += 1
+        else:
+            # Replace the existing entry
+            entry_id = self.key_index[lemma]
+            conn.execute(
+                "UPDATE entries SET {} WHERE id = ?".format(
+                    ", ".join(f'"{name}" = ?' for name in self._column_names)
+                ),
+                (*encoded, entry_id),
+            )
+            conn.execute("DELETE FROM entry_tags WHERE entry_id = ?", (entry_id,))
+            self._get_row.cache_clear()
+        if len(self._indexed_forms) < len(self._word_forms):
+            # Another connection may have called `create_indexes()` (we hold
+            # the write lock now, so this cannot change until we commit)
+            self._indexed_forms = self._read_indexed_forms()
+        for name in self._indexed_forms:
+            conn.execute(f"DELETE FROM words_{name} WHERE entry_id = ?", (entry_id,))
+            if values[name]:
+                conn.execute(
+                    f"INSERT INTO words_{name} VALUES (?, ?, ?, ?)",
+                    _make_word_row(entry_id, values[name]),
+                )
+        tags = entry.get("tags")
+        if tags:
+            conn.executemany(
+                "INSERT OR IGNORE INTO entry_tags VALUES (?, ?)",
+                [(self._get_tag_id(tag), entry_id) for tag in tags],
+            )
+        self._filter_cache.clear()
+
+    def _get_tag_id(self, tag: str) -> int:
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._tag_ids[tag] = len(self.tag_names)
+            self.tag_names.append(tag)
+            self._conn.execute("INSERT INTO tags VALUES (?, ?)", (tag_id, tag))
+        return tag_id
+
+    def add_entries(
+        self, entries: Iterable[TWordListEntry], *, on_conflict: str = "replace"
+    ) -> ImportResult:
+        """Add many entries in one transaction.
+
+        See :meth:`_WordList.add_entries`.
+        """
+        if on_conflict not in ("replace", "keep", "merge", "error"):
+            raise ValueError(f"Invalid on_conflict: {on_conflict!r}")
+        key_index = self.key_index
+        added = updated = duplicates = conflicts = 0
+        samples = []
+        try:
+            for entry in entries:
+                entry_id = key_index.get(entry["lemma"])
+                if entry_id is None:
+                    self.add_entry(entry)
+                    added += 1
+                    continue
+                merged = self._merge_entry(entry_id, entry)
+                if merged is None:
+                    duplicates += 1
+                    continue
+                conflicts += 1
+                if len(samples) < 100:
+                    samples.append(entry["lemma"])
+                if on_conflict == "keep":
+                    continue
+                elif on_conflict == "error":
+                    raise ValueError(
+                        f"Entry {entry} conflicts with {self.get_entry(entry_id)}"
+                    )
+                self.add_entry(merged if on_conflict == "merge" else entry)
+                updated += 1
+        finally:
+            self.update_data()
+        return ImportResult(added, updated, duplicates, conflicts, tuple(samples))
+
+    def update_data(self) -> None:
+        """Commit added entries, create missing indexes (see
+        :meth:`create_indexes`), and reset cached filter results."""
+        self._conn.execute(
+            "UPDATE meta SET value = ? WHERE key = 'file_comments'",
+            (json.dumps(self.file_comments),),
+        )
+        self._conn.commit()
+        if len(self._indexed_forms) < len(self._word_forms):
+            self.create_indexes()
+        self._filter_cache.clear()
+        self.generation += 1
+
+    def _merge_data(self, start: int) -> None:
+        self.update_data()
+
+    def _truncate(self, size: int) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM entry_tags WHERE entry_id >= ?", (size,))
+            for name in self._indexed_forms:
+                self._conn.execute(
+                    f"DELETE FROM words_{name} WHERE entry_id >= ?", (size,)
+                )
+            self._conn.execute("DELETE FROM entries WHERE id >= ?", (size,))
+        self._size = size
+        self._get_row.cache_clear()
+        self._filter_cache.clear()
+        self.generation += 1
+
+    def unload_additional(self, source: str) -> int:
+        """Remove the entries that were added by :meth:`load_additional`.
+
+        Only the list that was loaded last can be removed.
+        """
+        lemmas = self.sources.get(source.lower())
+        if lemmas is None:
+            raise ValueError(f"{self} does not contain '{source}'.")
+        start = self._size - len(lemmas)
+        if lemmas and self.key_list[start] != lemmas[0]:
+            raise ValueError(f"'{source}' was not the last list added to {self}.")
+        del self.sources[source.lower()]
+        self.source_paths.pop(source.lower(), None)
+        self._truncate(start)
+        return len(lemmas)
+
+    def _filter_ids(
+        self,
+        tags: Union[TTagQuery, set],
+        word_forms: Iterable[str] = (),
+        *,
+        word_form: str = "lemma",
+        length: Optional[TLength] = None,
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+    ) -> Sequence[int]:
+        """Return ids of entries that match the tags and have the word forms.
+
+        See :meth:`_WordList._filter_ids`. Each condition is a query for a set
+        of ids that is driven by an index, e.g. the primary key of
+        `entry_tags` for a tag or a `words_<form>` table for `len`, `initial`,
+        and `rhyme`. Terms of tag queries are combined with UNION, all
+        conditions with INTERSECT. The result is cached as an array.
+        """
+        if isinstance(tags, (set, frozenset)):
+            tags = tuple(((tag, False),) for tag in sorted(tags))
+        word_forms = frozenset(
+            f for f in word_forms if f in self.form_modifiers and f != "lemma"
+        )
+        if not (length or initial or rhyme):
+            word_form = None
+        if not tags and not word_forms and not word_form:
+            return range(self._size)
+
+        cache_key = (tags, word_forms, word_form, length, initial, rhyme)
+        ids = self._filter_cache.get(cache_key)
+        if ids is not None:
+            self.filter_cache_hits += 1
+            return ids
+        self.filter_cache_misses += 1
+
+        queries = []
+        params = []
+        if tags:
+            tag_sql = "SELECT entry_id FROM entry_tags WHERE tag_id = ?"
+            terms = []
+            for term in tags:
+                included = []
+                excluded = []
+                for tag, negate in term:
+                    tag_id = self._tag_ids.get(tag)
+                    if tag_id is None:
+                        raise ValueError(
+                            f"{self.__class__.__name__} has no entries for tag "
+                            f"'{tag}' (expected {self._tag_ids.keys()})"
+                        )
+                    (excluded if negate else included).append(tag_id)
+                # Read the ids of the first tag from the primary key, and
+                # check other tags with lists that are built once per query
+                if included:
+                    sql = tag_sql
+                    checks = [f"entry_id IN ({tag_sql})"] * (len(included) - 1)
+                    checks += [f"entry_id NOT IN ({tag_sql})"] * len(excluded)
+                else:
+                    sql = "SELECT id FROM entries"
+                    checks = [f"id NOT IN ({tag_sql})"] * len(excluded)
+                if checks:
+                    sql += (" AND " if included else " WHERE ") + " AND ".join(checks)
+                terms.append(sql)
+                params.extend(included)
+                params.extend(excluded)
+            sql = " UNION ".join(terms)
+            # Compound SELECTs have no parentheses
+            queries.append(f"SELECT * FROM ({sql})" if len(terms) > 1 else sql)
+        for form in sorted(word_forms):
+            # Uses the partial index `entries_<form>`
+            queries.append(
+                f'SELECT id FROM entries WHERE "{form}" IS NOT NULL '
+                f"AND \"{form}\" != '{_FALSE_VALUE}'"
+            )
+        if word_form:
+            if word_form not in self._indexed_forms:
+                # Created by another connection in the meantime?
+                self._indexed_forms = self._read_indexed_forms()
+            if word_form in self._indexed_forms:
+                words_sql = f"SELECT entry_id FROM words_{word_form} WHERE"
+                length_sql = "length"
+                initial_sql = "initial"
+            else:
+                # Not indexed (see `create_indexes()`), so we scan `entries`
+                column = f'"{word_form}"'
+                words_sql = (
+                    f"SELECT id FROM entries WHERE {column} IS NOT NULL "
+                    f"AND {column} != '{_FALSE_VALUE}' AND"
+                )
+                length_sql = f"length({column})"
+                initial_sql = f"lower(substr({column}, 1, 1))"
+            if length:
+                lo, hi = length
+                if hi is None:
+                    queries.append(f"{words_sql} {length_sql} >= ?")
+                    params.append(lo)
+                else:
+                    queries.append(f"{words_sql} {length_sql} BETWEEN ? AND ?")
+                    params.extend((lo, hi))
+            if initial:
+                queries.append(f"{words_sql} {initial_sql} = ?")
+                params.append(initial)
+            if rhyme and word_form in self._indexed_forms:
+                # Words that end with `rhyme` are a range of reversed words
+                prefix = rhyme[::-1]
+                queries.append(f"{words_sql} reversed >= ? AND reversed < ?")
+                params.extend((prefix, prefix + "\U0010ffff"))
+            elif rhyme:
+                queries.append(f"{words_sql} lower(substr({column}, -?)) = ?")
+                params.extend((len(rhyme), rhyme))
+
+        cursor = self._conn.execute(" INTERSECT ".join(queries) + " ORDER BY 1", params)
+        ids = array("I", (entry_id for (entry_id,) in cursor))
+        self._filter_cache[cache_key] = ids
+        return ids
+
+    def get_formatter(self, macro: Macro) -> Callable[[int], Optional[str]]:
+        """Return a function that converts entry ids to words, according to modifiers.
+
+        See :meth:`_WordList.get_formatter`. Words are formatted on demand,
+        from the cached rows.
+        """
+        return self._get_word_formatter(
+            macro.word_form or "lemma", "an" in macro.modifiers, macro.is_caps
+        )
+
+    def _get_word_formatter(
+        self, word_form: str, an: bool, caps: bool
+    ) -> Callable[[int], Optional[str]]:
+        get_row = self._get_row
+        index = self._column_index[word_form]
+        # The 'an' column overrides the article of the lemma only
+        an_index = self._column_index.get("an") if word_form == "lemma" else None
+
+        def _format(entry_id: int) -> Optional[str]:
+            row = get_row(entry_id)
+            word = row[index]
+            if not word:
+                return None
+            if an:
+                article = row[an_index] if an_index is not None else None
+                word = f"{article or get_article(word)} {word}"
+            if caps:
+                word = word.capitalize()
+            return word
+
+        return _format
+
+    def get_form_table(
+        self, word_form: str, an: bool = False, caps: bool = False
+    ) -> tuple[Optional[str], ...]:
+        """Return a word form variant for all entries, indexed by entry id.
+
+        Note that this reads all entries; prefer :meth:`get_formatter`.
+        """
+        return tuple(
+            map(self._get_word_formatter(word_form, an, caps), range(self._size))
+        )
+
+    def get_entry(self, entry_id: int) -> TWordListEntry:
+        entry = dict(zip(self._column_names, self._get_row(entry_id)))
+        if "tags" in self.csv_format:
+            tags = {
+                name
+                for (name,) in self._conn.execute(
+                    "SELECT t.name FROM entry_tags et JOIN tags t ON t.id = et.tag_id "
+                    "WHERE et.entry_id = ?",
+                    (entry_id,),
+                )
+            }
+            entry["tags"] = tags or None
+        return entry
+
+    def close(self) -> None:
+        """Commit pending changes and close the database connection."""
+        self._conn.commit()
+        self._conn.close()
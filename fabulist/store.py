@@ -0,0 +1,663 @@
+#!/usr/bin/env python
+"""
+(c) 2017 Martin Wendt; see https://github.com/mar10/fabulist
+Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
+
+Read-only word list store that is memory-mapped and shared between processes.
+
+The store file contains all word lists and lorem dialects as tables of UTF-8
+strings (an offset table plus a string blob) and arrays of entry ids per tag
+and word form. Pickers sample entry ids from the mapped arrays and only the
+selected strings are decoded, so there are no per-entry Python objects and all
+processes share the same page-cache copy.
+
+Examples:
+    Build the store once (e.g. when deploying)::
+
+        $ fabulist store /var/cache/fabulist/words.store
+
+    then pass it to every worker::
+
+        fab = Fabulist(store_path="/var/cache/fabulist/words.store")
+"""
+
+import json
+import logging
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from typing import Callable, Optional, Union
+
+from .fabulist import (
+    Macro,
+    NameList,
+    TLength,
+    TTagQuery,
+    TWordListEntry,
+    _WordList,
+    _WordListData,
+    get_article,
+    iter_bitset,
+    make_word_list_class,
+    match_constraints,
+)
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+#: File signature, followed by the length of the JSON directory (uint64)
+STORE_MAGIC = b"FABSTOR1"
+
+#: Stored instead of `False` (i.e. 'not available', e.g. no plural form)
+_FALSE_MARKER = "\x00"
+
+_ALIGN = 8
+
+
+# ------------------------------------------------------------------------------
+# Read-only sequences on top of the mapped file
+# ------------------------------------------------------------------------------
+class _StringTable(Sequence):
+    """A sequence of strings, decoded from the mapped file on access."""
+
+    __slots__ = ("_mm", "_offsets", "_start")
+
+    def __init__(self, mm: mmap.mmap, offsets: memoryview, start: int):
+        self._mm = mm
+        self._offsets = offsets
+        self._start = start
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[str, list[str]]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        start = self._start
+        # Raises IndexError if idx is out of range
+        return self._mm[
+            start + self._offsets[idx] : start + self._offsets[idx + 1]
+        ].decode()
+
+
+class _Subset(Sequence):
+    """A sequence of selected items of another sequence."""
+
+    __slots__ = ("_items", "_ids")
+
+    def __init__(self, items: Sequence, ids: Sequence[int]):
+        self._items = items
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, idx: Union[int, slice]):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return self._items[self._ids[idx]]
+
+
+class _Paragraphs(Sequence):
+    """A sequence of paragraphs (lists of sentences)."""
+
+    __slots__ = ("_lines", "_offsets")
+
+    def __init__(self, lines: _StringTable, offsets: memoryview):
+        self._lines = lines
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx: Union[int, slice]):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        return self._lines[self._offsets[idx] : self._offsets[idx + 1]]
+
+
+class _SortedIndex(Mapping):
+    """Maps lemmas to entry ids, using a binary search over sorted entry ids."""
+
+    __slots__ = ("_key_list", "_sorted_ids")
+
+    def __init__(self, key_list: _StringTable, sorted_ids: memoryview):
+        self._key_list = key_list
+        self._sorted_ids = sorted_ids
+
+    def __getitem__(self, lemma: str) -> int:
+        key_list = self._key_list
+        sorted_ids = self._sorted_ids
+        lo, hi = 0, len(sorted_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key_list[sorted_ids[mid]] < lemma:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(sorted_ids) and key_list[sorted_ids[lo]] == lemma:
+            return sorted_ids[lo]
+        raise KeyError(lemma)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._key_list)
+
+    def __len__(self) -> int:
+        return len(self._key_list)
+
+
+def _contains_id(ids: Sequence[int], entry_id: int) -> bool:
+    """Return True if `entry_id` is in the sorted sequence `ids`."""
+    lo, hi = 0, len(ids)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ids[mid] < entry_id:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo < len(ids) and ids[lo] == entry_id
+
+
+# ------------------------------------------------------------------------------
+# MmapWordList
+# ------------------------------------------------------------------------------
+class MmapWordList(_WordList):
+    """A read-only word list that reads entries from a :class:`WordStore`.
+
+    Supports the same macros as the word list class it was built from (see
+    `class_name`), but :meth:`add_entry` and :meth:`update_data` are not
+    available.
+
+    Args:
+        store (:class:`WordStore`): The opened store.
+        info (dict): The word list's entry of the store directory.
+    """
+
+    def __init__(self, store: "WordStore", info: dict):
+        spec = info.get("spec")
+        if spec:
+            # A custom word type (see `Fabulist.register_word_type()`)
+            cls = make_word_list_class(
+                spec["word_type"],
+                spec["csv_format"],
+                computable_modifiers=spec["computable_modifiers"],
+                extra_modifiers=spec["extra_modifiers"],
+            )
+        else:
+            cls = _WORD_LIST_CLASSES[info["class"]]
+        self._word_list_class: type = cls
+        # Use the modifiers of the original word list class
+        for name in (
+            "word_type",
+            "csv_format",
+            "computable_modifiers",
+            "form_modifiers",
+            "extra_modifiers",
+            "all_modifiers",
+            "optional_columns",
+        ):
+            setattr(self, name, getattr(cls, name))
+        self.class_name: str = info["class"]
+        self.path: str = store.path
+        self.data: Mapping[str, TWordListEntry] = _WordListData(self)
+        self.columns: dict[str, _StringTable] = {
+            name: store.get_strings(section)
+            for name, section in info["columns"].items()
+        }
+        self.key_list: _StringTable = self.columns["lemma"]
+        self.key_index: Mapping[str, int] = _SortedIndex(
+            self.key_list, store.get_ids(info["sorted"])
+        )
+        self.tag_names: list[str] = list(info["tags"])
+        self._tag_ids: dict[str, memoryview] = {
+            tag: store.get_ids(section) for tag, section in info["tags"].items()
+        }
+        self._form_ids: dict[str, memoryview] = {
+            form: store.get_ids(section) for form, section in info["forms"].items()
+        }
+        self.form_tables = {}
+        self._filter_cache = {}
+        self.filter_cache_hits = 0
+        self.filter_cache_misses = 0
+        self.file_comments: list[str] = list(info["file_comments"])
+        self.generation: int = 1
+        self.snapshot_dir = None
+        self.sources = {}
+        self.source_paths = {}
+
+    def __repr__(self) -> str:
+        return "{}({}, len={}, tags:{})".format(
+            self.__class__.__name__,
+            self.class_name,
+            len(self.key_list),
+            ", ".join(self.tag_names),
+        )
+
+    @property
+    def tag_map(self) -> dict[str, set]:
+        key_list = self.key_list
+        return {
+            tag: {key_list[idx] for idx in ids} for tag, ids in self._tag_ids.items()
+        }
+
+    def load(self, path: Optional[str] = None) -> None:
+        """Entries are always available, so this does nothing."""
+        if path is not None:
+            raise TypeError(f"{self} is read-only.")
+
+    def add_entry(self, entry: TWordListEntry) -> None:
+        raise TypeError(f"{self} is read-only.")
+
+    def update_data(self) -> None:
+        """Entries are read-only, so this does nothing."""
+
+    def _filter_ids(
+        self,
+        tags: Union[TTagQuery, set],
+        word_forms: Iterable[str] = (),
+        *,
+        word_form: str = "lemma",
+        length: Optional[TLength] = None,
+        initial: Optional[str] = None,
+        rhyme: Optional[str] = None,
+    ) -> Sequence[int]:
+        """Return ids of entries that match the tags and have the word forms.
+
+        Queries for a single tag or word form return the mapped id array
+        directly. Other queries are evaluated with set operations and cached.
+        The store has no length, initial, and rhyme indexes, so these
+        constraints are checked for each matching entry (and cached as well).
+        """
+        if isinstance(tags, (set, frozenset)):
+            tags = tuple(((tag, False),) for tag in sorted(tags))
+        word_forms = frozenset(f for f in word_forms if f in self._form_ids)
+        if length or initial or rhyme:
+            cache_key = (tags, word_forms, word_form, length, initial, rhyme)
+            ids = self._filter_cache.get(cache_key)
+            if ids is not None:
+                self.filter_cache_hits += 1
+                return ids
+            self.filter_cache_misses += 1
+            column = self.columns[word_form]
+            ids = array(
+                "I",
+                (
+                    idx
+                    for idx in self._filter_ids(tags, word_forms)
+                    if column[idx] != _FALSE_MARKER
+                    and match_constraints(column[idx], length, initial, rhyme)
+                ),
+            )
+            self._filter_cache[cache_key] = ids
+            return ids
+
+        size = len(self.key_list)
+        if not tags and not word_forms:
+            return range(size)
+        if not tags and len(word_forms) == 1:
+            return self._form_ids[next(iter(word_forms))]
+        if not word_forms and len(tags) == 1 and len(tags[0]) == 1:
+            tag, negate = tags[0][0]
+            if not negate:
+                return self._get_tag_ids(tag)
+
+        cache_key = (tags, word_forms)
+        ids = self._filter_cache.get(cache_key)
+        if ids is not None:
+            self.filter_cache_hits += 1
+            return ids
+        self.filter_cache_misses += 1
+
+        matching = None
+        if tags:
+            matching = set()
+            for term in tags:
+                term_ids = None
+                for tag, negate in term:
+                    if not negate:
+                        tag_ids = self._get_tag_ids(tag)
+                        if term_ids is None:
+                            term_ids = set(tag_ids)
+                        else:
+                            term_ids.intersection_update(tag_ids)
+                if term_ids is None:
+                    term_ids = set(range(size))
+                for tag, negate in term:
+                    if negate:
+                        term_ids.difference_update(self._get_tag_ids(tag))
+                matching.update(term_ids)
+        for word_form in word_forms:
+            if matching is None:
+                matching = set(self._form_ids[word_form])
+            else:
+                matching.intersection_update(self._form_ids[word_form])
+
+        ids = array("I", sorted(matching))
+        self._filter_cache[cache_key] = ids
+        return ids
+
+    def has_tag(self, tag: str) -> bool:
+        return tag in self._tag_ids
+
+    def _new_empty(self) -> _WordList:
+        return self._word_list_class(None)
+
+    def get_source_files(self) -> list[str]:
+        # Stores are re-built as a whole (see `build_store()`)
+        return []
+
+    def _get_tag_ids(self, tag: str) -> memoryview:
+        tag_ids = self._tag_ids.get(tag)
+        if tag_ids is None:
+            raise ValueError(
+                f"{self.class_name} has no entries for tag '{tag}' "
+                f"(expected {self._tag_ids.keys()})"
+            )
+        return tag_ids
+
+    def get_entry(self, entry_id: int) -> TWordListEntry:
+        entry = {}
+        for name, column in self.columns.items():
+            value = column[entry_id]
+            if value == _FALSE_MARKER:
+                entry[name] = False
+            else:
+                entry[name] = value or None
+        if "tags" in self.csv_format:
+            tags = {
+                tag for tag, ids in self._tag_ids.items() if _contains_id(ids, entry_id)
+            }
+            entry["tags"] = tags or None
+        return entry
+
+    def get_formatter(self, macro: Macro) -> Callable[[int], str]:
+        """Return a function that converts entry ids to words, according to modifiers.
+
+        Only the requested word is decoded, so no tables are built.
+        """
+        return self._get_word_formatter(
+            macro.word_form or "lemma", "an" in macro.modifiers, macro.is_caps
+        )
+
+    def _get_word_formatter(
+        self, word_form: str, use_article: bool, is_caps: bool
+    ) -> Callable[[int], str]:
+        words = self.columns[word_form]
+        if not use_article and not is_caps:
+            return words.__getitem__
+        # The 'an' column overrides the article of the lemma only
+        an_column = self.columns.get("an") if word_form == "lemma" else None
+
+        def _format(entry_id: int) -> str:
+            word = words[entry_id]
+            if use_article:
+                article = an_column[entry_id] if an_column else None
+                if not article or article == _FALSE_MARKER:
+                    article = get_article(word)
+                word = f"{article} {word}"
+            if is_caps:
+                word = word.capitalize()
+            return word
+
+        return _format
+
+    def get_form_table(
+        self, word_form: str, an: bool = False, caps: bool = False
+    ) -> tuple[Optional[str], ...]:
+        """Return a word form variant for all entries, indexed by entry id.
+
+        Note that this decodes all entries; prefer :meth:`get_formatter`.
+        """
+        words = self.columns[word_form]
+        format_word = self._get_word_formatter(word_form, an, caps)
+        return tuple(
+            None if words[entry_id] in ("", _FALSE_MARKER) else format_word(entry_id)
+            for entry_id in range(len(self.key_list))
+        )
+
+
+#: Word list classes that can be stored, by class name
+_WORD_LIST_CLASSES: dict[str, type] = {
+    cls.__name__: cls
+    for cls in _WordList.__subclasses__()
+    if cls not in (NameList, MmapWordList) and "_spec" not in vars(cls)
+}
+
+
+# ------------------------------------------------------------------------------
+# WordStore
+# ------------------------------------------------------------------------------
+class WordStore:
+    """A memory-mapped store file, created by :func:`build_store`.
+
+    Args:
+        path (str): Location of the store file.
+    Attributes:
+        path (str): Location of the store file.
+        list_map (dict): Maps word types (and 'firstname', 'lastname') to
+            :class:`MmapWordList` instances.
+        dialects (dict): Maps lorem dialect names to dicts with 'paragraphs',
+            'sentences', and 'words' sequences.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[: len(STORE_MAGIC)] != STORE_MAGIC:
+            raise ValueError(f"Not a fabulist store file: {path}")
+        pos = len(STORE_MAGIC)
+        (dir_len,) = struct.unpack_from("<Q", mm, pos)
+        pos += 8
+        directory = json.loads(mm[pos : pos + dir_len].decode())
+        if directory["byteorder"] != sys.byteorder:
+            raise ValueError(
+                f"Store was built on a {directory['byteorder']}-endian system: {path}"
+            )
+        self._data_start: int = directory["data_start"]
+        self._sections: list[list[int]] = directory["sections"]
+        self._view = memoryview(mm)
+
+        self.list_map: dict[str, MmapWordList] = {
+            name: MmapWordList(self, info) for name, info in directory["lists"].items()
+        }
+        self.dialects: dict[str, dict[str, Sequence]] = {}
+        for dialect, info in directory["dialects"].items():
+            self.dialects[dialect] = {
+                "paragraphs": _Paragraphs(
+                    self.get_strings(info["lines"]), self.get_ids(info["paragraphs"])
+                ),
+                "sentences": self.get_strings(info["sentences"]),
+                "words": self.get_strings(info["words"]),
+            }
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path!r})"
+
+    def _get_section(self, section: int) -> tuple[int, int]:
+        offset, length = self._sections[section]
+        start = self._data_start + offset
+        return start, start + length
+
+    def get_ids(self, section: int) -> memoryview:
+        """Return an array of (unsigned 32 bit) ints, without copying."""
+        start, end = self._get_section(section)
+        return self._view[start:end].cast("I")
+
+    def get_strings(self, sections: Sequence[int]) -> _StringTable:
+        """Return a string table, given the sections of its offsets and blob."""
+        offsets_section, blob_section = sections
+        start, _end = self._get_section(blob_section)
+        return _StringTable(self._mm, self.get_ids(offsets_section), start)
+
+    def attach(self, fab) -> None:
+        """Make a :class:`~fabulist.fabulist.Fabulist` use this store.
+
+        Word lists and lorem dialects that are contained in the store replace
+        the file-based instances.
+        """
+        for word_type, word_list in fab.list_map.items():
+            if word_type in self.list_map:
+                fab.list_map[word_type] = self.list_map[word_type]
+            elif isinstance(word_list, NameList) and "firstname" in self.list_map:
+                first = self.list_map["firstname"]
+                first.key_list_male = _Subset(first.key_list, first._filter_ids({"m"}))
+                first.key_list_female = _Subset(
+                    first.key_list, first._filter_ids({"f"})
+                )
+                word_list.firstname_list = first
+                word_list.lastname_list = self.list_map["lastname"]
+        for dialect, info in self.dialects.items():
+            lorem = fab.lorem.dialect_map.get(dialect)
+            if lorem:
+                lorem.paragraphs = info["paragraphs"]
+                lorem.sentences = info["sentences"]
+                lorem.words = info["words"]
+
+
+# ------------------------------------------------------------------------------
+# build_store
+# ------------------------------------------------------------------------------
+class _StoreWriter:
+    """Collect aligned sections of binary data."""
+
+    def __init__(self):
+        self.sections: list[list[int]] = []
+        self.chunks: list[bytes] = []
+        self.size: int = 0
+
+    def add_bytes(self, data: bytes) -> int:
+        """Append data and return the section number."""
+        self.sections.append([self.size, len(data)])
+        self.chunks.append(data)
+        self.size += len(data)
+        padding = -self.size % _ALIGN
+        if padding:
+            self.chunks.append(b"\0" * padding)
+            self.size += padding
+        return len(self.sections) - 1
+
+    def add_ids(self, ids: Iterable[int]) -> int:
+        return self.add_bytes(array("I", ids).tobytes())
+
+    def add_strings(self, strings: Iterable[Optional[str]]) -> list[int]:
+        """Append an offset table and a blob and return their section numbers."""
+        offsets = array("I", [0])
+        blob = bytearray()
+        for value in strings:
+            if value is False:
+                value = _FALSE_MARKER
+            blob += (value or "").encode()
+            offsets.append(len(blob))
+        return [self.add_bytes(offsets.tobytes()), self.add_bytes(bytes(blob))]
+
+
+def _add_word_list(writer: _StoreWriter, word_list: _WordList) -> dict:
+    word_list.load()
+    key_list = word_list.key_list
+    if len(key_list) >= 2**32:
+        raise ValueError(f"{word_list} is too large to be stored.")
+    info = {
+        "class": word_list.__class__.__name__,
+        "columns": {
+            name: writer.add_strings(word_list.get_column(name))
+            for name in word_list.columns
+        },
+        "sorted": writer.add_ids(
+            sorted(range(len(key_list)), key=key_list.__getitem__)
+        ),
+        "tags": {
+            tag: writer.add_ids(iter_bitset(bits))
+            for tag, bits in word_list.tag_bits.items()
+        },
+        "forms": {
+            form: writer.add_ids(iter_bitset(bits))
+            for form, bits in word_list.form_bits.items()
+        },
+        "file_comments": word_list.file_comments,
+    }
+    spec = getattr(word_list.__class__, "_spec", None)
+    if spec:
+        info["spec"] = spec
+    return info
+
+
+def build_store(fab, path: str) -> None:
+    """Write all word lists and lorem dialects of a Fabulist to a store file.
+
+    Args:
+        fab (:class:`~fabulist.fabulist.Fabulist`): The source of the data.
+            Word lists are loaded if necessary.
+        path (str): Location of the store file.
+    """
+    writer = _StoreWriter()
+    lists = {}
+    for word_type, word_list in fab.list_map.items():
+        if isinstance(word_list, NameList):
+            word_list.load()
+            lists["firstname"] = _add_word_list(writer, word_list.firstname_list)
+            lists["lastname"] = _add_word_list(writer, word_list.lastname_list)
+        elif isinstance(word_list, MmapWordList):
+            raise ValueError(f"Cannot build a store from a store: {word_list}")
+        else:
+            lists[word_type] = _add_word_list(writer, word_list)
+
+    dialects = {}
+    for dialect, lorem in fab.lorem.dialect_map.items():
+        if lorem.paragraphs is None:
+            lorem.load()
+        para_offsets = [0]
+        for para in lorem.paragraphs:
+            para_offsets.append(para_offsets[-1] + len(para))
+        dialects[dialect] = {
+            "lines": writer.add_strings(
+                line for para in lorem.paragraphs for line in para
+            ),
+            "paragraphs": writer.add_ids(para_offsets),
+            "sentences": writer.add_strings(lorem.sentences),
+            "words": writer.add_strings(lorem.words),
+        }
+
+    def _encode_directory(data_start: int) -> bytes:
+        return json.dumps(
+            {
+                "byteorder": sys.byteorder,
+                "data_start": data_start,
+                "sections": writer.sections,
+                "lists": lists,
+                "dialects": dialects,
+            }
+        ).encode()
+
+    # The directory contains its own size (via `data_start`), so iterate
+    data_start = 0
+    while True:
+        directory = _encode_directory(data_start)
+        header_size = len(STORE_MAGIC) + 8 + len(directory)
+        header_size += -header_size % _ALIGN
+        if header_size == data_start:
+            break
+        data_start = header_size
+
+    with open(path, "wb") as f:
+        f.write(STORE_MAGIC)
+        f.write(struct.pack("<Q", len(directory)))
+        f.write(directory)
+        f.write(b"\0" * (data_start - len(STORE_MAGIC) - 8 - len(directory)))
+        for chunk in writer.chunks:
+            f.write(chunk)
+    _logger.info(f"Wrote store {path} ({data_start + writer.size:,} bytes)")
+
+
+__all__ = [
+    "MmapWordList",
+    "WordStore",
+    "build_store",
+]
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+(c) 2017 Martin Wendt; see https://github.com/mar10/fabulist
+Licensed under the MIT license: http://www.opensource.org/licenses/mit-license.php
+
+Reload word lists when their text files change.
+
+:class:`WordListWatcher` polls the modification times of the files that the
+word lists of a :class:`~fabulist.fabulist.Fabulist` instance were loaded from
+(see :meth:`_WordList.get_source_files`). When a file changes, a new list is
+loaded in the background (see :meth:`_WordList.reloaded`) and swapped in with
+:meth:`Fabulist.replace_list`. Templates that are rendered at the same time
+keep using the previous list, so readers never take a lock or see a list that
+is only partially loaded.
+
+Examples:
+    Poll every 5 seconds in a background thread::
+
+        from fabulist.watcher import WordListWatcher
+
+        def on_reload(event):
+            print(event.word_type, event.elapsed, event.error)
+
+        watcher = WordListWatcher(fab, interval=5, callback=on_reload)
+        watcher.start()
+        ...
+        watcher.stop()
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+from .fabulist import _WordList
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+#: (mtime in ns, size) of a file, `None` if it does not exist
+TFileStamp = Optional[tuple[int, int]]
+
+
+def get_file_stamp(path: str) -> TFileStamp:
+    """Return modification time and size of a file, or `None` if it is missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class ReloadEvent(NamedTuple):
+    """Result of reloading a word list, passed to the watcher callback.
+
+    Attributes:
+        word_type (str): For example 'noun'.
+        paths (tuple[str]): The changed files.
+        elapsed (float): Time to load the new list in seconds.
+        error (Exception): The exception if loading failed (the previous list
+            is kept), otherwise `None`.
+        word_list (:class:`_WordList`): The new list, or `None` if loading
+            failed.
+    """
+
+    word_type: str
+    paths: tuple[str, ...]
+    elapsed: float
+    error: Optional[Exception]
+    word_list: Optional[_WordList]
+
+
+class WordListWatcher:
+    """Reload the word lists of a Fabulist instance when their files change.
+
+    Call :meth:`check` to poll once, or :meth:`start` to poll in a daemon
+    thread. Files are compared by modification time and size, starting with
+    the state when the watcher is created.
+    A failed reload is reported and not retried until the file changes again.
+
+    Note:
+        Entries that were added with :meth:`_WordList.add_entry` are not
+        copied to the new list. Instances created by :meth:`Fabulist.derive`
+        keep using the previous lists.
+
+    Args:
+        fab (:class:`~fabulist.fabulist.Fabulist`): The instance to update.
+        interval (float, optional): Seconds between two checks in the
+            background thread. Default: 2.
+        callback (callable, optional): Called with a :class:`ReloadEvent`
+            after each reload attempt (in the polling thread).
+    Attributes:
+        reload_count (int): Number of successful reloads.
+        error_count (int): Number of failed reloads.
+    """
+
+    def __init__(
+        self,
+        fab,
+        *,
+        interval: float = 2.0,
+        callback: Optional[Callable[[ReloadEvent], None]] = None,
+    ):
+        if interval <= 0:
+            raise ValueError(f"Invalid interval: {interval}")
+        self.fab = fab
+        self.interval: float = interval
+        self.callback: Optional[Callable[[ReloadEvent], None]] = callback
+        self.reload_count: int = 0
+        self.error_count: int = 0
+        # { path: (mtime_ns, size) }
+        self._stamps: dict[str, TFileStamp] = {}
+        for word_list in fab.list_map.values():
+            for path in word_list.get_source_files():
+                self._stamps[path] = get_file_stamp(path)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(files={len(self._stamps)}, "
+            f"reloads={self.reload_count}, errors={self.error_count})"
+        )
+
+    def __enter__(self) -> "WordListWatcher":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    def check(self) -> list[ReloadEvent]:
+        """Reload the word lists whose files have changed since the last check.
+
+        Returns:
+            list[:class:`ReloadEvent`]: One event per reloaded word type.
+        """
+        events = []
+        for word_type, word_list in list(self.fab.list_map.items()):
+            changed = []
+            for path in word_list.get_source_files():
+                # Remember the stamp before loading, so edits that happen
+                # while the list is parsed are detected by the next check
+                stamp = get_file_stamp(path)
+                if self._stamps.get(path, stamp) != stamp:
+                    changed.append(path)
+                self._stamps[path] = stamp
+            if changed:
+                events.append(self._reload(word_type, word_list, tuple(changed)))
+        return events
+
+    def _reload(
+        self, word_type: str, word_list: _WordList, paths: tuple[str, ...]
+    ) -> ReloadEvent:
+        start = time.monotonic()
+        try:
+            new_list = word_list.reloaded()
+        except Exception as e:
+            self.error_count += 1
+            event = ReloadEvent(word_type, paths, time.monotonic() - start, e, None)
+            _logger.error(f"Could not reload {word_type} list from {paths}: {e}")
+        else:
+            self.fab.replace_list(word_type, new_list)
+            self.reload_count += 1
+            event = ReloadEvent(
+                word_type, paths, time.monotonic() - start, None, new_list
+            )
+            _logger.info(f"Reloaded {new_list} in {event.elapsed:.3f} sec.")
+        if self.callback:
+            try:
+                self.callback(event)
+            except Exception:
+                _logger.exception(f"Reload callback failed for {event}")
+        return event
+
+    def start(self) -> None:
+        """Start polling in a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            raise RuntimeError(f"{self} is already running.")
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="fabulist-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the polling thread and wait until it is done."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                _logger.exception(f"{self} check failed")
@@ -0,0 +1,225 @@
+"""
+Micro benchmarks.
+
+Run from the project root:
+    python -m tests.benchmark
+"""
+# ruff: noqa: T201 (`print` found)
+
+import gc
+import os
+import random
+import resource
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import fabulist
+
+#: Templates used by `tests/demo.py`
+DEMO_TEMPLATES = [
+    "Don't $(verb) with my $(noun) or I'll $(verb) your $(noun:plural).",
+    "$(adj)-$(noun:#animal)",
+    r"$(Adj)-$(Noun)-$(num:1,9999,4)$(pick:\:\,$%?!)",
+    "One $(noun:=1) may be $(adj:=2), but two $(@1:plural) are $(@2:comp).",
+    "My name is $(name:mr:middle)",
+    "Friends call me $(name:#m:first:=1), you can call me $(@1:mr:middle).\n"
+    + "  May I introduce you to my wife $(name:#f:mr:first) $(@1:last)?",
+    "You have very $(adj:#positive) $(noun:plural).",
+    "May your $(noun:plural) $(verb) $(adv:super:#positive).",
+    "$(Verb:ing) is better than $(verb:ing).",
+    "$(Noun:an) a day keeps the $(noun:plural) away.",
+    "If you want to $(verb) $(adv:#positive), $(verb) $(adv:#positive)!",
+    "$(Noun) is too $(adj)",
+]
+
+
+def _time_per_call(func, number: int) -> float:
+    """Return the best time per call in microseconds."""
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    return 1e6 * best / number
+
+
+def _render_safe(render) -> None:
+    try:
+        render()
+    except fabulist.fabulist.ApplyTemplateError:
+        pass
+
+
+def benchmark_engines(number: int = 2000) -> None:
+    """Compare per-quote times of the template engines for the demo templates."""
+    fab = fabulist.Fabulist()
+    fab_cg = fabulist.Fabulist(engine="codegen")
+    fab.load()
+    fab_cg.load()
+
+    print(f"Microseconds per quote (best of 5 x {number}):")
+    print(f"{'parse':>8} {'interp.':>8} {'codegen':>8} {'speedup':>8}  template")
+    total_interp = total_codegen = 0.0
+    for template in DEMO_TEMPLATES:
+        compiled_cg = fab_cg.compile(template)
+        t_parse = _time_per_call(
+            lambda t=template: _render_safe(fab.compile(t).render), number
+        )
+        t_interp = _time_per_call(
+            lambda t=template: _render_safe(lambda: fab._format_quote(t)), number
+        )
+        t_codegen = _time_per_call(lambda c=compiled_cg: _render_safe(c.render), number)
+        total_interp += t_interp
+        total_codegen += t_codegen
+        print(
+            f"{t_parse:8.2f} {t_interp:8.2f} {t_codegen:8.2f} "
+            f"{t_interp / t_codegen:7.2f}x  {template[:40]!r}"
+        )
+    print(
+        f"Total speedup codegen vs. _format_quote: {total_interp / total_codegen:.2f}x"
+    )
+
+
+def _write_synthetic_noun_list(path: str, size: int) -> None:
+    """Write a noun list file with `size` random entries."""
+    rng = random.Random(42)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    tags = ("", "", "animal", "food", "animal|pet")
+    with open(path, "w") as fs:
+        fs.write("# Synthetic noun list\n")
+        for i in range(size):
+            lemma = "".join(rng.choice(letters) for _ in range(rng.randint(3, 9)))
+            plural = "-" if i % 20 == 0 else ""
+            fs.write(f"{lemma}{i},{plural},{rng.choice(tags)}\n")
+
+
+def _measure_load(load) -> tuple[float, float]:
+    """Return (seconds, MiB allocated) for a call to `load()`."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    res = load()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del res
+    return elapsed, size / (1024 * 1024)
+
+
+def benchmark_load(size: int = 500_000) -> None:
+    """Report load time and memory of the bundled and a synthetic word list."""
+
+    def load_all():
+        fab = fabulist.Fabulist()
+        fab.load()
+        return fab
+
+    def load_synthetic():
+        word_list = fabulist.fabulist.NounList(path)
+        word_list.load()
+        return word_list
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "noun_list.txt")
+        _write_synthetic_noun_list(path, size)
+        print("Load time and memory (tracemalloc, without interpreter overhead):")
+        t, mib = _measure_load(load_all)
+        print(f"  bundled word lists:     {t:6.2f} sec, {mib:7.1f} MiB")
+        t, mib = _measure_load(load_synthetic)
+        print(f"  {size:,} synthetic nouns: {t:6.2f} sec, {mib:7.1f} MiB")
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"  max. RSS of this process: {max_rss:.0f} MiB")
+
+
+def benchmark_import(size: int = 2_000_000) -> None:
+    """Compare streaming import with adding one entry at a time."""
+    from fabulist.importer import iter_entries
+
+    def add_each():
+        word_list = fabulist.fabulist.NounList(None)
+        with open(path) as f:
+            for line in f:
+                word_list.add_entry({"lemma": line.strip(), "tags": {"imported"}})
+        word_list.update_data()
+
+    def import_bulk():
+        word_list = fabulist.fabulist.NounList(None)
+        entries = iter_entries(path, word_list.csv_format, tags={"imported"})
+        word_list.add_entries(entries)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "words.txt")
+        rng = random.Random(42)
+        with open(path, "w") as fs:
+            for i in range(size):
+                fs.write(f"{rng.choice('abcdefghijklmnopqrstuvwxyz')}word{i}\n")
+        print(f"Import {size:,} words:")
+        for name, func in (("add_entry()", add_each), ("add_entries()", import_bulk)):
+            gc.collect()
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            gc.collect()
+            tracemalloc.start()
+            func()
+            _size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {name:14} {elapsed:6.2f} sec, peak {peak / 2**20:7.1f} MiB")
+
+
+def benchmark_sqlite(size: int = 300_000, number: int = 5) -> None:
+    """Report uncached filter times of a :class:`SqliteWordList` database."""
+    from fabulist.fabulist import parse_tag_query
+    from fabulist.sqlite_list import SqliteWordList
+
+    rng = random.Random(42)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    tags = ({"animal"}, {"food"}, {"animal", "pet"}, None, None)
+    queries = [
+        ("#rare", {"tags": parse_tag_query("rare")}),
+        ("#animal", {"tags": parse_tag_query("animal")}),
+        ("#animal&!pet", {"tags": parse_tag_query("animal&!pet")}),
+        ("#!animal", {"tags": parse_tag_query("!animal")}),
+        (
+            "#rare|pet:plural",
+            {"tags": parse_tag_query("rare|pet"), "word_forms": {"plural"}},
+        ),
+        ("len=10", {"tags": (), "length": (10, 10)}),
+        ("initial=q", {"tags": (), "initial": "q"}),
+        ("rhyme=42", {"tags": (), "rhyme": "42"}),
+        ("#rare:initial=q", {"tags": parse_tag_query("rare"), "initial": "q"}),
+    ]
+
+    def iter_entries():
+        for i in range(size):
+            lemma = "".join(rng.choice(letters) for _ in range(rng.randint(3, 9)))
+            entry_tags = {"rare"} if i % 1000 == 0 else rng.choice(tags)
+            plural = False if i % 20 == 0 else None
+            yield {"lemma": f"{lemma}{i}", "plural": plural, "tags": entry_tags}
+
+    with tempfile.TemporaryDirectory() as folder:
+        word_list = SqliteWordList(os.path.join(folder, "nouns.db"), word_type="noun")
+        start = time.perf_counter()
+        word_list.add_entries(iter_entries())
+        elapsed = time.perf_counter() - start
+        print(
+            f"SQLite list with {size:,} nouns "
+            f"(import, including indexes: {elapsed:.2f} sec)"
+        )
+        print(f"Milliseconds per uncached filter (best of {number}):")
+        for name, kwargs in queries:
+
+            def run(kwargs=kwargs):
+                word_list._filter_cache.clear()
+                return word_list._filter_ids(**kwargs)
+
+            count = len(run())
+            ms = _time_per_call(run, number) / 1000
+            print(f"  {name:20} {ms:8.2f} ms, {count:7,} matches")
+        word_list.close()
+
+
+if __name__ == "__main__":
+    benchmark_load()
+    benchmark_import()
+    benchmark_sqlite()
+    benchmark_engines()
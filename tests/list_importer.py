@@ -5,7 +5,7 @@ Import a plain text file, add tags to the existing words or add new words altoge
 
 import os
 
-from fabulist import Fabulist
+from fabulist import Fabulist, importer
 
 
 def merge_word_list_for_tag(src_path, dest_path=None, create_new_entries=False):
@@ -13,32 +13,22 @@ def merge_word_list_for_tag(src_path, dest_path=None, create_new_entries=False):
         dest_path = src_path + ".out"
     fab = Fabulist()
     fab.load()
-    word_list = None
-    for line in open(path).readlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        # First line mus contain the word-type, tag-name
-        if not word_list:
-            word_type, tag_name = line.split(",")
-            word_list = fab.list_map[word_type.strip()]
-            tag_name = tag_name.strip()
-            continue
-        word = line
-        entry = word_list.data.get(word)
-        if entry:
-            if tag_name:
-                if entry["tags"] is None:
-                    entry["tags"] = set()
-                entry["tags"].add(tag_name)
-                print("Add tag {!r} to {!r}: {}".format(tag_name, word, entry["tags"]))
-        elif create_new_entries:
-            if tag_name:
-                entry = {"lemma": word, "tags": set((tag_name,))}
-            else:
-                entry = {"lemma": word}
-            print(f"Create new entry {entry}")
-            word_list.add_entry(entry)
+    lines = importer.iter_entries(src_path, ("lemma",), file_format="words")
+    # First line must contain the word-type, tag-name
+    word_type, tag_name = (s.strip() for s in next(lines)["lemma"].split(","))
+    word_list = fab.list_map[word_type]
+    tags = {tag_name} if tag_name else None
+
+    entries = (
+        {"lemma": entry["lemma"], "tags": tags}
+        for entry in lines
+        if create_new_entries or entry["lemma"] in word_list.data
+    )
+    result = word_list.add_entries(entries, on_conflict="merge")
+    print(
+        f"Added {result.added} entries and tagged {result.updated} "
+        f"({result.duplicates} were already tagged)"
+    )
 
     print(f"Saving result as {dest_path}")
     word_list.save_as(dest_path)
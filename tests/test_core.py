@@ -1,7 +1,15 @@
 """ """
 
+import collections
+import gc
+import math
 import os
+import re
+import sqlite3
+import sys
 import tempfile
+import time
+import weakref
 
 import pytest
 
@@ -40,6 +48,18 @@ class TestBasic:
         name = self.fab.get_name(":last")
         assert " " not in name, "name:last does not include :first"
 
+        # Tag queries select the gender
+        female_names = set(self.fab.list_map["name"].firstname_list.key_list_female)
+        for _ in range(20):
+            assert self.fab.get_name("#!f:mr").startswith("Mr. ")
+            assert self.fab.get_quote("$(name:#f|x:mr)").startswith("Mrs. ")
+            assert self.fab.get_name(":first:#!m") in female_names
+        with pytest.raises(ValueError):
+            self.fab.get_name("#m&f")
+        with pytest.raises(ValueError):
+            self.fab.get_quote("$(name:#!m&!f)")
+        assert self.fab.analyze("$(name:first:#!m)").cardinality == len(female_names)
+
     def test_pick(self):
         for _ in range(100):
             val = self.fab.get_quote("$(pick:foo,bar,b\\,az)")
@@ -83,6 +103,1128 @@ class TestBasic:
         with pytest.raises(ValueError):
             self.fab.get_word("noun", "#unknown_tag")
 
+    def test_compile(self):
+        fab = self.fab
+        compiled = fab.compile("One $(noun:=1), again $(@1): $(num:1,10,2)$(pick:!?)")
+        assert isinstance(compiled, fabulist.fabulist.CompiledTemplate)
+        for _ in range(100):
+            res = compiled.render()
+            assert re.match(r"^One (.+), again \1: 0[1-9][!?]$", res)
+        # Back-references may use other word forms (uncountable nouns have no
+        # plural, so restrict to animals)
+        compiled = fab.compile("One $(noun:#animal:=1), two $(@1:plural)")
+        for _ in range(100):
+            assert re.match(r"^One .+, two .+$", compiled.render())
+
+        with pytest.raises(ValueError):
+            fab.compile("$(@1:plural)")
+        with pytest.raises(ValueError):
+            fab.compile("$(noun:=1) $(noun:=1)")
+
+        fab.get_quote("$(noun)")
+        fab.get_quote("$(noun)")
+        assert fab._get_compiled.cache_info().hits >= 1
+
+    def test_compile_rebind(self):
+        fab = self.fab
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        noun_list.add_entry({"lemma": "foo", "plural": None, "tags": {"unittest"}})
+        noun_list.update_data()
+        compiled = fab.compile("$(noun:#unittest:plural)")
+        assert compiled.render() == "foos"
+        # Compiled templates pick up changed word lists
+        noun_list.add_entry({"lemma": "bar", "plural": None, "tags": {"unittest"}})
+        noun_list.update_data()
+        res = {compiled.render() for _ in range(100)}
+        assert res == {"foos", "bars"}
+
+    def test_analyze(self, caplog):
+        fab = self.fab
+        info = fab.analyze("$(num:0,1000)-$(pick:ab)")
+        assert info.cardinality == 2000
+        assert info.entropy == pytest.approx(math.log2(2000))
+        assert info.expected_attempts(2001) == math.inf
+
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        info = fab.analyze("$(noun)")
+        assert info.cardinality == len(noun_list.key_list)
+        # Back-references do not add to the cardinality
+        assert fab.analyze("$(noun:=1) $(@1)").cardinality == info.cardinality
+        # Referenced constraints are analyzed per referenced entry
+        adj_list = fab.list_map["adj"]
+        adj_list.load()
+        initials = collections.Counter(lemma[0].lower() for lemma in noun_list.key_list)
+        expected = sum(initials[lemma[0].lower()] for lemma in adj_list.key_list)
+        info = fab.analyze("$(adj:=1) $(noun:initial=@1)")
+        assert info.cardinality == expected
+        assert info.entropy < fab.analyze("$(adj) $(noun)").entropy
+
+        # Impossible dedupe requests are rejected up front
+        res = list(fab.generate_quotes("$(pick:abc)", count=3, dedupe=True))
+        assert sorted(res) == ["a", "b", "c"]
+        with pytest.raises(ValueError):
+            list(fab.generate_quotes("$(pick:abc)", count=4, dedupe=True))
+        # A passed `dedupe` set may be shared by templates, so its entries
+        # only add to the expected attempts
+        dedupe = set(fab.generate_quotes("$(pick:abc)", count=3, dedupe=True))
+        res = fab.generate_quotes("$(pick:xyz)", count=3, dedupe=dedupe)
+        assert sorted(res) == ["x", "y", "z"]
+        assert len(dedupe) == 6
+        caplog.clear()
+        res = fab.generate_quotes("$(pick:abc)", count=1, dedupe={"a", "b"})
+        assert list(res) == ["c"]
+        assert "2 already used" in caplog.text
+
+        # Results are cached until a word list changes
+        noun_list.add_entry({"lemma": "foo", "tags": {"unittest"}})
+        noun_list.update_data()
+        compiled = fab.compile("$(noun:#unittest)")
+        assert compiled.analyze().cardinality == 1
+        assert compiled.analyze() is compiled.analyze()
+        noun_list.add_entry({"lemma": "bar", "tags": {"unittest"}})
+        noun_list.update_data()
+        assert compiled.analyze().cardinality == 2
+
+    def test_weighted_templates(self):
+        fab = self.fab
+        templates = fab.compile({"a": 3, "b": 1, "c": 0})
+        assert isinstance(templates, fabulist.fabulist.CompiledTemplateSet)
+        res = collections.Counter(fab.generate_quotes(templates, count=4000))
+        assert set(res) == {"a", "b"}
+        assert 2.5 < res["a"] / res["b"] < 3.5
+
+        res = set(fab.generate_quotes([("x", 1), "y"], count=100))
+        assert res == {"x", "y"}
+
+        assert fab.analyze({"$(pick:ab)": 1, "$(pick:cd)": 1}).cardinality == 4
+        # Templates with weight 0 are never selected
+        assert fab.analyze({"$(pick:ab)": 1, "$(pick:cd)": 0}).cardinality == 2
+
+        # Template sets are compiled once
+        templates = ["$(noun)", ("$(adj) $(noun)", 2)]
+        assert fab._get_renderer(templates) is fab._get_renderer(list(templates))
+        assert fab.get_quote([["x", 1]]) == "x"
+        assert fab._get_renderer({"x": 1}) is fab._get_renderer({"x": 1})
+
+        with pytest.raises(ValueError):
+            fab.compile({"a": 0})
+
+    def test_rules(self):
+        fab = self.fab
+        fab.add_rule("sound", ["moo", "oink"])
+        fab.add_rule("animal", {"cow": 1, "pig": 1})
+        fab.add_rule("greeting", "the $(rule:animal) says $(rule:sound)")
+        for _ in range(10):
+            res = fab.get_quote("$(Rule:greeting)!")
+            assert re.match(r"^The (cow|pig) says (moo|oink)!$", res)
+        assert fab.analyze("$(rule:greeting)").cardinality == 4
+
+        # Forward references are allowed, but must be defined when rendered
+        fab.add_rule("forward", "$(rule:undefined_rule)")
+        with pytest.raises(ValueError):
+            fab.get_quote("$(rule:forward)")
+
+        with pytest.raises(ValueError):
+            fab.add_rule("sound", "$(rule:greeting)")
+        with pytest.raises(ValueError):
+            fab.add_rule("self_reference", "$(rule:self_reference)")
+        with pytest.raises(ValueError):
+            fab.add_rule("invalid name", "foo")
+        with pytest.raises(ValueError):
+            fab.get_quote("$(rule)")
+        # Failed definitions are not registered
+        assert "self_reference" not in fab.rule_map
+        assert fab.get_quote("$(rule:sound)") in ("moo", "oink")
+
+        fab.max_rule_depth = 3
+        fab.add_rule("level_3", "$(rule:greeting)")
+        with pytest.raises(ValueError):
+            fab.add_rule("level_4", "$(rule:level_3)")
+
+    def test_variables(self):
+        fab = self.fab
+        template = "GET /$(var:path) tenant=$(var:tenant) $(pick:ab)$(Var:path)"
+        res = fab.get_quote(template, variables={"path": "foo", "tenant": 42})
+        assert re.match(r"^GET /foo tenant=42 [ab]Foo$", res)
+        res = list(
+            fab.generate_quotes(template, count=2, variables={"path": "x", "tenant": 1})
+        )
+        assert all(r.startswith("GET /x tenant=1 ") for r in res)
+        # Variables are also passed to rules
+        fab.add_rule("path", "/$(var:path)")
+        assert fab.get_quote("$(rule:path)", variables={"path": "bar"}) == "/bar"
+        assert fab.get_word("var", "path", context={"variables": {"path": 1}}) == "1"
+
+        with pytest.raises(ValueError):
+            fab.get_quote(template, variables={"path": "foo"})
+        with pytest.raises(ValueError):
+            fab.get_quote(template)
+        with pytest.raises(ValueError):
+            fab.get_quote("$(var:invalid name)")
+
+    def test_annotate(self):
+        fab = self.fab
+        fab.add_rule("pet", "my $(noun:#animal)")
+        template = "$(Noun:=1) and $(@1), $(num:1,10) $(rule:pet) ($(var:x))"
+        res = fab.generate_quotes(template, count=10, annotate=True, variables={"x": 1})
+        for text, spans in res:
+            assert [s.word_type for s in spans] == [
+                "noun",
+                "noun",
+                "num",
+                "rule",
+                "noun",
+                "var",
+            ]
+            first, ref, num, rule, pet, var = spans
+            assert text[first.start : first.end] == first.lemma.capitalize()
+            assert text[ref.start : ref.end] == first.lemma
+            assert 1 <= int(text[num.start : num.end]) <= 9
+            assert text[rule.start : rule.end] == "my " + pet.lemma
+            assert "animal" in pet.tags
+            assert text[var.start : var.end] == "1"
+            assert text.endswith("(1)")
+
+    def test_form_index(self):
+        fab = self.fab
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        assert "news" in noun_list.key_list
+        assert "news" not in noun_list.form_map["plural"]
+
+        # Entries without the requested form are never picked
+        compiled = fab.compile("$(noun:plural) $(noun:=1) $(@1:plural) $(adj:antonym)")
+        for _ in range(1000):
+            compiled.render()
+            fab.get_word("noun", "plural")
+
+        noun_list.add_entry(
+            {"lemma": "foo", "plural": False, "tags": {"unittest", "x"}}
+        )
+        noun_list.add_entry({"lemma": "bar", "plural": None, "tags": {"unittest"}})
+        noun_list.update_data()
+        res = {fab.get_word("noun", "plural:#unittest") for _ in range(20)}
+        assert res == {"bars"}
+        with pytest.raises(fabulist.fabulist.ApplyTemplateError):
+            fab.get_word("noun", "plural:#x")
+
+    def test_articles(self):
+        fab = self.fab
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        assert noun_list.data["hour"]["an"] == "an"
+        assert "an" not in noun_list.form_modifiers
+
+        table = noun_list.get_form_table("lemma", an=True, caps=True)
+        assert table[noun_list.key_index["hour"]] == "An hour"
+        assert table[noun_list.key_index["university"]] == "A university"
+        assert table[noun_list.key_index["uncle"]] == "An uncle"
+        table = noun_list.get_form_table("plural")
+        assert table[noun_list.key_index["news"]] is None
+
+        compiled = fab.compile("$(noun:an:=1), $(@1:an:plural)")
+        for _ in range(100):
+            quote = compiled.render()
+            assert re.fullmatch(r"an? \w.*, an? \w.*", quote), quote
+        # The override only applies to the lemma
+        adj_list = fab.list_map["adj"]
+        adj_list.load()
+        adj_list.add_entry(
+            {"lemma": "hourly", "comp": "more hourly", "tags": {"unittest"}, "an": "an"}
+        )
+        adj_list.update_data()
+        assert fab.get_quote("$(adj:#unittest:an)") == "an hourly"
+        assert fab.get_quote("$(adj:#unittest:comp:an)") == "a more hourly"
+        assert fab.get_word("adj", "#unittest:comp:an") == "a more hourly"
+        assert fab.get_word("adj", "#unittest:an") == "an hourly"
+
+        macro = fabulist.fabulist.Macro("noun", "an", noun_list)
+        assert macro.word_form is None
+        assert macro.modifiers == {"an"}
+
+        # The override column is only written when set
+        self.temp_path = tempfile.mktemp()
+        noun_list.save_as(self.temp_path)
+        with open(self.temp_path) as f:
+            lines = f.read().splitlines()
+        assert "hour,,,an" in lines
+        assert "university,,,a" in lines
+        assert "uncle,," in lines
+
+    def test_macro_cache(self):
+        fab = self.fab
+        for _ in range(10):
+            fab.get_word("noun", ":plural:#animal")
+            fab.get_name(":mr:middle")
+        info = fab.macro_cache_info()
+        assert info.misses == 2
+        assert info.hits == 18
+
+        macro = fab._get_macro("Noun", ":plural:#animal")
+        assert macro is fab._get_macro("Noun", ":plural:#animal")
+        assert macro.tags == frozenset(("animal",))
+        with pytest.raises(AttributeError):
+            macro.word_form = "lemma"
+        with pytest.raises(AttributeError):
+            macro.foo = 1
+        # Errors are not cached
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                fab.get_word("noun", "an:an")
+
+    def test_filter_cache(self):
+        fab = self.fab
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        animals = noun_list._filter_key_list({"animal"})
+        assert noun_list.filter_cache_misses == 1
+        for _ in range(10):
+            fab.get_word("noun", "#animal")
+        assert noun_list.filter_cache_misses == 1
+        assert noun_list.filter_cache_hits == 10
+        # Deterministic order
+        assert animals == [k for k in noun_list.key_list if k in set(animals)]
+        assert noun_list._filter_key_list({"animal"}, ["plural"]) == [
+            k for k in animals if noun_list.data[k]["plural"]
+        ]
+
+        noun_list.add_entry({"lemma": "foo", "plural": None, "tags": {"animal"}})
+        noun_list.update_data()
+        assert noun_list._filter_key_list({"animal"}) == [*animals, "foo"]
+        assert noun_list.filter_cache_misses == 3
+
+    def test_tag_query(self):
+        fab = self.fab
+        adj_list = fab.list_map["adj"]
+        adj_list.load()
+        for lemma, tags in (("foo", {"x", "y"}), ("bar", {"x"}), ("baz", {"y"})):
+            adj_list.add_entry({"lemma": lemma, "tags": tags})
+        adj_list.update_data()
+
+        res = {fab.get_word("adj", "#x&y") for _ in range(20)}
+        assert res == {"foo"}
+        res = {fab.get_word("adj", "#x&!y|y&!x") for _ in range(50)}
+        assert res == {"bar", "baz"}
+        for word in fab.generate_quotes("$(adj:#!negative)", count=100):
+            assert "negative" not in (adj_list.data[word]["tags"] or ())
+        non_negative = adj_list._filter_key_list(
+            fab._get_macro("adj", "#!negative").tag_query
+        )
+        assert len(non_negative) == len(adj_list.key_list) - len(
+            adj_list.tag_map["negative"]
+        )
+
+        macro = fabulist.fabulist.Macro("adj", "#x&!y|!z", adj_list)
+        assert macro.tags == {"x", "y", "z"}
+        assert str(macro) == "$(adj:#x&!y|!z)"
+        with pytest.raises(ValueError):
+            fab.get_word("adj", "#x&x")
+        with pytest.raises(ValueError):
+            fab.get_word("adj", "#x&")
+        with pytest.raises(ValueError):
+            fab.get_word("adj", "#!unknown_tag")
+
+    def test_columns(self):
+        fab = self.fab
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        assert len(noun_list.data) == len(noun_list.key_list)
+        assert noun_list.key_list is noun_list.columns["lemma"]
+        assert "alpaca" in noun_list.data
+        assert noun_list.data["alpaca"] == {
+            "lemma": "alpaca",
+            "plural": "alpacas",
+            "an": None,
+            "tags": {"animal"},
+        }
+        with pytest.raises(TypeError):
+            noun_list.data["alpaca"] = {"lemma": "alpaca"}
+
+        # Replacing an entry updates the tags
+        noun_list.add_entry({"lemma": "foo", "tags": {"unittest"}})
+        noun_list.add_entry({"lemma": "foo", "plural": False, "tags": {"x"}})
+        noun_list.update_data()
+        assert noun_list.data["foo"]["tags"] == {"x"}
+        assert noun_list.key_list.count("foo") == 1
+        assert fab.get_word("noun", "#x") == "foo"
+        with pytest.raises(ValueError):
+            fab.get_word("noun", "#unittest")
+        assert noun_list.tag_map["x"] == {"foo"}
+
+    def test_lazy_word_forms(self):
+        fab = self.fab
+        verb_list = fab.list_map["verb"]
+        verb_list.load()
+        # Default forms are computed on first access
+        idx = verb_list.key_index["listen"]
+        assert verb_list.columns["ing"][idx] is None
+        assert verb_list.data["listen"]["ing"] == "listening"
+        assert verb_list.columns["ing"][idx] == "listening"
+        # ... but they are available for filtering
+        assert "listen" in verb_list.form_map["ing"]
+        assert verb_list.get_column("s")[idx] == "listens"
+        assert None not in verb_list.columns["s"]
+        # Explicit overrides and unavailable forms are kept
+        noun_list = fab.list_map["noun"]
+        noun_list.add_entry({"lemma": "foo", "plural": False})
+        noun_list.update_data()
+        assert noun_list.data["foo"]["plural"] is False
+        assert "foo" not in noun_list.form_map["plural"]
+
+    def test_load_additional(self):
+        fab = self.fab
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        size = len(noun_list.key_list)
+        n_plural = len(noun_list.form_map["plural"])
+        table = noun_list.get_form_table("lemma", True, True)
+        template = fab.compile("$(noun:#computer)")
+
+        with pytest.raises(ValueError):
+            fab.get_word("noun", "#computer")
+        n_computer = fab.load_additional("noun", "computer")
+        assert n_computer > 50
+        assert len(noun_list.key_list) == size + n_computer
+        # Only new lemmas are added, and they are indexed incrementally
+        computer = noun_list.sources["computer"]
+        assert computer == noun_list.key_list[size:]
+        assert noun_list.data["algorithm"]["plural"] == "algorithms"
+        assert noun_list.tag_map["computer"] == set(computer)
+        assert template.render() in computer
+        assert fab.get_word("noun", "#computer:plural:an")
+        assert len(noun_list.form_map["plural"]) == n_plural + n_computer
+        table2 = noun_list.get_form_table("lemma", True, True)
+        assert table2[:size] == table
+        assert table2[noun_list.key_index["algorithm"]] == "An algorithm"
+        with pytest.raises(ValueError):
+            fab.load_additional("noun", "computer")
+        with pytest.raises(ValueError):
+            fab.load_additional("noun", "no_such_list")
+        with pytest.raises(ValueError):
+            fab.load_additional("name", "computer")
+
+        n_animals = fab.load_additional("noun", "animals")
+        assert "aardvark" in noun_list.data
+        assert "aardvark" in noun_list.tag_map["animals"]
+
+        # Unloading a list that is not the last one rebuilds the indexes
+        assert fab.unload_additional("noun", "computer") == n_computer
+        assert "algorithm" not in noun_list.data
+        assert len(noun_list.key_list) == size + n_animals
+        with pytest.raises(ValueError):
+            fab.get_word("noun", "#computer")
+        assert fab.get_word("noun", "#animals") in noun_list.sources["animals"]
+        # Unloading the last list truncates
+        table = noun_list.get_form_table("lemma", True, True)
+        assert fab.unload_additional("noun", "animals") == n_animals
+        assert len(noun_list.key_list) == size
+        assert len(noun_list.form_map["plural"]) == n_plural
+        assert "animals" not in noun_list.tag_bits
+        assert noun_list.get_form_table("lemma", True, True) == table[:size]
+        assert "aardvark" not in noun_list.data
+        with pytest.raises(ValueError):
+            fab.unload_additional("noun", "animals")
+
+    def test_add_entries(self):
+        from fabulist.importer import import_file
+
+        fab = self.fab
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        size = len(noun_list.key_list)
+        result = noun_list.add_entries(
+            [
+                {"lemma": "zorb", "tags": {"toy"}},
+                {"lemma": "zorb"},  # duplicate
+                {"lemma": "zorb", "plural": "zorben"},  # conflict
+                {"lemma": "alpaca", "tags": {"animal"}},  # duplicate
+            ],
+            on_conflict="merge",
+        )
+        assert result.added == 1
+        assert result.duplicates == 2
+        assert result.conflicts == 1
+        assert result.conflict_samples == ("zorb",)
+        assert noun_list.data["zorb"] == {
+            "lemma": "zorb",
+            "plural": "zorben",
+            "tags": {"toy"},
+            "an": None,
+        }
+        assert fab.get_word("noun", "#toy") == "zorb"
+        result = noun_list.add_entries([{"lemma": "zorb", "tags": {"x"}}])
+        assert result.updated == 1
+        assert noun_list.data["zorb"]["tags"] == {"x"}
+        with pytest.raises(ValueError):
+            noun_list.add_entries(
+                [{"lemma": "yurt"}, {"lemma": "zorb", "an": "an"}],
+                on_conflict="error",
+            )
+        # Entries before the error are kept and indexed
+        assert "yurt" in noun_list.form_map["plural"]
+        with pytest.raises(ValueError):
+            noun_list.add_entries([], on_conflict="ignore")
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "nouns.tsv")
+            with open(path, "w") as f:
+                f.write("# comment\nlemma\ttags\tplural\n")
+                f.write("quokka\tanimal|cute\t\n")
+                f.write("kiwi\tanimal\tkiwis\n")
+                f.write("\n")
+                f.write("alpaca\tcute\t\n")
+            result = import_file(noun_list, path, tags=["imported"])
+            assert result.added == 2
+            assert result.updated == 1
+            assert noun_list.data["quokka"]["tags"] == {"animal", "cute", "imported"}
+            assert noun_list.data["alpaca"]["tags"] == {"cute", "imported"}
+
+            path = os.path.join(folder, "nouns.txt")
+            with open(path, "w") as f:
+                f.write("bilby\nquokka\n\n# comment\n")
+            result = import_file(noun_list, path, on_conflict="keep")
+            assert result == (1, 0, 1, 0, ())
+            assert noun_list.data["bilby"]["plural"] == "bilbies"
+
+            path = os.path.join(folder, "nouns.csv")
+            with open(path, "w") as f:
+                f.write("lemma,color\n")
+            with pytest.raises(ValueError, match="Unknown columns"):
+                import_file(noun_list, path)
+
+            # Overlays accept bulk imports without modifying the base list
+            overlay = fab.derive().list_map["noun"]
+            path = os.path.join(folder, "tenant.txt")
+            with open(path, "w") as f:
+                f.write("zumbat\nquokka\nzumbat\n")
+            result = import_file(overlay, path, tags=["tenant"], on_conflict="merge")
+            assert result == (1, 1, 1, 1, ("quokka",))
+            assert overlay.data["quokka"]["tags"] == {
+                "animal",
+                "cute",
+                "imported",
+                "tenant",
+            }
+            assert "zumbat" in overlay.tag_map["tenant"]
+            assert "zumbat" not in noun_list.data
+            assert noun_list.data["quokka"]["tags"] == {"animal", "cute", "imported"}
+            with pytest.raises(ValueError):
+                overlay.add_entries(
+                    [{"lemma": "alpaca", "an": "a"}], on_conflict="error"
+                )
+        assert len(noun_list.key_list) == size + 5
+
+    def test_derive(self):
+        fab = self.fab
+        fab.load()
+        noun_list = fab.list_map["noun"]
+        size = len(noun_list.key_list)
+        animals = noun_list.tag_map["animal"]
+        template = fab.compile("$(Noun:an:#animal)")
+
+        tenant = fab.derive()
+        overlay = tenant.list_map["noun"]
+        assert isinstance(overlay, fabulist.fabulist.OverlayWordList)
+        assert overlay.base is noun_list
+        assert tenant.list_map["name"] is fab.list_map["name"]
+        assert tenant.get_word("noun", "#animal") in animals
+
+        # Add, re-tag, and remove entries
+        overlay.add_entry({"lemma": "gryphon", "tags": {"animal", "myth"}})
+        overlay.update_data()
+        overlay.set_tags("dog", {"pet"})
+        for lemma in animals - {"dog", "cat"}:
+            overlay.remove_entry(lemma)
+        with pytest.raises(KeyError):
+            overlay.remove_entry("alpaca")
+        assert len(overlay.data) == size - len(animals) + 2 + 1
+        assert overlay.tag_map["animal"] == {"cat", "gryphon"}
+        assert overlay.data["dog"]["tags"] == {"pet"}
+        assert overlay.data["gryphon"]["plural"] == "gryphons"
+        for _ in range(20):
+            assert tenant.get_word("noun", "#animal") in ("cat", "gryphon")
+            assert tenant.get_word("noun", "#myth:plural:an") == "a gryphons"
+            assert tenant.get_quote("$(Noun:an:#pet)") == "A dog"
+            quote = tenant.get_quote("$(noun:#animal|pet:=1) $(@1:plural)")
+            assert quote.split()[0] in ("cat", "gryphon", "dog")
+        assert tenant.analyze("$(noun:#animal)").cardinality == 2
+        assert len(list(tenant.generate_quotes("$(noun)", count=50))) == 50
+        with pytest.raises(ValueError):
+            tenant.get_word("noun", "#unknown_tag")
+
+        # The shared list is unchanged
+        assert len(noun_list.key_list) == size
+        assert "gryphon" not in noun_list.data
+        assert noun_list.tag_map["animal"] == animals
+        with pytest.raises(ValueError):
+            fab.get_word("noun", "#myth")
+        assert template.render().split()[-1] in animals
+
+        # Tenants are independent, and supplemental lists work per overlay
+        other = fab.derive()
+        assert "gryphon" not in other.list_map["noun"].data
+        assert other.load_additional("noun", "computer") > 50
+        assert "algorithm" in other.list_map["noun"].data
+        assert "algorithm" not in noun_list.data
+        assert other.get_word("noun", "#computer")
+        other.unload_additional("noun", "computer")
+        assert "algorithm" not in other.list_map["noun"].data
+
+    def test_word_constraints(self):
+        fab = self.fab
+        noun_list = fab.list_map["noun"]
+        for _ in range(20):
+            assert len(fab.get_word("noun", "len<=4")) <= 4
+            assert len(fab.get_word("noun", "plural:len=5")) == 5
+            assert fab.get_word("noun", "initial=z:len>2:len<5")[0] == "z"
+            assert fab.get_word("noun", "an:initial=a").startswith("an a")
+            quote = fab.get_quote("$(Adj:=1) $(noun:initial=@1:=2) $(@2:plural)")
+            adj, noun, _plural = quote.split()
+            assert adj[0].lower() == noun[0]
+            quote = fab.get_quote("$(name:first:=1) $(noun:#animal:initial=@1)")
+            assert quote[0].lower() == quote.split()[1][0]
+            assert fab.get_quote("$(noun:#animal:len=3:initial=c)") in ("cat", "cod")
+        assert fab.analyze("$(noun:#animal:len=3)").cardinality == len(
+            {w for w in noun_list.tag_map["animal"] if len(w) == 3}
+        )
+        # Constraints are cached per word list generation
+        template = fab.compile("$(noun:len<=2:initial=q)")
+        with pytest.raises(fabulist.fabulist.ApplyTemplateError):
+            template.render()
+        noun_list.add_entry({"lemma": "qi"})
+        noun_list.update_data()
+        assert template.render() == "qi"
+
+        with pytest.raises(ValueError, match="Empty word length range"):
+            fab.get_word("noun", "len>5:len<3")
+        with pytest.raises(ValueError, match="Only one"):
+            fab.get_word("noun", "initial=a:initial=b")
+        with pytest.raises(ValueError, match="not supported"):
+            fab.get_word("name", "initial=a")
+        with pytest.raises(ValueError, match="undefined variable"):
+            fab.get_quote("$(noun:initial=@1) $(adj:=1)")
+        with pytest.raises(ValueError, match="Back-references"):
+            fab.get_quote("$(noun:=1) $(@1:len<3)")
+
+    def test_rhymes(self):
+        fab = self.fab
+        get_rhyme = fabulist.fabulist.get_rhyme
+        assert get_rhyme("cat") == "at"
+        assert get_rhyme("Table") == "able"
+        assert get_rhyme("station") == "ion"
+        assert get_rhyme("cakes") == "akes"
+        assert get_rhyme("hmm") == "hmm"
+
+        noun_list = fab.list_map["noun"]
+        noun_list.load()
+        assert sorted(noun_list._get_rhyme_ids("lemma", "ation")) == [
+            idx for idx, w in enumerate(noun_list.key_list) if w.endswith("ation")
+        ]
+        # Rhymes combined with other filters only test the matching entries
+        tags = fabulist.fabulist.parse_tag_query("animal")
+        for ending, initial in (("at", None), ("er", None), ("e", "c"), ("og", "b")):
+            expected = [
+                idx
+                for idx in noun_list._filter_ids(tags, initial=initial)
+                if noun_list.key_list[idx].endswith(ending)
+            ]
+            res = noun_list._filter_ids(tags, initial=initial, rhyme=ending)
+            assert res == expected
+        for _ in range(20):
+            assert fab.get_word("noun", "rhyme=ation").endswith("ation")
+            quote = fab.get_quote("$(noun:#animal:=1) $(noun:rhyme=@1)")
+            first, second = quote.split()
+            assert first != second
+            assert second.endswith(get_rhyme(first))
+            quote = fab.get_quote("$(name:last:=1) $(noun:rhyme=@1)")
+            assert quote.split()[1].endswith(get_rhyme(quote.split()[0]))
+            ctx = {}
+            first = fab.get_word("noun", "rhyme=at:len=3:=1", context=ctx)
+            second = fab.get_word("noun", "rhyme=@1:initial=b", context=ctx)
+            assert second != first and second.endswith("at")
+        # Words do not rhyme with themselves
+        noun_list.add_entry({"lemma": "blorf"})
+        noun_list.update_data()
+        template = fab.compile("$(noun:rhyme=orf:=1) $(noun:rhyme=@1)")
+        with pytest.raises(fabulist.fabulist.ApplyTemplateError):
+            template.render()
+        ctx = {}
+        assert fab.get_word("noun", "rhyme=orf:=1", context=ctx) == "blorf"
+        with pytest.raises(fabulist.fabulist.ApplyTemplateError, match="no other"):
+            fab.get_word("noun", "rhyme=@1", context=ctx)
+        noun_list.add_entry({"lemma": "smorf"})
+        noun_list.update_data()
+        assert sorted(template.render().split()) == ["blorf", "smorf"]
+        for _ in range(10):
+            assert fab.get_word("Noun", "rhyme=@1", context=ctx) == "Smorf"
+        assert fab.analyze(template).cardinality == 2
+
+        # Rhymes use the rendered word forms
+        noun_list.add_entry({"lemma": "blorfa", "plural": "blorfaix"})
+        noun_list.add_entry({"lemma": "smorfa", "plural": "smorfaix"})
+        noun_list.update_data()
+        template = "$(noun:rhyme=aix:plural:=1) $(noun:plural:rhyme=@1)"
+        res = set(fab.generate_quotes(template, count=20))
+        assert res == {"blorfaix smorfaix", "smorfaix blorfaix"}
+        assert fab.analyze(template).cardinality == 2
+        ctx = {}
+        fab.get_word("noun", "rhyme=aix:plural:=1", context=ctx)
+        assert fab.get_word("noun", "plural:rhyme=@1", context=ctx).endswith("aix")
+
+    def test_snapshot(self, monkeypatch):
+        from fabulist.cli import run
+
+        with tempfile.TemporaryDirectory() as folder:
+            fab = fabulist.Fabulist(snapshot_dir=folder)
+            fab.load()
+            fab.get_lorem_words(3, dialect="pulp")
+            noun_list = fab.list_map["noun"]
+            path = fabulist.snapshot.get_snapshot_path(
+                folder, noun_list.path, "NounList"
+            )
+            assert os.path.isfile(path)
+
+            # Snapshots are used instead of parsing, if they are up-to-date
+            def _fail(*args):
+                raise AssertionError("CSV file was parsed")
+
+            monkeypatch.setattr(fabulist.fabulist._WordList, "_iter_file", _fail)
+            monkeypatch.setattr(fabulist.lorem_ipsum.LoremDialect, "_parse", _fail)
+            fab2 = fabulist.Fabulist(snapshot_dir=folder)
+            fab2.load()
+            noun_list2 = fab2.list_map["noun"]
+            assert noun_list2.key_list == noun_list.key_list
+            assert noun_list2.data["alpaca"] == noun_list.data["alpaca"]
+            assert fab2.get_word("noun", "#animal") in noun_list.key_list
+            assert len(fab2.get_lorem_words(3, dialect="pulp")) == 3
+            assert fab2.get_name()
+            monkeypatch.undo()
+
+            # Stale snapshots are re-written
+            list_path = os.path.join(folder, "noun_list.txt")
+            with open(list_path, "w") as f:
+                f.write("cat,,animal\n")
+            word_list = fabulist.fabulist.NounList(list_path)
+            word_list.snapshot_dir = folder
+            word_list.load()
+            with open(list_path, "a") as f:
+                f.write("dog,,animal\n")
+            word_list = fabulist.fabulist.NounList(list_path)
+            word_list.snapshot_dir = folder
+            word_list.load()
+            assert word_list.key_list == ["cat", "dog"]
+
+            assert run(["snapshot", "--folder", folder]) == 0
+
+    def test_store(self):
+        from fabulist.cli import run
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "words.store")
+            assert run(["store", path]) == 0
+            fab = fabulist.Fabulist(engine=self.fab.engine, store_path=path)
+            ref = self.fab
+            ref.load()
+            for word_type in ("adj", "adv", "noun", "verb"):
+                word_list = fab.list_map[word_type]
+                ref_list = ref.list_map[word_type]
+                assert isinstance(word_list, fabulist.store.MmapWordList)
+                assert list(word_list.key_list) == ref_list.key_list
+                assert dict(word_list.data) == dict(ref_list.data)
+                assert word_list.tag_map == ref_list.tag_map
+            noun_list = fab.list_map["noun"]
+            assert (
+                noun_list.key_index["alpaca"]
+                == ref.list_map["noun"].key_index["alpaca"]
+            )
+            assert "no-such-noun" not in noun_list.data
+            with pytest.raises(TypeError, match="read-only"):
+                noun_list.add_entry({"lemma": "unicorn"})
+
+            animals = ref.list_map["noun"].tag_map["animal"]
+            for _ in range(20):
+                assert fab.get_word("noun", "#animal") in animals
+                assert fab.get_word("noun", "an").startswith(("a ", "an "))
+            macro = fabulist.fabulist.Macro("noun", "an", noun_list)
+            formatter = noun_list.get_formatter(macro)
+            assert formatter(noun_list.key_index["hour"]) == "an hour"
+            assert formatter(noun_list.key_index["user"]) == "a user"
+            assert fab.get_quote("$(Noun:an) $(verb:s)")[0].isupper()
+            # Form tables are the same as for in-memory lists
+            for key in (("plural", True, True), ("lemma", False, False)):
+                ref_table = ref.list_map["noun"].get_form_table(*key)
+                assert noun_list.get_form_table(*key) == ref_table
+                overlay = fab.derive().list_map["noun"]
+                assert overlay.get_form_table(*key) == ref_table
+            assert fab.get_name("mr:middle")
+            assert len(fab.get_lorem_words(3, dialect="pulp")) == 3
+            assert fab.get_lorem_paragraph(2, dialect="pulp", keep_first=True)
+            # The store cannot be used as source for another store
+            with pytest.raises(ValueError):
+                fabulist.store.build_store(fab, os.path.join(folder, "x.store"))
+
+    def test_sqlite_list(self):
+        from fabulist.importer import import_file
+        from fabulist.sqlite_list import SqliteWordList
+
+        fab = self.fab
+        fab.load()
+        ref_list = fab.list_map["noun"]
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "nouns.db")
+            with pytest.raises(ValueError, match="Invalid word type"):
+                SqliteWordList(path)
+            word_list = SqliteWordList(path, word_type="noun")
+            result = word_list.add_entries(
+                ref_list.get_entry(idx) for idx in range(len(ref_list.key_list))
+            )
+            assert result.added == len(ref_list.key_list)
+            word_list.close()
+            with pytest.raises(ValueError, match="not 'verb'"):
+                SqliteWordList(path, word_type="verb")
+
+            # Re-open the file and use it instead of the bundled list
+            word_list = SqliteWordList(path, cache_size=100)
+            fab.list_map["noun"] = word_list
+            assert list(word_list.key_list) == ref_list.key_list
+            assert dict(word_list.data) == dict(ref_list.data)
+            assert word_list.tag_map == ref_list.tag_map
+            assert word_list.get_column("plural") == ref_list.get_column("plural")
+            animals = ref_list.tag_map["animal"]
+            assert fab.analyze("$(noun:#animal)").cardinality == len(animals)
+            for _ in range(20):
+                assert fab.get_word("noun", "#animal") in animals
+                assert fab.get_word("noun", "#!animal") not in animals
+                assert fab.get_word("noun", "an:plural").startswith(("a ", "an "))
+                word = fab.get_word("noun", "len<=4:initial=b")
+                assert len(word) <= 4 and word[0] == "b"
+                first, second = fab.get_quote("$(noun:=1) $(noun:rhyme=@1)").split()
+                assert first != second
+                assert second.endswith(fabulist.fabulist.get_rhyme(first))
+            macro = fabulist.fabulist.Macro("noun", "an", word_list)
+            formatter = word_list.get_formatter(macro)
+            assert formatter(word_list.key_index["hour"]) == "an hour"
+            assert (
+                word_list.get_form_table("plural", True, True)[
+                    word_list.key_index["apple"]
+                ]
+                == "An apples"
+            )
+            assert word_list.row_cache_info().currsize <= 100
+            with pytest.raises(ValueError, match="no entries for tag"):
+                fab.get_word("noun", "#no-such-tag")
+
+            # Filters match the in-memory list and are driven by indexes
+            parse = fabulist.fabulist.parse_tag_query
+            for tags, kwargs in (
+                ("!animal", {"word_forms": {"plural"}}),
+                ("animal", {"word_form": "plural", "length": (3, 6)}),
+                ("", {"word_form": "plural", "initial": "b", "rhyme": "s"}),
+                ("!animal", {"length": (8, None), "rhyme": "tion"}),
+            ):
+                query = parse(tags) if tags else ()
+                assert list(word_list._filter_ids(query, **kwargs)) == list(
+                    ref_list._filter_ids(query, **kwargs)
+                )
+            statements = []
+            word_list._conn.set_trace_callback(statements.append)
+            word_list._filter_ids(parse("animal"), initial="b")
+            word_list._conn.set_trace_callback(None)
+            plan = word_list._conn.execute(
+                "EXPLAIN QUERY PLAN " + statements[-1]
+            ).fetchall()
+            assert not any(row[-1].startswith("SCAN") for row in plan), plan
+
+            # Add, replace, and import entries
+            word_list.add_entry({"lemma": "unicorn", "plural": False, "tags": {"myth"}})
+            word_list.add_entry({"lemma": "apple", "tags": {"fruit"}})
+            word_list.update_data()
+            assert fab.get_word("noun", "#myth") == "unicorn"
+            assert fab.get_word("noun", "#myth:initial=u:len=7") == "unicorn"
+            assert fab.get_word("noun", "#fruit:plural") == "apples"
+            with pytest.raises(fabulist.fabulist.ApplyTemplateError):
+                fab.get_word("noun", "#myth:plural")
+            csv_path = os.path.join(folder, "extra.csv")
+            with open(csv_path, "w") as f:
+                f.write("lemma,plural\nkraken,krakens\nunicorn,-\n")
+            result = import_file(word_list, csv_path, tags={"extra"})
+            assert (result.added, result.updated) == (1, 1)
+            assert word_list.data["unicorn"]["tags"] == {"extra"}
+            ids = word_list._filter_ids(parse("extra&!myth|fruit"))
+            assert [word_list.key_list[i] for i in ids] == [
+                "apple",
+                "unicorn",
+                "kraken",
+            ]
+            assert not word_list._filter_ids(parse("extra&fruit"))
+            more_path = os.path.join(folder, "more.csv")
+            with open(more_path, "w") as f:
+                f.write("griffin,griffins\n")
+            assert word_list.load_additional(more_path) == 1
+            assert fab.get_word("noun", "#more:plural") == "griffins"
+            assert word_list.unload_additional("more") == 1
+            assert "griffin" not in word_list.data
+
+            # Overlays keep the database unchanged
+            tenant = fab.derive()
+            tenant.list_map["noun"].remove_entry("kraken")
+            tenant.list_map["noun"].add_entry({"lemma": "zorb", "tags": {"extra"}})
+            tenant.list_map["noun"].update_data()
+            for _ in range(10):
+                assert tenant.get_word("noun", "#extra") in ("unicorn", "zorb")
+            assert "zorb" not in word_list.data
+            word_list.close()
+
+            # Reading never changes the schema, e.g. of files that were
+            # created by an older version, and handles share the indexes
+            conn = sqlite3.connect(path)
+            conn.execute("DROP TABLE words_lemma")
+            conn.execute("DROP TABLE words_plural")
+            conn.commit()
+            conn.close()
+            first = SqliteWordList(path)
+            second = SqliteWordList(path)
+            unicorn = [first.key_index["unicorn"]]
+            for word_list in (first, second):
+                assert word_list._indexed_forms == []
+                ids = word_list._filter_ids((), length=(7, 7), rhyme="corn")
+                assert list(ids) == unicorn
+            assert first._read_indexed_forms() == []
+            first.create_indexes()
+            second.create_indexes()
+            assert second._indexed_forms == ["lemma", "plural"]
+            second.add_entry({"lemma": "popcorn"})
+            second.update_data()
+            ids = first._filter_ids((), rhyme="corn")
+            assert [first.key_list[i] for i in ids] == ["unicorn", "popcorn"]
+            assert first._indexed_forms == ["lemma", "plural"]
+            first.close()
+            second.close()
+
+        verb_list = SqliteWordList(":memory:", word_type="verb")
+        verb_list.add_entries([{"lemma": "walk", "past": "walked"}])
+        assert verb_list.get_entry(0)["pp"] == "walked"
+        assert verb_list.get_entry(0)["ing"] == "walking"
+
+    def test_watcher(self):
+        from fabulist.watcher import WordListWatcher
+
+        def write(path, text):
+            with open(path, "w") as f:
+                f.write(text)
+            # Make sure that the change is detected on coarse file systems
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+        fab = self.fab
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "nouns.txt")
+            write(path, "cat,,animal\n")
+            with pytest.raises(ValueError, match="Expected a 'noun' list"):
+                fab.replace_list("noun", fabulist.fabulist.AdjList(path))
+            fab.replace_list("noun", fabulist.fabulist.NounList(path))
+            fab.add_rule("pet", "my $(noun:#animal)")
+            template = fab.compile("$(noun:plural)")
+            assert fab.get_quote("$(rule:pet)") == "my cat"
+
+            events = []
+            watcher = WordListWatcher(fab, callback=events.append)
+            assert watcher.check() == []
+            write(path, "dog,,animal\n")
+            (event,) = watcher.check()
+            assert events == [event]
+            assert (event.word_type, event.paths, event.error) == (
+                "noun",
+                (path,),
+                None,
+            )
+            assert fab.list_map["noun"] is event.word_list
+            assert fab.get_quote("$(rule:pet)") == "my dog"
+            assert fab.get_word("noun", "plural") == "dogs"
+            # Templates that were compiled before keep the previous list
+            assert template.render() == "cats"
+
+            # Invalid files are reported, and the previous list is kept
+            write(path, "dog,dogs,animal,-,too-many\n")
+            (event,) = watcher.check()
+            assert event.error and event.word_list is None
+            assert watcher.error_count == 1
+            assert fab.get_word("noun") == "dog"
+
+            write(path, "emu,,animal\n")
+            watcher.interval = 0.01
+            with watcher:
+                for _ in range(200):
+                    if watcher.reload_count == 2:
+                        break
+                    time.sleep(0.01)
+            assert watcher.reload_count == 2
+            assert fab.get_quote("$(rule:pet)") == "my emu"
+
+            # Name lists reload their own first and last name files
+            name_list = fab.list_map["name"]
+            last_path = os.path.join(folder, "lastnames.txt")
+            write(last_path, "Zarkov\n")
+            name_list.lastname_list = fabulist.fabulist.LastnameList(last_path)
+            name_list.lastname_list.load()
+            pirates_path = os.path.join(folder, "pirates.txt")
+            write(pirates_path, "Blackbeard,m\n")
+            name_list.firstname_list.load_additional(pirates_path)
+            assert fab.get_word("name", "last") == "Zarkov"
+            watcher = WordListWatcher(fab)
+            assert watcher.check() == []
+            write(last_path, "Zarkov\nYlvisaker\n")
+            (event,) = watcher.check()
+            assert (event.word_type, event.paths) == ("name", (last_path,))
+            new_list = fab.list_map["name"]
+            assert new_list is event.word_list and new_list is not name_list
+            assert new_list.lastname_list.key_list == ["Zarkov", "Ylvisaker"]
+            assert new_list.firstname_list.source_paths == {"pirates": pirates_path}
+            assert "Blackbeard" in new_list.firstname_list.key_list_male
+            assert fab.get_word("name", "last") in ("Zarkov", "Ylvisaker")
+
+    def test_memory_budget(self):
+        # Only the word lists and dialect of the current call fit
+        fab = fabulist.Fabulist(engine=self.fab.engine, memory_budget=1)
+        for _ in range(3):
+            assert fab.get_word("verb")
+            assert len(fab.get_quote("$(adj) $(noun:plural)").split()) == 2
+            assert len(fab.get_lorem_words(2, dialect="pulp")) == 2
+        info = fab.budget.info()
+        assert info.evictions >= 6 and info.reloads >= 4
+        assert info.loaded == 1 and info.size > info.max_size
+        assert not fab.list_map["adj"].is_loaded()
+        assert not fab.lorem.dialect_map["ipsum"].unload()
+
+        # Compiled templates re-bind after a list was unloaded
+        noun_list = fab.list_map["noun"]
+        template = fab.compile("$(noun:#animal)")
+        assert template.render()
+        assert noun_list.unload() and not noun_list.is_loaded()
+        assert template.render() in noun_list.tag_map["animal"]
+
+        # Modified lists are kept
+        noun_list.add_entry({"lemma": "zorb"})
+        noun_list.update_data()
+        assert not noun_list.unload()
+        fab.get_word("verb")
+        fab.get_word("adj")
+        assert "zorb" in noun_list.data
+
+        # Lists that are replaced (e.g. by the watcher) are released
+        from fabulist.watcher import WordListWatcher
+
+        fab = fabulist.Fabulist(engine=self.fab.engine, memory_budget=10**9)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "nouns.txt")
+            with open(path, "w") as f:
+                f.write("cat,,animal\n")
+            noun_list = fabulist.fabulist.NounList(path)
+            noun_list.load()
+            noun_list.add_entry({"lemma": "zorb"})  # Modified: cannot unload
+            noun_list.update_data()
+            fab.replace_list("noun", noun_list)
+            assert fab.get_word("noun", "#animal") == "cat"
+            watcher = WordListWatcher(fab)
+            watcher.check()
+            for name in ("dog", "emu", "gnu"):
+                with open(path, "w") as f:
+                    f.write(f"{name},,animal\n")
+                st = os.stat(path)
+                os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+                (event,) = watcher.check()
+                assert fab.get_word("noun") == name
+            old_list = weakref.ref(noun_list)
+            del noun_list
+            gc.collect()
+            assert old_list() is None
+            info = fab.budget.info()
+            assert info.loaded == 1 and fab.list_map["noun"] in fab.budget._loaded
+
+    def test_register_word_type(self, monkeypatch):
+        import fabulist.store
+        from fabulist.fabulist import get_word_type_plugins
+
+        fab = fabulist.Fabulist(engine=self.fab.engine, plugins=False)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "products.txt")
+            # Registering does not read the file
+            product_list = fab.register_word_type(
+                "product",
+                path,
+                ("lemma", "plural", "tags", "an"),
+                computable_modifiers={"plural"},
+                extra_modifiers={"an"},
+            )
+            assert not product_list.is_loaded()
+            with open(path, "w") as f:
+                f.write(
+                    "# Products\nwidget,,tool\nhourglass,hourglasses,tool|time,an\n"
+                )
+                f.write("jeans,-\nunicorn\n")
+            for _ in range(10):
+                assert fab.get_word("product", "#tool") in ("widget", "hourglass")
+            assert fab.get_word("product", "#time:an") == "an hourglass"
+            assert fab.get_word("product", "len=5") == "jeans"
+            assert fab.get_quote("$(Product:initial=w:=1) $(@1:plural)") == (
+                "Widget widgets"
+            )
+            with pytest.raises(ValueError, match="Unsupported modifier"):
+                fab.get_word("product", "past")
+            assert fab.analyze("$(product:plural)").cardinality == 3
+            tenant = fab.derive()
+            tenant.list_map["product"].add_entry({"lemma": "gadget", "tags": {"x"}})
+            tenant.list_map["product"].update_data()
+            assert tenant.get_word("product", "#x") == "gadget"
+
+            # Custom types are kept in stores
+            store_path = os.path.join(folder, "words.store")
+            fabulist.store.build_store(fab, store_path)
+            fab2 = fabulist.Fabulist(store_path=store_path, plugins=False)
+            fab2.register_word_type("product", path, ("lemma", "plural", "tags", "an"))
+            assert isinstance(fab2.list_map["product"], fabulist.store.MmapWordList)
+            assert fab2.get_word("product", "#time:plural") == "hourglasses"
+
+            for args, match in (
+                (("noun", path), "already defined"),
+                (("num", path), "already defined"),
+                (("Color", path), "Invalid word type name"),
+                (("color", path, ("tags", "lemma")), "must be 'lemma'"),
+                (("color", path, ("lemma", "lemma")), "Invalid column names"),
+            ):
+                with pytest.raises(ValueError, match=match):
+                    fab.register_word_type(*args)
+            with pytest.raises(ValueError, match="Computable modifiers"):
+                fab.register_word_type("color", path, computable_modifiers={"hue"})
+
+            # Word type packages are discovered by entry points
+            dist_info = os.path.join(folder, "fabulist_colors-1.0.dist-info")
+            os.mkdir(dist_info)
+            with open(os.path.join(dist_info, "METADATA"), "w") as f:
+                f.write("Metadata-Version: 2.1\nName: fabulist-colors\nVersion: 1.0\n")
+            with open(os.path.join(dist_info, "entry_points.txt"), "w") as f:
+                f.write("[fabulist.word_types]\ncolor = fabulist_colors:register\n")
+            with open(os.path.join(folder, "fabulist_colors.py"), "w") as f:
+                f.write(
+                    "import os\n"
+                    "def register(fab):\n"
+                    "    path = os.path.join(os.path.dirname(__file__), 'colors.txt')\n"
+                    "    fab.register_word_type('color', path)\n"
+                )
+            with open(os.path.join(folder, "colors.txt"), "w") as f:
+                f.write("red,warm\nblue,cold\n")
+            monkeypatch.syspath_prepend(folder)
+            get_word_type_plugins.cache_clear()
+            try:
+                fab3 = fabulist.Fabulist(engine=self.fab.engine)
+                assert not fab3.list_map["color"].is_loaded()
+                assert fab3.get_quote("$(Color:#warm) $(noun)").startswith("Red ")
+            finally:
+                get_word_type_plugins.cache_clear()
+                sys.modules.pop("fabulist_colors", None)
+
     def test_to_string(self):
         s = "{}".format(self.fab.list_map["adj"])
         assert s.startswith("AdjList(len=")
@@ -182,6 +1324,24 @@ class TestBasic:
         assert nouns["child"]["plural"] == "children"
 
 
+class TestCodegen(TestBasic):
+    """Run the basic test cases with the code-generation engine."""
+
+    def setup_method(self):
+        self.fab = fabulist.Fabulist(engine="codegen")
+        self.temp_path = None
+
+    def test_engine(self):
+        with pytest.raises(ValueError):
+            fabulist.Fabulist(engine="unknown_engine")
+
+        compiled = self.fab.compile("$(Noun:#animal:=1) and $(@1:plural)")
+        assert compiled.source is None
+        for _ in range(100):
+            assert " and " in compiled.render()
+        assert compiled.source.startswith("def render(variables):")
+
+
 class TestLorem:
     """Test LoremGenerator and LoremDialect."""
 